@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import time
+
+from benchmarks.stand_ins import start_stand_in, create_ctan_app
+
+
+async def run(packages: int) -> None:
+    from src.schemas.package_data import SpecFileDataSchema
+    from src.services.ctan import CtanVersionProvider
+    from src.services.network_requests import RequestsHandler
+    from src.services.parsers import parse_package_data
+
+    versions: dict[str, str] = {f'pkg{i}': f'1.{i} 2024-01-01' if i % 3 else '2024-01-01' for i in range(packages)}
+    runner, base_url = await start_stand_in(create_ctan_app(versions))
+    requests_handler: RequestsHandler = RequestsHandler()
+    specs: list[SpecFileDataSchema] = [SpecFileDataSchema(name=f'texlive-{name}', version='0') for name in versions]
+    try:
+        start_time: float = time.perf_counter()
+        scraped: list[SpecFileDataSchema] = await asyncio.gather(*[parse_package_data(requests_handler, spec, base_url) for spec in specs])
+        scraping_time: float = time.perf_counter() - start_time
+
+        provider: CtanVersionProvider = CtanVersionProvider(requests_handler, base_url)
+        start_time = time.perf_counter()
+        fetched: dict[str, str | None] = await provider.get_versions(list(versions))
+        json_time: float = time.perf_counter() - start_time
+    finally:
+        await requests_handler.close_session()
+        await runner.cleanup()
+
+    assert [spec.version for spec in scraped] == [fetched[name] for name in versions], "Providers disagree"
+    print(f'html scraping: {packages} packages in {scraping_time:.3f}s')
+    print(f'    json api: {packages} packages in {json_time:.3f}s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare ctan.org page scraping and the ctan json api against a local stand-in")
+    parser.add_argument('--packages', type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(run(args.packages))
+
+
+if __name__ == '__main__':
+    main()
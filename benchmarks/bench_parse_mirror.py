@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from typing import AsyncIterator
+
+from benchmarks.synthetic import generate_listing
+from src.constants import MIRROR_LISTING_PARSE_WORKERS
+
+IMPLEMENTATIONS: list[str] = ["soup", "streaming", "columnar", "parallel"]
+
+
+def run_soup(listing_path: Path, workers: int) -> int:
+    # Baseline: parse_mirror before the streaming tokenizer and the mirror index
+    from bs4 import BeautifulSoup
+    from dateutil.parser import parse
+    from src.constants import PackageTypes, ARCHITECTURES_SPECIFIC_PREFIXES
+    from src.schemas.package_data import AvailableSourcesSchema, FileMetadataSchema
+
+    soup: BeautifulSoup = BeautifulSoup(listing_path.read_text(), 'html.parser')
+    packages_data: list = list(soup.find('pre').children)[2:]
+    sources: AvailableSourcesSchema = AvailableSourcesSchema()
+    for i in range(0, len(packages_data), 2):
+        file_name: str = packages_data[i].text
+        source_name_split: list[str] = file_name.split('.')
+        upload_date_str, package_size_str = packages_data[i + 1].text.rsplit(maxsplit=1)
+        package_type: PackageTypes = {'doc': PackageTypes.DOC, 'source': PackageTypes.SOURCE}.get(source_name_split[1].lower(), PackageTypes.MAIN)
+        file_data: FileMetadataSchema = FileMetadataSchema(
+            type=package_type,
+            upload_time=parse(upload_date_str),
+            size=round(int(package_size_str) / 1024, 2)
+        )
+        if source_name_split[-3][0] == 'r' or any([tag in file_name for tag in ARCHITECTURES_SPECIFIC_PREFIXES]):
+            file_data.version = source_name_split[-3]
+            sources.files[source_name_split[0]].version_specific.append(file_data)
+        else:
+            sources.files[source_name_split[0]].general.append(file_data)
+    return len(packages_data) // 2
+
+
+def run_streaming(listing_path: Path, workers: int) -> int:
+    # Baseline: streaming tokenizer keeping a tuple per file and parsing dates with dateutil
+    from dateutil.parser import parse
+    from src.constants import MIRROR_LISTING_CHUNK_SIZE
+    from src.services.mirror_index import to_timestamp
+    from src.services.parsers import MirrorListingTokenizer, parse_listing_entry
+
+    tokenizer: MirrorListingTokenizer = MirrorListingTokenizer()
+    rows: list = []
+    with open(listing_path, 'rb') as f:
+        while chunk := f.read(MIRROR_LISTING_CHUNK_SIZE):
+            for entry in tokenizer.feed(chunk):
+                rows.append(parse_listing_entry(entry)._replace(upload_time=to_timestamp(parse(entry.upload_date))))
+    for entry in tokenizer.close():
+        rows.append(parse_listing_entry(entry)._replace(upload_time=to_timestamp(parse(entry.upload_date))))
+    return len(rows)
+
+
+def run_columnar(listing_path: Path, workers: int) -> int:
+    # Baseline: single loop over the whole listing on the event loop
+    from src.constants import MIRROR_LISTING_CHUNK_SIZE
+    from src.services.mirror_index import MirrorIndexColumns
+    from src.services.parsers import MirrorListingTokenizer, parse_listing_entry
+
+    tokenizer: MirrorListingTokenizer = MirrorListingTokenizer()
+    rows: MirrorIndexColumns = MirrorIndexColumns()
+    with open(listing_path, 'rb') as f:
+        while chunk := f.read(MIRROR_LISTING_CHUNK_SIZE):
+            for entry in tokenizer.feed(chunk):
+                rows.append(parse_listing_entry(entry))
+    for entry in tokenizer.close():
+        rows.append(parse_listing_entry(entry))
+    return len(rows)
+
+
+def run_parallel(listing_path: Path, workers: int) -> int:
+    # Current implementation of fetch_mirror_listing: blocks of whole lines parsed in a process pool
+    from src.constants import MIRROR_LISTING_CHUNK_SIZE
+    from src.services.parsers import MirrorListingChunker, parse_listing_chunks
+
+    async def chunks() -> AsyncIterator[bytes]:
+        chunker: MirrorListingChunker = MirrorListingChunker()
+        with open(listing_path, 'rb') as f:
+            while data := f.read(MIRROR_LISTING_CHUNK_SIZE):
+                for chunk in chunker.feed(data):
+                    yield chunk
+        for chunk in chunker.close():
+            yield chunk
+    return len(asyncio.run(parse_listing_chunks(chunks(), workers)))
+
+
+IMPLEMENTATION_RUNNERS: dict = {"soup": run_soup, "streaming": run_streaming, "columnar": run_columnar, "parallel": run_parallel}
+
+
+def measure(implementation: str, listing_path: Path, workers: int) -> dict:
+    # Every implementation runs in a fresh interpreter so that peak RSS is not shared between runs
+    output: str = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.bench_parse_mirror', '--worker', implementation, '--listing', str(listing_path), '--workers', str(workers)]
+    ).decode()
+    return json.loads(output.splitlines()[-1])
+
+
+def worker(implementation: str, listing_path: Path, workers: int) -> None:
+    # Import cost is excluded from timing and from the RSS growth while parsing
+    import src.services.parsers  # noqa: F401
+    import bs4  # noqa: F401
+    import dateutil.parser  # noqa: F401
+    base_rss_kb: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start: float = time.perf_counter()
+    entries: int = IMPLEMENTATION_RUNNERS[implementation](listing_path, workers)
+    elapsed: float = time.perf_counter() - start
+    peak_rss_kb: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "implementation": implementation,
+        "workers": workers if implementation == "parallel" else 1,
+        "entries": entries,
+        "seconds": round(elapsed, 4),
+        "peak_rss_kb": peak_rss_kb,
+        "parse_rss_kb": peak_rss_kb - base_rss_kb
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare BeautifulSoup, streaming, columnar and process pool parsing of the tlnet archive listing")
+    parser.add_argument('--listing', type=Path, help="Recorded listing (saved html of MIRROR_BASE_URL). Synthetic listing is used if omitted")
+    parser.add_argument('--entries', type=int, default=35000, help="Number of entries in the synthetic listing (350000 is 10x the current CTAN size)")
+    parser.add_argument('--workers', type=int, default=MIRROR_LISTING_PARSE_WORKERS, help="Process pool size of the parallel implementation")
+    parser.add_argument('--implementations', nargs='+', choices=IMPLEMENTATIONS, default=IMPLEMENTATIONS)
+    parser.add_argument('--worker', choices=IMPLEMENTATIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.listing, args.workers)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        listing_path: Path = args.listing
+        if listing_path is None:
+            listing_path = Path(tmp_dir, 'listing.html')
+            listing_path.write_bytes(generate_listing(args.entries))
+        results: list[dict] = [measure(implementation, listing_path, args.workers) for implementation in args.implementations]
+    for result in results:
+        print(
+            f'{result["implementation"]:>10} ({result["workers"]} workers): {result["entries"]} entries in {result["seconds"]:.3f}s, '
+            f'peak RSS {result["peak_rss_kb"] / 1024:.1f} MiB (+{result["parse_rss_kb"] / 1024:.1f} MiB while parsing)'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+from benchmarks.stand_ins import start_stand_in, create_ctan_app, create_mirror_app, create_filestore_app, latency_middleware
+from benchmarks.synthetic import generate_listing, package_tarballs, create_package_remote
+
+PACKAGE: str = "benchpkg"
+OLD_VERSION: str = "1.0"
+NEW_VERSION: str = "1.1 2024-01-01"
+
+
+async def run_stages(repo_url: str) -> dict[str, float]:
+    # Every stage of UPDATE_PACKAGE timed on its own, cold stages run against an empty work directory
+    from src.actions.actions import prepare_repo, get_package_data, create_requests_handler
+    from src.schemas.package_data import DownloadedFileSchema
+    from src.schemas.repo import RepoDataSchema
+    from src.schemas.tarball import TarballMember
+    from src.schemas.user_data import LoginDataSchema
+    from src.services.ctan import CtanVersionProvider
+    from src.services.directory_structure import verify_file_presence, list_tarballs
+    from src.services.documents import TextDocument
+    from src.services.file_parsers import update_spec_file, update_hash_file
+    from src.services.files_verification import verify_package_files
+    from src.services.git import commit_and_push
+    from src.services.mirror_index import MirrorIndex
+    from src.services.network_requests import RequestsHandler
+    from src.services.parsers import parse_mirror
+    from src.services.tarball_index import TarballIndex, index_tarballs
+
+    timings: dict[str, float] = {}
+
+    async def timed(stage: str, operation):
+        start_time: float = time.perf_counter()
+        result = operation()
+        if asyncio.iscoroutine(result):
+            result = await result
+        timings[stage] = round(time.perf_counter() - start_time, 4)
+        return result
+
+    requests_handler: RequestsHandler = create_requests_handler()
+    version_provider: CtanVersionProvider = CtanVersionProvider(requests_handler)
+    credentials: LoginDataSchema = LoginDataSchema(email='bench@localhost', password='bench')
+
+    mirror_index: MirrorIndex = await timed('parse_mirror', lambda: parse_mirror(requests_handler, force_update=True))
+    await timed('parse_mirror_revalidate', lambda: parse_mirror(requests_handler, force_update=True, mirror_index=mirror_index))
+    repo_data: RepoDataSchema = await timed('git_clone', lambda: prepare_repo(repo_url))
+    await timed('git_reuse', lambda: prepare_repo(repo_url))
+
+    spec_file_path, hash_file_path = verify_file_presence(repo_data.path)
+    spec_document: TextDocument = TextDocument.load(spec_file_path)
+    hash_document: TextDocument = TextDocument.load(hash_file_path)
+    old_data, new_data = await timed('ctan', lambda: get_package_data(version_provider, spec_document))
+    await timed('update_spec_file', lambda: update_spec_file(spec_document, old_data, new_data))
+
+    sources = mirror_index.get_repo_related(repo_data.name)
+    files: list[DownloadedFileSchema] = await timed('download', lambda: requests_handler.download_files(new_data.short_name, repo_data.data_path, sources))
+    for file_data in files:
+        file_data.path.unlink()
+    await timed('download_cached', lambda: requests_handler.download_files(new_data.short_name, repo_data.data_path, sources))
+    file_hashes = await timed('upload', lambda: requests_handler.upload_to_filestore(credentials, files))
+    await timed('upload_known', lambda: requests_handler.upload_to_filestore(credentials, files))
+
+    def save_documents() -> None:
+        update_hash_file(hash_document, file_hashes)
+        spec_document.save()
+        hash_document.save()
+    await timed('update_hash_file', save_documents)
+    tarballs: dict[str, list[TarballMember]] = await timed('list_tarballs', lambda: list_tarballs(repo_data.data_path))
+    # The first call lists and stores the tarballs, the second one reads their members from the tarball index
+    tarball_index: TarballIndex = TarballIndex()
+    await timed('index_tarballs', lambda: index_tarballs(tarball_index, new_data.short_name, repo_data.data_path, files))
+    indexed_tarballs, _ = await timed('index_tarballs_indexed', lambda: index_tarballs(tarball_index, new_data.short_name, repo_data.data_path, files))
+    assert indexed_tarballs == tarballs, "Tarball index returned different members"
+    tarball_index.close()
+    report = await timed('verify_files', lambda: verify_package_files(old_data.included_files, tarballs))
+    assert report.is_ok, f"Unexpected file structure report: {report}"
+    await timed('commit_and_push', lambda: commit_and_push(repo_data.repo, [spec_file_path, hash_file_path], old_data, new_data))
+    mirror_index.close()
+    return timings
+
+
+async def run_update(repo_url: str) -> dict[str, float]:
+    # The whole UPDATE_PACKAGE task as started from the menu, the push confirmation is read from stdin
+    from src.actions.TaskHandler import TaskHandler
+    from src.constants import TaskType
+    from src.schemas.tasks import UpdatePackageTaskDataSchema
+    from src.schemas.user_data import UserDataSchema, LoginDataSchema
+
+    task_handler: TaskHandler = TaskHandler(UserDataSchema(abf_credentials=LoginDataSchema(email='bench@localhost', password='bench')))
+    start_time: float = time.perf_counter()
+    await task_handler.run(TaskType.UPDATE_PACKAGE, UpdatePackageTaskDataSchema(repo_url=repo_url, delete_comments=False))
+    return {'update_package': round(time.perf_counter() - start_time, 4)}
+
+
+async def run_worker(command: list[str], env: dict[str, str], stdin: bytes = b'') -> dict[str, float]:
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as result_file:
+        result_path: Path = Path(result_file.name)
+    try:
+        start_time: float = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'benchmarks.bench_pipeline', *command, '--result', str(result_path),
+            env={**os.environ, **env}, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        )
+        output, _ = await process.communicate(stdin)
+        if process.returncode != 0 or result_path.stat().st_size == 0:
+            raise RuntimeError(f"Worker {command} failed:\n{output.decode(errors='replace')}")
+        result: dict[str, float] = json.loads(result_path.read_text())
+        result['process'] = round(time.perf_counter() - start_time, 4)
+        return result
+    finally:
+        result_path.unlink(missing_ok=True)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    bench_path: Path = Path(tempfile.mkdtemp(prefix='bench_pipeline_'))
+    try:
+        files_path: Path = bench_path / 'archive'
+        files_path.mkdir()
+        sizes: dict[str, int] = package_tarballs(PACKAGE, files_path, args.tarball_size * 1024 * 1024)
+        listing: bytes = generate_listing(args.entries, files=sizes)
+        pristine_remote: Path = create_package_remote(bench_path / 'pristine', PACKAGE, OLD_VERSION)
+        remote_path: Path = bench_path / 'remotes' / pristine_remote.name
+
+        runners: list = []
+        urls: list[str] = []
+        for app in (create_mirror_app(listing, files_path), create_ctan_app({PACKAGE: NEW_VERSION}), create_filestore_app()):
+            if args.latency_ms:
+                app.middlewares.append(latency_middleware(args.latency_ms / 1000))
+            runner, base_url = await start_stand_in(app)
+            runners.append(runner)
+            urls.append(base_url)
+        mirror_url, ctan_url, filestore_url = urls
+
+        def environment(work_dir: str) -> dict[str, str]:
+            return {
+                'ABF_UPDATER_WORK_DIR': str(bench_path / work_dir),
+                'ABF_UPDATER_MIRROR_URL': f'{mirror_url}/archive/',
+                'ABF_UPDATER_CTAN_URL': ctan_url,
+                'ABF_UPDATER_FILE_STORE_URL': filestore_url
+            }
+
+        def reset_remote() -> None:
+            # Every run pushes the version bump, so the remote is restored before the next one
+            shutil.rmtree(remote_path, ignore_errors=True)
+            shutil.copytree(pristine_remote, remote_path)
+
+        try:
+            reset_remote()
+            stages: dict[str, float] = await run_worker(['--worker', 'stages', '--repo-url', str(remote_path)], environment('stages'))
+            update_runs: list[dict[str, float]] = []
+            for _ in range(args.runs):
+                reset_remote()
+                # The first run starts with an empty work directory, the following ones reuse its caches
+                update_runs.append(await run_worker(['--worker', 'update', '--repo-url', str(remote_path)], environment('update'), b'y\n'))
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+    finally:
+        shutil.rmtree(bench_path, ignore_errors=True)
+
+    return {
+        'config': {
+            'entries': args.entries,
+            'tarball_size_mib': args.tarball_size,
+            'latency_ms': args.latency_ms,
+            'runs': args.runs
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'stages': stages,
+        'update_package': {
+            'cold': update_runs[0],
+            'warm': update_runs[1:]
+        }
+    }
+
+
+def print_results(results: dict) -> None:
+    for stage, duration in results['stages'].items():
+        print(f"{stage:<26} {duration:8.3f}s")
+    update_runs: list[dict[str, float]] = [results['update_package']['cold']] + results['update_package']['warm']
+    for i, update_run in enumerate(update_runs):
+        label: str = 'cold' if i == 0 else f'warm {i}'
+        print(f"update_package ({label}){'':<{12 - len(label)}} {update_run['update_package']:8.3f}s (process {update_run['process']:.3f}s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time the UPDATE_PACKAGE pipeline against local stand-ins of the mirror, ctan.org, ABF filestore and git remote")
+    parser.add_argument('--entries', type=int, default=35000, help="Number of synthetic entries in the mirror listing")
+    parser.add_argument('--tarball-size', type=int, default=8, help="Content size of every package tarball in MiB")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Delay added to every stand-in response")
+    parser.add_argument('--runs', type=int, default=2, help="Number of end-to-end runs, all but the first reuse caches")
+    parser.add_argument('--output', type=Path, default=Path('bench_pipeline.json'))
+    parser.add_argument('--worker', choices=['stages', 'update'], help=argparse.SUPPRESS)
+    parser.add_argument('--repo-url', help=argparse.SUPPRESS)
+    parser.add_argument('--result', type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        worker = run_stages if args.worker == 'stages' else run_update
+        args.result.write_text(json.dumps(asyncio.run(worker(args.repo_url))))
+        return
+    results: dict = asyncio.run(run(args))
+    print_results(results)
+    args.output.write_text(json.dumps(results, indent=4))
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from pathlib import Path
+
+from benchmarks.stand_ins import start_stand_in, create_abf_app, create_ctan_app, create_mirror_app, latency_middleware
+from benchmarks.synthetic import generate_listing, generate_tlpdb, listing_file_names, render_spec_file
+
+
+def synthetic_packages(packages: int, entries: int) -> dict[str, tuple[str, str]]:
+    # package => (spec version, catalogue version): every third spec is behind, every tenth package has no catalogue version
+    names: list[str] = list(dict.fromkeys(file_name.split('.')[0] for file_name in listing_file_names(entries)))[:packages]
+    return {
+        name: ("1.0" if i % 3 == 0 else f"1.{i % 7 + 1}", "" if i % 10 == 0 else f"1.{i % 7 + 1}")
+        for i, name in enumerate(names)
+    }
+
+
+async def run(args: argparse.Namespace) -> None:
+    work_path: Path = Path(tempfile.mkdtemp(prefix='bench_scan_'))
+    packages: dict[str, tuple[str, str]] = synthetic_packages(args.packages, args.entries)
+    runners: list = []
+    urls: list[str] = []
+    try:
+        for app in (
+            create_mirror_app(generate_listing(args.entries), work_path, tlpdb=generate_tlpdb({name: (i, version) for i, (name, (_, version)) in enumerate(packages.items())})),
+            create_abf_app({f"texlive-{name}": render_spec_file(name, spec_version) for name, (spec_version, _) in packages.items()}),
+            create_ctan_app({name: version or "2024-01-01" for name, (_, version) in packages.items()})
+        ):
+            if args.latency_ms:
+                app.middlewares.append(latency_middleware(args.latency_ms / 1000))
+            runner, base_url = await start_stand_in(app)
+            runners.append(runner)
+            urls.append(base_url)
+        mirror_url, abf_url, ctan_url = urls
+        # Constants are read on the first import of src, which happens below
+        os.environ['ABF_UPDATER_WORK_DIR'] = str(work_path / 'work')
+        os.environ['ABF_UPDATER_MIRROR_URL'] = f'{mirror_url}/archive/'
+        os.environ['ABF_UPDATER_CTAN_URL'] = ctan_url
+
+        from src.actions.scan import StalenessScanner
+        from src.schemas.reports import ScanReportSchema, StalenessStatus
+        from src.schemas.tasks import ScanPackagesTaskDataSchema
+        from src.services.ctan import CtanVersionProvider
+        from src.services.network_requests import RequestsHandler
+
+        requests_handler: RequestsHandler = RequestsHandler()
+        data: ScanPackagesTaskDataSchema = ScanPackagesTaskDataSchema(targets=[f"{abf_url}/import/texlive-{name}.git" for name in packages])
+        try:
+            timings: dict[str, float] = {}
+            for label in ('cold', 'warm'):
+                # The cold run builds the mirror index and fetches the package database, the warm one reuses both
+                start_time: float = time.perf_counter()
+                report: ScanReportSchema = await StalenessScanner(requests_handler, CtanVersionProvider(requests_handler), data).run()
+                timings[f'scan ({label})'] = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            await CtanVersionProvider(requests_handler).get_versions(list(packages))
+            timings['ctan json api per package'] = time.perf_counter() - start_time
+        finally:
+            await requests_handler.close_session()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    expected_outdated: int = sum(1 for spec_version, version in packages.values() if version and spec_version != version)
+    assert report.count(StalenessStatus.OUTDATED) == expected_outdated, f"Expected {expected_outdated} outdated packages, got {report.count(StalenessStatus.OUTDATED)}"
+    print(f"{len(packages)} packages, {expected_outdated} outdated")
+    for label, duration in timings.items():
+        print(f"{label:<28} {duration:8.3f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time the staleness scan against local stand-ins of the mirror, ABF and ctan.org")
+    parser.add_argument('--packages', type=int, default=1000)
+    parser.add_argument('--entries', type=int, default=35000, help="Number of synthetic entries in the mirror listing")
+    parser.add_argument('--latency-ms', type=float, default=20, help="Delay added to every stand-in response")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from collections import defaultdict
+from pathlib import Path
+
+FIRST_PROMPT: bytes = b"Type your abf username"
+PROMPT_TIMEOUT: float = 60
+
+
+def import_profile(module: str) -> tuple[float, dict[str, float]]:
+    # Returns the cumulative import time of module and the self time per top level package, in ms
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True)
+    total: float = 0
+    packages: defaultdict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative_time, name = line.removeprefix('import time:').split('|')
+        packages[name.strip().split('.')[0]] += int(self_time) / 1000
+        if name.strip() == module:
+            total = int(cumulative_time) / 1000
+    return total, packages
+
+
+def time_to_prompt(command: list[str]) -> float:
+    # Time from process start until the credentials prompt is printed, in ms
+    start_time: float = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    watchdog: threading.Timer = threading.Timer(PROMPT_TIMEOUT, process.kill)
+    watchdog.start()
+    output: bytes = b''
+    try:
+        while FIRST_PROMPT not in output:
+            chunk: bytes = os.read(process.stdout.fileno(), 4096)
+            if not chunk:
+                raise RuntimeError(f"{command[0]} exited before showing the first prompt")
+            output += chunk
+        return (time.perf_counter() - start_time) * 1000
+    finally:
+        watchdog.cancel()
+        process.kill()
+        process.wait()
+
+
+def measure_prompt(label: str, command: list[str], runs: int) -> dict:
+    timings: list[float] = [time_to_prompt(command) for _ in range(runs)]
+    # The first run pays for the cold file cache (and unpacking of a --onefile build)
+    result: dict = {
+        'first_ms': round(timings[0], 1),
+        'median_ms': round(statistics.median(timings[1:] or timings), 1)
+    }
+    print(f'{label} time to first prompt: first run {result["first_ms"]}ms, median {result["median_ms"]}ms')
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure import time of src.main and time to the first prompt of cli.py or a PyInstaller build")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="Number of the slowest packages to show")
+    parser.add_argument('--exe', type=Path, help="Path to the PyInstaller build of cli.py")
+    parser.add_argument('--output', type=Path, help="Write the results as json")
+    parser.add_argument('--max-import-ms', type=float, help="Exit with code 1 if importing src.main takes longer")
+    args = parser.parse_args()
+
+    profiles: list[tuple[float, dict[str, float]]] = [import_profile('src.main') for _ in range(args.runs)]
+    import_ms: float = statistics.median(total for total, _ in profiles)
+    packages: dict[str, float] = {
+        name: statistics.median(packages.get(name, 0) for _, packages in profiles)
+        for name in profiles[0][1]
+    }
+    slowest: list[tuple[str, float]] = sorted(packages.items(), key=lambda x: x[1], reverse=True)[:args.top]
+    print(f'import src.main: {import_ms:.1f}ms')
+    for name, self_ms in slowest:
+        print(f'    {name:<24} {self_ms:8.1f}ms')
+
+    results: dict = {
+        'import_ms': round(import_ms, 1),
+        'slowest_packages_ms': {name: round(self_ms, 1) for name, self_ms in slowest},
+        'cli': measure_prompt('cli.py', [sys.executable, 'cli.py'], args.runs)
+    }
+    if args.exe is not None:
+        results['exe'] = measure_prompt(args.exe.name, [str(args.exe.resolve())], args.runs)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=4))
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f'import src.main exceeds {args.max_import_ms}ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+
+from aiohttp import web
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from pathlib import Path
+
+# Roughly the size of a real ctan.org package page
+CTAN_PAGE_FILLER: str = ''.join(f'<div class="nav"><a href="/topic/{i}">Topic {i}</a><span>description {i}</span></div>' for i in range(400))
+
+
+async def start_stand_in(app: web.Application, host: str = '127.0.0.1', port: int = 0) -> tuple[web.AppRunner, str]:
+    runner: web.AppRunner = web.AppRunner(app)
+    await runner.setup()
+    site: web.TCPSite = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port: int = runner.addresses[0][1]
+    return runner, f'http://{host}:{bound_port}'
+
+
+def create_ctan_app(versions: dict[str, str]) -> web.Application:
+    # versions: package name => "number date" as shown on ctan.org, e.g. "1.2 2020-01-01" or "2020-01-01"
+    def split_version(version: str) -> dict[str, str]:
+        parts: list[str] = version.split()
+        if len(parts) == 2:
+            return {'number': parts[0], 'date': parts[1]}
+        return {'number': '', 'date': parts[0]}
+
+    async def packages(request: web.Request) -> web.Response:
+        return web.json_response([{'key': name, 'name': name, 'caption': ''} for name in versions])
+
+    async def package_json(request: web.Request) -> web.Response:
+        name: str = request.match_info['name']
+        if name not in versions:
+            return web.json_response({'errors': [f'Package {name} not found']}, status=404)
+        return web.json_response({'id': name, 'name': name, 'version': split_version(versions[name])})
+
+    async def package_page(request: web.Request) -> web.Response:
+        name: str = request.match_info['name']
+        if name not in versions:
+            return web.Response(status=404)
+        return web.Response(
+            text=f'<html><body>{CTAN_PAGE_FILLER}<table><tr><td>Sources</td><td>/macros/latex/{name}</td></tr>'
+                 f'<tr><td>Version</td><td>{versions[name]}</td></tr></table>{CTAN_PAGE_FILLER}</body></html>',
+            content_type='text/html'
+        )
+
+    app: web.Application = web.Application()
+    app.router.add_get('/json/2.0/packages', packages)
+    app.router.add_get('/json/2.0/pkg/{name}', package_json)
+    app.router.add_get('/pkg/{name}', package_page)
+    return app
+
+
+def create_mirror_app(listing: bytes, files_path: Path, etag: str = '"listing"', tlpdb: bytes | None = None, last_sync: datetime | None = None) -> web.Application:
+    # tlnet archive: autoindex listing at /archive/ and the tarballs from files_path, optionally the xz compressed package database.
+    # last_sync is the Last-Modified of the checksum file the mirror probe reads to tell stale mirrors apart
+    async def archive_listing(request: web.Request) -> web.Response:
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=listing, content_type='text/html', headers={'ETag': etag})
+
+    async def archive_file(request: web.Request) -> web.StreamResponse:
+        file_path: Path = files_path / request.match_info['name']
+        if not file_path.is_file():
+            return web.Response(status=404)
+        return web.FileResponse(file_path)
+
+    app: web.Application = web.Application()
+    app.router.add_get('/archive/', archive_listing)
+    app.router.add_get('/archive/{name}', archive_file)
+    if tlpdb is not None:
+        app.router.add_get('/tlpkg/texlive.tlpdb.xz', lambda request: web.Response(body=tlpdb))
+    if last_sync is not None:
+        app.router.add_get('/tlpkg/texlive.tlpdb.sha512', lambda request: web.Response(
+            body=b'', headers={'Last-Modified': format_datetime(last_sync.astimezone(timezone.utc), usegmt=True)}
+        ))
+    return app
+
+
+def create_abf_app(specs: dict[str, str]) -> web.Application:
+    # Raw files of ABF repos, specs: repo name (texlive-<package>) => content of its spec file
+    async def raw_file(request: web.Request) -> web.Response:
+        repo: str = request.match_info['repo']
+        if repo not in specs or request.match_info['path'] != f"{repo}.spec":
+            return web.Response(status=404)
+        return web.Response(text=specs[repo])
+
+    app: web.Application = web.Application()
+    app.router.add_get('/import/{repo}/raw/{branch}/{path}', raw_file)
+    return app
+
+
+def create_filestore_app() -> web.Application:
+    # ABF filestore: multipart upload answering with the sha1 of the file and a lookup by hash
+    stored_hashes: set[str] = set()
+
+    async def upload(request: web.Request) -> web.Response:
+        reader = await request.multipart()
+        part = await reader.next()
+        sha1 = hashlib.sha1()
+        while chunk := await part.read_chunk():
+            sha1.update(chunk)
+        stored_hashes.add(sha1.hexdigest())
+        return web.json_response({'sha1_hash': sha1.hexdigest()})
+
+    async def file_stores(request: web.Request) -> web.Response:
+        sha1: str = request.query.get('hash', '')
+        return web.json_response([{'sha1_hash': sha1}] if sha1 in stored_hashes else [])
+
+    app: web.Application = web.Application(client_max_size=1024 ** 3)
+    app.router.add_post('/api/v1/upload', upload)
+    app.router.add_get('/api/v1/file_stores.json', file_stores)
+    return app
+
+
+def latency_middleware(latency: float):
+    # Delays every response to approximate the round trip to the real services
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        await asyncio.sleep(latency)
+        return await handler(request)
+    return middleware
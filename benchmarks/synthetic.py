@@ -0,0 +1,140 @@
+import io
+import lzma
+import random
+import tarfile
+import tempfile
+
+import git
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+LISTING_HEADER: str = '<html>\r\n<head><title>Index of /CTAN/systems/texlive/tlnet/archive/</title></head>\r\n<body>\r\n<h1>Index of /CTAN/systems/texlive/tlnet/archive/</h1><hr><pre><a href="../">../</a>\r\n'
+LISTING_FOOTER: str = '</pre><hr></body>\r\n</html>\r\n'
+ARCHITECTURES: list[str] = ["aarch64-linux", "amd64-freebsd", "i386-linux", "universal-darwin", "windows", "x86_64-linux"]
+
+
+def listing_file_names(entries: int, seed: int = 0) -> list[str]:
+    # Mimics the tlnet archive layout: main/doc/source tarballs plus a few binaries and revision pinned files
+    rng: random.Random = random.Random(seed)
+    names: list[str] = []
+    package_index: int = 0
+    while len(names) < entries:
+        package_name: str = f"pkg{package_index:06d}"
+        names.append(f"{package_name}.tar.xz")
+        names.append(f"{package_name}.doc.tar.xz")
+        if rng.random() < 0.4:
+            names.append(f"{package_name}.source.tar.xz")
+        if rng.random() < 0.05:
+            names.extend(f"{package_name}.{arch}.tar.xz" for arch in ARCHITECTURES)
+        if rng.random() < 0.02:
+            names.append(f"{package_name}.r{rng.randint(10000, 70000)}.tar.xz")
+        package_index += 1
+    return sorted(names[:entries])
+
+
+def render_listing_row(file_name: str, upload_time: datetime, size: int) -> str:
+    # nginx autoindex truncates the visible name to 50 characters
+    visible_name: str = file_name if len(file_name) <= 50 else file_name[:47] + '..&gt;'
+    padding: str = ' ' * max(51 - min(len(file_name), 50), 1)
+    return f'<a href="{file_name}">{visible_name}</a>{padding}{upload_time.strftime("%d-%b-%Y %H:%M")} {size:>19}\r\n'
+
+
+def generate_listing(entries: int, seed: int = 0, files: dict[str, int] | None = None) -> bytes:
+    # files: additional real files (name => size in bytes) listed among the synthetic entries
+    rng: random.Random = random.Random(seed)
+    base_time: datetime = datetime(2024, 1, 1)
+    listed: list[tuple[str, datetime, int]] = [
+        (file_name, base_time - timedelta(minutes=rng.randint(0, 60 * 24 * 365 * 5)), rng.randint(500, 50 * 1024 * 1024))
+        for file_name in listing_file_names(entries, seed)
+    ]
+    listed.extend((file_name, base_time, size) for file_name, size in (files or {}).items())
+    rows: list[str] = [LISTING_HEADER]
+    rows.extend(render_listing_row(*row) for row in sorted(listed))
+    rows.append(LISTING_FOOTER)
+    return ''.join(rows).encode()
+
+
+def generate_tarball(path: Path, members: dict[str, int], seed: int = 0) -> int:
+    # members: path inside the tarball => size of its random (incompressible) content, returns the tarball size
+    rng: random.Random = random.Random(seed)
+    with tarfile.open(path, 'w:xz', preset=0) as tar:
+        for member_path, size in members.items():
+            info: tarfile.TarInfo = tarfile.TarInfo(member_path)
+            info.size = size
+            tar.addfile(info, io.BytesIO(rng.randbytes(size)))
+    return path.stat().st_size
+
+
+def package_tarballs(package: str, path: Path, size: int, files_per_tarball: int = 20, seed: int = 0) -> dict[str, int]:
+    # Main, doc and source tarballs of a package laid out as in tlnet (relocated to texmf-dist), returns file name => size in bytes
+    layouts: dict[str, str] = {
+        f"{package}.tar.xz": f"tex/latex/{package}",
+        f"{package}.doc.tar.xz": f"doc/latex/{package}",
+        f"{package}.source.tar.xz": f"source/latex/{package}"
+    }
+    sizes: dict[str, int] = {}
+    for i, (file_name, directory) in enumerate(layouts.items()):
+        members: dict[str, int] = {f"{directory}/file{j}.sty": size // files_per_tarball for j in range(files_per_tarball)}
+        members[f"tlpkg/tlpobj/{file_name.removesuffix('.tar.xz')}.tlpobj"] = 64
+        sizes[file_name] = generate_tarball(path / file_name, members, seed + i)
+    return sizes
+
+
+def generate_tlpdb(packages: dict[str, tuple[int, str]]) -> bytes:
+    # packages: name => (revision, catalogue version, empty if the package has none), returns texlive.tlpdb.xz
+    records: list[str] = ["name 00texlive.config\ncategory TLCore\nrevision 1\ndepend revision/1\n"]
+    for name, (revision, version) in packages.items():
+        record: str = f"name {name}\ncategory Package\nrevision {revision}\nshortdesc Synthetic {name} package\n"
+        if version:
+            record += f"catalogue-version {version}\n"
+        records.append(record)
+        records.append(f"name {name}.x86_64-linux\ncategory Package\nrevision {revision}\n")
+    return lzma.compress("\n".join(records).encode(), preset=0)
+
+
+def render_spec_file(package: str, version: str) -> str:
+    return (
+        f"Name:\t\ttexlive-{package}\n"
+        f"Version:\t{version}\n"
+        "Release:\t1\n"
+        f"Summary:\tSynthetic {package} package\n"
+        "License:\tLPPL\n"
+        f"Source0:\thttp://mirrors.ctan.org/systems/texlive/tlnet/archive/{package}.tar.xz\n"
+        f"Source1:\thttp://mirrors.ctan.org/systems/texlive/tlnet/archive/{package}.doc.tar.xz\n"
+        f"Source2:\thttp://mirrors.ctan.org/systems/texlive/tlnet/archive/{package}.source.tar.xz\n"
+        "BuildArch:\tnoarch\n"
+        "\n"
+        "%description\n"
+        f"Synthetic {package} package.\n"
+        "\n"
+        "%files\n"
+        f"%{{_texmfdistdir}}/tex/latex/{package}\n"
+        f"%doc %{{_texmfdistdir}}/doc/latex/{package}\n"
+        "#- source\n"
+        f"%doc %{{_texmfdistdir}}/source/latex/{package}\n"
+    )
+
+
+def render_hash_file(package: str) -> str:
+    return (
+        "sources:\n"
+        f"  {package}.doc.tar.xz: {'0' * 40}\n"
+        f"  {package}.source.tar.xz: {'0' * 40}\n"
+        f"  {package}.tar.xz: {'0' * 40}\n"
+    )
+
+
+def create_package_remote(path: Path, package: str, version: str, branch: str = "rosa2023.1") -> Path:
+    # Bare repository laid out like https://abf.io/import/texlive-<package>.git
+    remote_path: Path = path / f"texlive-{package}.git"
+    git.Repo.init(remote_path, bare=True, initial_branch=branch)
+    with tempfile.TemporaryDirectory() as work_tree:
+        repo: git.Repo = git.Repo.init(work_tree, initial_branch=branch)
+        Path(work_tree, f"texlive-{package}.spec").write_text(render_spec_file(package, version))
+        Path(work_tree, ".abf.yml").write_text(render_hash_file(package))
+        repo.index.add([f"texlive-{package}.spec", ".abf.yml"])
+        repo.index.commit(f"Import texlive-{package} {version}")
+        repo.create_remote('origin', str(remote_path)).push(f"{branch}:{branch}")
+        repo.close()
+    return remote_path
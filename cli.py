@@ -1,5 +1,8 @@
 import asyncio
+import multiprocessing
 
 from src.main import main
 if __name__ == '__main__':
+    # Required for process pools in the PyInstaller build
+    multiprocessing.freeze_support()
     asyncio.run(main())
\ No newline at end of file
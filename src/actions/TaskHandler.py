@@ -1,66 +1,209 @@
-from src.constants import PackageTypes
-from src.schemas.package_data import AvailableSourcesSchema
+from __future__ import annotations
 
-from src.utils import *
-from src.services.git import *
-from src.actions.actions import *
+import asyncio
+import logging
+
+from typing import Callable, TYPE_CHECKING
+
+from src.constants import ExitStatus, PackageTypes, TaskType
+from src.actions.actions import prepare_repo, get_package_data, create_requests_handler, repo_name, checkout_exists
+from src.utils import check_for_exit_condition, handle_bool_input, create_logger
+
+if TYPE_CHECKING:
+    from src.schemas.package_data import FileMetadataSchema, DownloadedFileSchema
+    from src.schemas.tasks import UpdatePackageTaskDataSchema, CloneRemoteRepoTaskDataSchema, ParseMirrorTaskDataSchema, BatchUpdateTaskDataSchema, ScanPackagesTaskDataSchema
+    from src.schemas.user_data import UserDataSchema
+    from src.schemas.repo import RepoDataSchema
+    from src.schemas.tarball import TarballMember
+    from src.schemas.reports import FilesVerificationReportSchema, TarballDiffSchema
+    from src.services.mirror_index import MirrorIndex
+    from src.services.network_requests import RequestsHandler
+    from src.services.documents import TextDocument
+    from src.services.ctan import CtanVersionProvider
+    from src.services.metrics import MetricsRecorder
+    from src.services.tarball_index import TarballIndex
+
+logger = create_logger('TaskHandler', logging.INFO)
 
-from src.services.directory_structure import verify_file_presence, log_tarballs_structure, log_package_files
-from src.services.parsers import parse_mirror
-from src.services.file_parsers import update_spec_file, update_hash_file
-from src.services.network_requests import RequestsHandler
 
 class TaskHandler:
     def __init__(self, user_data):
         self.user_data: UserDataSchema = user_data
-        self.requests_handler: RequestsHandler = create_requests_handler()
+        # Network clients are created by the first task that needs them, so the menu shows up without waiting for aiohttp
+        self.__requests_handler: RequestsHandler | None = None
+        self.__version_provider: CtanVersionProvider | None = None
+        self.__metrics: MetricsRecorder | None = None
+        self.__tarball_index: TarballIndex | None = None
         self.__task_type_to_func = {
             TaskType.UPDATE_PACKAGE: self.__update_package,
             TaskType.CREATE_PACKAGE: None,
             TaskType.PARSE_MIRROR: self.__parse_mirror,
             TaskType.GET_PACKAGE_FILES: None,
             TaskType.CLONE_REMOTE_REPO: self.__clone_remote_repo,
+            TaskType.BATCH_UPDATE_PACKAGES: self.__batch_update_packages,
+            TaskType.SCAN_PACKAGES: self.__scan_packages,
             TaskType.EXIT: None
         }
 
+    @property
+    def requests_handler(self) -> RequestsHandler:
+        if self.__requests_handler is None:
+            self.__requests_handler = create_requests_handler()
+        return self.__requests_handler
+
+    @property
+    def version_provider(self) -> CtanVersionProvider:
+        if self.__version_provider is None:
+            from src.services.ctan import CtanVersionProvider
+            self.__version_provider = CtanVersionProvider(self.requests_handler)
+        return self.__version_provider
+
+    @property
+    def metrics(self) -> MetricsRecorder:
+        if self.__metrics is None:
+            from src.services.metrics import MetricsRecorder
+            self.__metrics = MetricsRecorder()
+        return self.__metrics
+
+    @property
+    def tarball_index(self) -> TarballIndex:
+        if self.__tarball_index is None:
+            from src.services.tarball_index import TarballIndex
+            self.__tarball_index = TarballIndex()
+        return self.__tarball_index
+
     async def run(self, task_type: TaskType, data: any):
         executor: Callable | None = self.__task_type_to_func.get(task_type)
         if executor is None:
             return 1
-        await executor(data)
+        self.metrics.start_task(task_type.name)
+        try:
+            await executor(data)
+        finally:
+            self.metrics.finish_task()
         return 0
 
     @staticmethod
     async def __clone_remote_repo(data: CloneRemoteRepoTaskDataSchema):
-        prepare_repo(data.repo_url)
+        await asyncio.to_thread(prepare_repo, data.repo_url)
+
+    async def __parse_mirror(self, data: ParseMirrorTaskDataSchema):
+        from src.services.parsers import parse_mirror
+
+        with self.metrics.span('mirror_index') as span:
+            span.files = (await parse_mirror(self.requests_handler, True, data.export_json)).count()
+
+    async def __batch_update_packages(self, data: BatchUpdateTaskDataSchema):
+        from src.actions.batch import BatchUpdater
 
-    async def __parse_mirror(self, data: None):
-        await parse_mirror(self.requests_handler, True)
+        await BatchUpdater(self.requests_handler, self.version_provider, self.user_data.abf_credentials, data, metrics=self.metrics, tarball_index=self.tarball_index).run()
+
+    async def __scan_packages(self, data: ScanPackagesTaskDataSchema):
+        from src.actions.scan import StalenessScanner
+
+        await StalenessScanner(self.requests_handler, self.version_provider, data, metrics=self.metrics).run()
 
     async def __update_package(self, data: UpdatePackageTaskDataSchema):
-        repo_data: RepoDataSchema = prepare_repo(data.repo_url)
-        spec_file_path, hash_file_path = verify_file_presence(repo_data.path)
+        from src.services.directory_structure import verify_file_presence, log_tarballs_structure, log_package_files
+        from src.services.files_verification import verify_package_files, log_verification_report
+        from src.services.parsers import parse_mirror
+        from src.services.file_parsers import update_spec_file, update_hash_file, read_hash_file
+        from src.services.documents import TextDocument
+        from src.services.git import commit_and_push
+        from src.services.metrics import record_downloads, record_uploads
+        from src.services.stages import StageGraph
+        from src.services.tarball_index import index_tarballs, diff_tarballs, log_tarball_diffs
+        from src.schemas.package_data import PackageVersions
 
-        old_package_data, new_package_data = await get_package_data(self.requests_handler, spec_file_path)
+        name: str = repo_name(data.repo_url)
 
-        available_source_files: AvailableSourcesSchema = await parse_mirror(self.requests_handler)
-        check_for_exit_condition(available_source_files.get_repo_related(repo_data.name), lambda x: len(x) == 0,
-                                 f"Sources not found for {repo_data.name}")
+        async def clone() -> RepoDataSchema:
+            with self.metrics.span('git', name) as span:
+                span.record_cache(checkout_exists(data.repo_url))
+                # GitPython blocks, the mirror index and the ctan version are fetched meanwhile
+                return await asyncio.to_thread(prepare_repo, data.repo_url)
 
-        update_spec_file(spec_file_path, old_package_data, new_package_data, data.delete_comments)
+        async def prefetch_version() -> None:
+            # Repo names match package names in most cases, get_package_data then finds the version cached
+            await self.version_provider.get_versions([name])
 
-        file_hashes: dict[PackageTypes, str] = await self.requests_handler.download_and_upload_files(
-            self.user_data.abf_credentials,
-            new_package_data.short_name,
-            repo_data.data_path,
-            available_source_files.get_repo_related(repo_data.name)
-        )
-        update_hash_file(hash_file_path, file_hashes)
+        async def load_mirror_index() -> MirrorIndex:
+            with self.metrics.span('mirror_index', name) as span:
+                mirror_index: MirrorIndex = await parse_mirror(self.requests_handler)
+                span.files = mirror_index.count()
+            return mirror_index
+
+        async def load_documents(repo_data: RepoDataSchema) -> tuple[TextDocument, TextDocument]:
+            spec_file_path, hash_file_path = verify_file_presence(repo_data.path)
+            return TextDocument.load(spec_file_path), TextDocument.load(hash_file_path)
+
+        async def read_versions(documents: tuple[TextDocument, TextDocument], _) -> PackageVersions:
+            with self.metrics.span('ctan', name):
+                versions: PackageVersions = PackageVersions(*await get_package_data(self.version_provider, documents[0]))
+            update_spec_file(documents[0], versions.old, versions.new, data.delete_comments)
+            return versions
+
+        async def find_sources(repo_data: RepoDataSchema, mirror_index: MirrorIndex) -> list[FileMetadataSchema]:
+            sources: list[FileMetadataSchema] = mirror_index.get_repo_related(repo_data.name)
+            check_for_exit_condition(sources, lambda x: len(x) == 0, f"Sources not found for {repo_data.name}")
+            return sources
+
+        async def download(repo_data: RepoDataSchema, versions: PackageVersions, sources: list[FileMetadataSchema]) -> list[DownloadedFileSchema]:
+            with self.metrics.span('download', name) as span:
+                logger.info(f"Downloading {len(sources)} source files")
+                saved_files: list[DownloadedFileSchema] = await self.requests_handler.download_files(
+                    versions.new.short_name, repo_data.data_path, sources
+                )
+                record_downloads(span, saved_files)
+            return saved_files
+
+        async def upload(saved_files: list[DownloadedFileSchema]) -> dict[PackageTypes, str]:
+            with self.metrics.span('upload', name) as span:
+                logger.info(f"Uploading {len(saved_files)} source files to filestore")
+                file_hashes: dict[PackageTypes, str] = await self.requests_handler.upload_to_filestore(self.user_data.abf_credentials, saved_files)
+                record_uploads(span, saved_files)
+            return file_hashes
+
+        async def verify(repo_data: RepoDataSchema, documents: tuple[TextDocument, TextDocument], versions: PackageVersions, saved_files: list[DownloadedFileSchema]) -> tuple[dict[str, list[TarballMember]], FilesVerificationReportSchema, list[TarballDiffSchema]]:
+            # Tarballs are listed in the process pool while the upload is running, content listed before comes from the tarball index
+            with self.metrics.span('list_tarballs', name) as span:
+                tarballs, indexed = await index_tarballs(self.tarball_index, versions.new.short_name, repo_data.data_path, saved_files)
+                span.files = sum(len(members) for members in tarballs.values())
+                span.cache_hits, span.cache_misses = indexed, len(tarballs) - indexed
+            with self.metrics.span('structure_diff', name) as span:
+                # The hash file still references the tarballs of the previous version, it is updated after the upload
+                diffs: list[TarballDiffSchema] = await diff_tarballs(self.tarball_index, versions.new.short_name, read_hash_file(documents[1]), saved_files)
+                span.files = len(diffs)
+            with self.metrics.span('verify_files', name) as span:
+                files_report: FilesVerificationReportSchema = verify_package_files(versions.old.included_files, tarballs)
+                span.files = len(versions.old.included_files)
+            return tarballs, files_report, diffs
+
+        graph: StageGraph = StageGraph()
+        graph.add('git', clone)
+        graph.add('ctan_prefetch', prefetch_version)
+        graph.add('mirror_index', load_mirror_index)
+        graph.add('documents', load_documents, 'git')
+        graph.add('versions', read_versions, 'documents', 'ctan_prefetch')
+        graph.add('sources', find_sources, 'git', 'mirror_index')
+        graph.add('download', download, 'git', 'versions', 'sources')
+        graph.add('upload', upload, 'download')
+        graph.add('verify', verify, 'git', 'documents', 'versions', 'download')
+        results: dict[str, any] = await graph.run()
 
-        normalize_line_endings([spec_file_path, hash_file_path])
-        log_tarballs_structure(repo_data.data_path)
-        logger.info("List of included files in %files")
-        log_package_files(old_package_data)
+        repo_data: RepoDataSchema = results['git']
+        spec_document, hash_document = results['documents']
+        old_package_data, new_package_data = results['versions']
+        tarballs, files_report, diffs = results['verify']
+        update_hash_file(hash_document, results['upload'])
+        spec_document.save()
+        hash_document.save()
+        log_tarball_diffs(diffs)
+        log_verification_report(files_report)
+        if not files_report.is_ok:
+            log_tarballs_structure(tarballs)
+            logger.info("List of included files in %files")
+            log_package_files(old_package_data)
 
         check_for_exit_condition(
             handle_bool_input(
@@ -70,5 +213,6 @@ class TaskHandler:
             "Exiting",
             type=ExitStatus.EARLY_RETURN
         )
-        commit_and_push(repo_data.repo, [spec_file_path, hash_file_path], old_package_data, new_package_data)
-        logger.info("Package updated!")
\ No newline at end of file
+        with self.metrics.span('push', name):
+            await asyncio.to_thread(commit_and_push, repo_data.repo, [spec_document.path, hash_document.path], old_package_data, new_package_data)
+        logger.info("Package updated!")
@@ -1,32 +1,44 @@
+from __future__ import annotations
+
 import logging
 
-import asyncio_atexit
-from git import Repo
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from src.constants import RESERVED_TASK_TYPES, ExitStatus, WORK_DIR_PATH
-from src.schemas.package_data import SpecFileDataSchema
-from src.schemas.repo import RepoDataSchema
-
-from src.schemas.user_data import UserDataSchema, LoginDataSchema
-from src.schemas.tasks import TaskType, UpdatePackageTaskDataSchema, CloneRemoteRepoTaskDataSchema
-from src.services.directory_structure import create_work_dir
-from src.services.file_parsers import parse_spec_file
-from src.services.git import clone_repo, checkout_latest
-from src.services.network_requests import RequestsHandler
-from src.services.parsers import parse_package_data
+from src.constants import RESERVED_TASK_TYPES, ExitStatus, TaskType
 from src.utils import handle_input, check_for_exit_condition, is_update_needed
 
+if TYPE_CHECKING:
+    from src.schemas.user_data import UserDataSchema
+    from git import Repo
+    from src.schemas.package_data import SpecFileDataSchema
+    from src.schemas.repo import RepoDataSchema
+    from src.services.documents import TextDocument
+    from src.services.network_requests import RequestsHandler
+    from src.services.ctan import CtanVersionProvider
+
+
+def preload_modules() -> None:
+    # Run in a background thread while the first prompts wait for input.
+    # Plain import statements keep the modules visible to PyInstaller analysis
+    import src.schemas.tasks
+    import src.schemas.user_data
+    import src.actions.batch
+    import src.actions.scan
+    import src.services.parsers
+    import src.services.git
+
 
 def get_user_data() -> UserDataSchema:
-    return UserDataSchema(
-        abf_credentials = LoginDataSchema(
-            email = handle_input("Type your abf username (email): ", lambda x: '@' in x),
-            password = handle_input("Type your abf password: ", lambda x: True)
-        )
-    )
+    email: str = handle_input("Type your abf username (email): ", lambda x: '@' in x)
+    password: str = handle_input("Type your abf password: ", lambda x: True)
+    # Schemas are imported after the prompts, pydantic is still loading while the user types
+    from src.schemas.user_data import UserDataSchema, LoginDataSchema
+    return UserDataSchema(abf_credentials=LoginDataSchema(email=email, password=password))
 
 def get_task() -> tuple[TaskType, any]:
+    from src.schemas.tasks import UpdatePackageTaskDataSchema, CloneRemoteRepoTaskDataSchema, ParseMirrorTaskDataSchema, BatchUpdateTaskDataSchema, ScanPackagesTaskDataSchema
+
     tasks_prompt: str = "Select a task:\n"
     user_tasks_number: int = len(TaskType) - RESERVED_TASK_TYPES
     for i in range(1, user_tasks_number + 1):
@@ -41,36 +53,60 @@ def get_task() -> tuple[TaskType, any]:
         selected_task = TaskType.CREATE_PACKAGE
     elif task_number == 3:
         selected_task = TaskType.PARSE_MIRROR
-        data = None
+        data = ParseMirrorTaskDataSchema.from_cli()
     elif task_number == 4:
         selected_task = TaskType.GET_PACKAGE_FILES
     elif task_number == 5:
         selected_task = TaskType.CLONE_REMOTE_REPO
         data = CloneRemoteRepoTaskDataSchema.from_cli()
     elif task_number == 6:
+        selected_task = TaskType.BATCH_UPDATE_PACKAGES
+        data = BatchUpdateTaskDataSchema.from_cli()
+    elif task_number == 7:
+        selected_task = TaskType.SCAN_PACKAGES
+        data = ScanPackagesTaskDataSchema.from_cli()
+    elif task_number == 8:
         selected_task = TaskType.EXIT
         data = None
     return selected_task, data
 
+def repo_name(repo_url: str) -> str:
+    return repo_url.split('/')[-1].split('.')[0].replace('texlive-', '')
+
+def checkout_path(repo_url: str) -> Path:
+    from src.services.work_dir import workspace_path
+
+    return Path.joinpath(workspace_path(), repo_name(repo_url))
+
+def checkout_exists(repo_url: str) -> bool:
+    return Path.joinpath(checkout_path(repo_url), '.git').is_dir()
+
 def prepare_repo(repo_url: str) -> RepoDataSchema:
+    # git, aiohttp and the package schemas are imported by the tasks using them to keep startup fast
+    from src.schemas.repo import RepoDataSchema
+    from src.services.directory_structure import create_work_dir
+    from src.services.git import clone_repo, checkout_latest
+
     create_work_dir()
-    repo_name: str = repo_url.split('/')[-1].split('.')[0].replace('texlive-', '')
-    repo: Repo = clone_repo(repo_url, Path.joinpath(WORK_DIR_PATH, repo_name), True)
+    name: str = repo_name(repo_url)
+    repo: Repo = clone_repo(repo_url, checkout_path(repo_url), True)
 
     checkout_latest(repo)
 
     return RepoDataSchema(
         url=repo_url,
-        name=repo_name,
+        name=name,
         repo=repo
     )
 
-async def get_package_data(requests_handler: RequestsHandler, spec_file_path: Path) -> tuple[SpecFileDataSchema, SpecFileDataSchema]:
-    old_data: SpecFileDataSchema = parse_spec_file(spec_file_path)
+async def get_package_data(version_provider: CtanVersionProvider, spec_document: TextDocument) -> tuple[SpecFileDataSchema, SpecFileDataSchema]:
+    from src.services.file_parsers import parse_spec_file
+
+    old_data: SpecFileDataSchema = parse_spec_file(spec_document)
     check_for_exit_condition(old_data.is_empty, message="Failed to extract data from spec file")
     logging.info(f"Local package data: {old_data.__str__()}")
     logging.info("Getting up to date data from ctan.org")
-    new_data: SpecFileDataSchema = await parse_package_data(requests_handler, old_data)
+    new_data: SpecFileDataSchema = await version_provider.get_package_data(old_data)
 
     update_flag: bool = is_update_needed(old_data, new_data)
     check_for_exit_condition(update_flag, lambda x: not x,f"{old_data.name} is already up to date. Aborting...", type=ExitStatus.EARLY_RETURN)
@@ -79,6 +115,9 @@ async def get_package_data(requests_handler: RequestsHandler, spec_file_path: Pa
     return old_data, new_data
 
 def create_requests_handler() -> RequestsHandler:
+    import asyncio_atexit
+    from src.services.network_requests import RequestsHandler
+
     requests_handler: RequestsHandler = RequestsHandler()
     async def close_session():
         await requests_handler.close_session()
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+
+from src.constants import ExitStatus, PackageTypes
+from src.actions.actions import prepare_repo, get_package_data, repo_name, checkout_exists
+from src.schemas.package_data import FileMetadataSchema, DownloadedFileSchema
+from src.schemas.repo import RepoDataSchema
+from src.schemas.reports import BatchReportSchema, PackageUpdateReportSchema, UpdateStatus, FilesVerificationReportSchema, TarballDiffSchema
+from src.schemas.tasks import BatchUpdateTaskDataSchema
+from src.schemas.user_data import LoginDataSchema
+from src.services.ctan import CtanVersionProvider
+from src.services.directory_structure import verify_file_presence
+from src.services.documents import TextDocument
+from src.services.file_parsers import update_spec_file, update_hash_file, read_hash_file
+from src.services.files_verification import verify_package_files, log_verification_report
+from src.services.git import commit_and_push
+from src.services.metrics import MetricsRecorder, record_downloads, record_uploads
+from src.services.mirror_index import MirrorIndex
+from src.services.network_requests import RequestsHandler
+from src.services.parsers import parse_mirror
+from src.services.tarball_index import TarballIndex, index_tarballs, diff_tarballs, log_tarball_diffs
+from src.utils import check_for_exit_condition, create_logger, non_interactive, TaskAbortedError, get_error_logger
+
+logger = create_logger('Batch', logging.INFO)
+
+
+class BatchUpdater:
+    def __init__(self, requests_handler: RequestsHandler, version_provider: CtanVersionProvider, abf_credentials: LoginDataSchema, data: BatchUpdateTaskDataSchema, mirror_index: MirrorIndex | None = None, metrics: MetricsRecorder | None = None, tarball_index: TarballIndex | None = None):
+        self.requests_handler: RequestsHandler = requests_handler
+        self.metrics: MetricsRecorder = metrics or MetricsRecorder()
+        self.mirror_index: MirrorIndex | None = mirror_index
+        self.tarball_index: TarballIndex = tarball_index or TarballIndex()
+        self.version_provider: CtanVersionProvider = version_provider
+        self.abf_credentials: LoginDataSchema = abf_credentials
+        self.data: BatchUpdateTaskDataSchema = data
+        self.__git_limit: asyncio.Semaphore = asyncio.Semaphore(data.git_concurrency)
+        self.__ctan_limit: asyncio.Semaphore = asyncio.Semaphore(data.ctan_concurrency)
+        self.__download_limit: asyncio.Semaphore = asyncio.Semaphore(data.download_concurrency)
+        self.__upload_limit: asyncio.Semaphore = asyncio.Semaphore(data.upload_concurrency)
+
+    async def run(self) -> BatchReportSchema:
+        logger.info(f"Starting batch update of {len(self.data.repo_urls)} packages")
+        with self.metrics.span('mirror_index') as span:
+            mirror_index: MirrorIndex = await parse_mirror(self.requests_handler, mirror_index=self.mirror_index)
+            span.files = mirror_index.count()
+        token = non_interactive.set(True)
+        try:
+            # Warm up ctan versions while repos are being cloned, repo names match package names in most cases
+            prefetch: asyncio.Future = asyncio.gather(
+                self.version_provider.get_versions([repo_name(repo_url) for repo_url in self.data.repo_urls]),
+                return_exceptions=True
+            )
+            reports: list[PackageUpdateReportSchema] = await asyncio.gather(
+                *[self.__update_package(repo_url, mirror_index) for repo_url in self.data.repo_urls]
+            )
+            await prefetch
+        finally:
+            non_interactive.reset(token)
+        batch_report: BatchReportSchema = BatchReportSchema(packages=reports)
+        log_batch_report(batch_report)
+        self.requests_handler.log_host_stats()
+        return batch_report
+
+    async def __update_package(self, repo_url: str, mirror_index: MirrorIndex) -> PackageUpdateReportSchema:
+        report: PackageUpdateReportSchema = PackageUpdateReportSchema(repo_url=repo_url)
+        start_time: float = time.perf_counter()
+        try:
+            await self.__run_stages(report, mirror_index)
+        except TaskAbortedError as e:
+            report.status = UpdateStatus.UP_TO_DATE if e.type == ExitStatus.EARLY_RETURN else UpdateStatus.FAILED
+            report.message = str(e)
+        except Exception as e:
+            report.status = UpdateStatus.FAILED
+            report.message = f"{type(e).__name__}: {e}"
+            get_error_logger().critical(f"{repo_url}: {report.message}")
+        report.duration = round(time.perf_counter() - start_time, 2)
+        logger.info(f"{report.name or repo_url}: {report.status.name} {report.message}")
+        return report
+
+    async def __run_stages(self, report: PackageUpdateReportSchema, mirror_index: MirrorIndex) -> None:
+        name: str = repo_name(report.repo_url)
+        async with self.__git_limit:
+            with self.metrics.span('git', name) as span:
+                span.record_cache(checkout_exists(report.repo_url))
+                repo_data: RepoDataSchema = await asyncio.to_thread(prepare_repo, report.repo_url)
+        report.name = repo_data.name
+        spec_file_path, hash_file_path = verify_file_presence(repo_data.path)
+        spec_document: TextDocument = TextDocument.load(spec_file_path)
+        hash_document: TextDocument = TextDocument.load(hash_file_path)
+
+        async with self.__ctan_limit:
+            with self.metrics.span('ctan', name):
+                old_package_data, new_package_data = await get_package_data(self.version_provider, spec_document)
+        report.old_version, report.new_version = old_package_data.version, new_package_data.version
+
+        sources: list[FileMetadataSchema] = mirror_index.get_repo_related(repo_data.name)
+        check_for_exit_condition(sources, lambda x: len(x) == 0, f"Sources not found for {repo_data.name}")
+        update_spec_file(spec_document, old_package_data, new_package_data, self.data.delete_comments)
+
+        async with self.__download_limit:
+            with self.metrics.span('download', name) as span:
+                saved_files: list[DownloadedFileSchema] = await self.requests_handler.download_files(
+                    new_package_data.short_name, repo_data.data_path, sources
+                )
+                record_downloads(span, saved_files)
+        async with self.__upload_limit:
+            with self.metrics.span('upload', name) as span:
+                file_hashes: dict[PackageTypes, str] = await self.requests_handler.upload_to_filestore(self.abf_credentials, saved_files)
+                record_uploads(span, saved_files)
+        # Tarballs of the previous version, before the hash file references the new ones
+        old_hashes: dict[PackageTypes, str] = read_hash_file(hash_document)
+        update_hash_file(hash_document, file_hashes)
+        spec_document.save()
+        hash_document.save()
+
+        with self.metrics.span('list_tarballs', name) as span:
+            tarballs, indexed = await index_tarballs(self.tarball_index, new_package_data.short_name, repo_data.data_path, saved_files)
+            span.files = sum(len(members) for members in tarballs.values())
+            span.cache_hits, span.cache_misses = indexed, len(tarballs) - indexed
+        with self.metrics.span('structure_diff', name) as span:
+            diffs: list[TarballDiffSchema] = await diff_tarballs(self.tarball_index, new_package_data.short_name, old_hashes, saved_files)
+            span.files = len(diffs)
+        changed: list[TarballDiffSchema] = [diff for diff in diffs if diff.is_structure_changed]
+        if changed:
+            log_tarball_diffs(changed)
+            report.message = "File structure changed: " + ", ".join(map(str, changed))
+        with self.metrics.span('verify_files', name) as span:
+            files_report: FilesVerificationReportSchema = verify_package_files(old_package_data.included_files, tarballs)
+            span.files = len(old_package_data.included_files)
+        if not files_report.is_ok:
+            log_verification_report(files_report)
+            report.status = UpdateStatus.PREPARED
+            report.message = f"Files in %files do not match the tarballs, not pushing. {files_report} {report.message}".strip()
+            return
+        if not self.data.push:
+            report.status = UpdateStatus.PREPARED
+            return
+        async with self.__git_limit:
+            with self.metrics.span('push', name):
+                await asyncio.to_thread(commit_and_push, repo_data.repo, [spec_file_path, hash_file_path], old_package_data, new_package_data)
+        report.status = UpdateStatus.UPDATED
+
+def log_batch_report(report: BatchReportSchema) -> None:
+    logger.info("======Batch update report======")
+    for package in report.packages:
+        versions: str = f"{package.old_version} -> {package.new_version}" if package.new_version else ""
+        logger.info(f"{package.status.name:<10} | {package.name or package.repo_url:<30} | {versions:<25} | {package.duration:>7.2f}s | {package.message}")
+    logger.info(
+        " ".join(f"{status.name}: {report.count(status)}" for status in UpdateStatus)
+    )
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+
+from datetime import datetime
+from pathlib import Path
+
+from src.constants import ABF_RAW_FILE_URL_TEMPLATE, ABF_BRANCH, SCAN_REPORT_PATH
+from src.actions.actions import checkout_exists, checkout_path
+from src.schemas.package_data import SpecFileDataSchema, FileMetadataSchema
+from src.schemas.reports import ScanReportSchema, PackageStalenessReportSchema, StalenessStatus
+from src.schemas.tasks import ScanPackagesTaskDataSchema
+from src.schemas.tlpdb import TlpdbSchema, TlpdbPackageSchema
+from src.services.ctan import CtanVersionProvider, normalize_version
+from src.services.directory_structure import verify_file_presence
+from src.services.documents import TextDocument
+from src.services.file_parsers import parse_spec_file
+from src.services.git import last_commit_time
+from src.services.metrics import MetricsRecorder
+from src.services.mirror_index import MirrorIndex
+from src.services.network_requests import RequestsHandler, MirrorError, MIRROR_ERRORS
+from src.services.parsers import parse_mirror
+from src.services.tlpdb import load_tlpdb
+from src.services.work_dir import write_atomic
+from src.utils import create_logger, non_interactive, is_update_needed, TaskAbortedError
+
+logger = create_logger('Scan', logging.INFO)
+
+
+class StalenessScanner:
+    # Finds outdated packages from their spec files, the mirror index and the TeX Live package database,
+    # nothing is cloned and ctan.org is only asked about packages missing from the database
+    def __init__(self, requests_handler: RequestsHandler, version_provider: CtanVersionProvider, data: ScanPackagesTaskDataSchema, mirror_index: MirrorIndex | None = None, metrics: MetricsRecorder | None = None):
+        self.requests_handler: RequestsHandler = requests_handler
+        self.version_provider: CtanVersionProvider = version_provider
+        self.data: ScanPackagesTaskDataSchema = data
+        self.mirror_index: MirrorIndex | None = mirror_index
+        self.metrics: MetricsRecorder = metrics or MetricsRecorder()
+        self.__limit: asyncio.Semaphore = asyncio.Semaphore(data.concurrency)
+
+    async def run(self) -> ScanReportSchema:
+        logger.info(f"Scanning {len(self.data.targets)} packages")
+        start_time: float = time.perf_counter()
+        with self.metrics.span('mirror_index') as span:
+            mirror_index: MirrorIndex = await parse_mirror(self.requests_handler, mirror_index=self.mirror_index)
+            span.files = mirror_index.count()
+        with self.metrics.span('tlpdb') as span:
+            tlpdb: TlpdbSchema = await load_tlpdb(self.requests_handler)
+            span.files = len(tlpdb.packages)
+        token = non_interactive.set(True)
+        try:
+            with self.metrics.span('read_specs') as span:
+                specs: list[tuple[PackageStalenessReportSchema, SpecFileDataSchema | None]] = await asyncio.gather(
+                    *[self.__read_spec(target) for target in self.data.targets]
+                )
+                span.files = len(specs)
+        finally:
+            non_interactive.reset(token)
+
+        ctan_versions: dict[str, str | None] = {}
+        missing: list[str] = [
+            spec_data.short_name for _, spec_data in specs
+            if spec_data is not None and not tlpdb.packages.get(spec_data.short_name, TlpdbPackageSchema()).catalogue_version
+        ]
+        if self.data.ctan_fallback and missing:
+            with self.metrics.span('ctan') as span:
+                logger.info(f"Requesting ctan versions of {len(missing)} packages without a catalogue version")
+                ctan_versions = await self.version_provider.get_versions(missing)
+                span.files = len(missing)
+
+        for report, spec_data in specs:
+            if spec_data is not None:
+                evaluate(report, spec_data, mirror_index.get_repo_related(spec_data.short_name), tlpdb, ctan_versions)
+        scan_report: ScanReportSchema = ScanReportSchema(packages=[report for report, _ in specs])
+        log_scan_report(scan_report)
+        save_scan_report(scan_report)
+        logger.info(f"Scan finished in {time.perf_counter() - start_time:.2f}s")
+        return scan_report
+
+    async def __read_spec(self, target: str) -> tuple[PackageStalenessReportSchema, SpecFileDataSchema | None]:
+        report: PackageStalenessReportSchema = PackageStalenessReportSchema(target=target)
+        try:
+            async with self.__limit:
+                spec_document, report.spec_updated_at = await self.__load_spec(target)
+            spec_data: SpecFileDataSchema = parse_spec_file(spec_document)
+        except (TaskAbortedError, *MIRROR_ERRORS, OSError, ValueError, IndexError) as e:
+            report.message = f"Failed to read spec file ({type(e).__name__}: {e})"
+            return report, None
+        if spec_data.is_empty:
+            report.message = "Failed to extract data from spec file"
+            return report, None
+        report.name = spec_data.short_name
+        report.spec_version = spec_data.version
+        return report, spec_data
+
+    async def __load_spec(self, target: str) -> tuple[TextDocument, datetime | None]:
+        local_path: Path | None = Path(target) if Path(target).is_dir() else None
+        if local_path is None and checkout_exists(target):
+            local_path = checkout_path(target)
+        if local_path is not None:
+            spec_file_path, _ = verify_file_presence(local_path)
+            spec_document: TextDocument = await asyncio.to_thread(TextDocument.load, spec_file_path)
+            return spec_document, await asyncio.to_thread(last_commit_time, local_path, spec_file_path)
+        # Repos without a checkout: only the spec file is fetched
+        repo: str = target.removesuffix('.git')
+        spec_file_name: str = f"{repo.split('/')[-1]}.spec"
+        url: str = ABF_RAW_FILE_URL_TEMPLATE.format(repo=repo, branch=ABF_BRANCH, path=spec_file_name)
+
+        async def fetch() -> bytes:
+            async with self.requests_handler.request('GET', url) as response:
+                if not response.ok:
+                    raise MirrorError(url, response.status)
+                return await response.read()
+        content: bytes = await self.requests_handler.retry(fetch, url)
+        content = content.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        return TextDocument(Path(spec_file_name), content.decode(errors='surrogateescape').splitlines(keepends=True)), None
+
+
+def evaluate(report: PackageStalenessReportSchema, spec_data: SpecFileDataSchema, sources: list[FileMetadataSchema], tlpdb: TlpdbSchema, ctan_versions: dict[str, str | None]) -> None:
+    package: TlpdbPackageSchema | None = tlpdb.packages.get(spec_data.short_name)
+    if package is not None:
+        report.revision = package.revision
+    if package is not None and package.catalogue_version:
+        report.ctan_version = normalize_version(package.catalogue_version)
+    else:
+        report.ctan_version = ctan_versions.get(spec_data.short_name) or ""
+    if sources:
+        report.mirror_updated_at = max(source.upload_time for source in sources)
+
+    # Same decision as UPDATE_PACKAGE makes with the version from ctan.org
+    if report.ctan_version and is_update_needed(spec_data, SpecFileDataSchema(name=spec_data.name, version=report.ctan_version)):
+        report.status = StalenessStatus.OUTDATED
+    elif report.lag is not None and report.lag.total_seconds() > 0:
+        report.status = StalenessStatus.MIRROR_CHANGED
+        report.message = "Tarballs changed on the mirror after the last spec file change"
+    elif not report.ctan_version:
+        report.status = StalenessStatus.UNKNOWN
+        report.message = "No ctan version" if sources else "Not found on the mirror and ctan"
+    else:
+        report.status = StalenessStatus.UP_TO_DATE
+
+
+def log_scan_report(report: ScanReportSchema) -> None:
+    logger.info("======Packages to update======")
+    for i, package in enumerate(report.ranked, 1):
+        versions: str = f"{package.spec_version} -> {package.ctan_version}" if package.status == StalenessStatus.OUTDATED else package.spec_version
+        lag: str = f"{package.lag.days}d" if package.lag is not None else "-"
+        logger.info(f"{i:>4}. {package.status.name:<14} | {package.name:<30} | {versions:<25} | r{package.revision:<7} | {lag:>6}")
+    for package in report.packages:
+        if package.status in (StalenessStatus.UNKNOWN, StalenessStatus.FAILED):
+            logger.info(f"{package.status.name:<14} | {package.name or package.target:<30} | {package.message}")
+    logger.info(
+        " ".join(f"{status.name}: {report.count(status)}" for status in StalenessStatus)
+    )
+
+
+def save_scan_report(report: ScanReportSchema) -> None:
+    ranked: list[PackageStalenessReportSchema] = report.ranked
+    # Packages to update come first in their ranked order
+    ordered: ScanReportSchema = ScanReportSchema(
+        created_at=report.created_at,
+        packages=ranked + [package for package in report.packages if not package.needs_update]
+    )
+    write_atomic(SCAN_REPORT_PATH, ordered.model_dump_json(indent=4))
+    logger.info(f"Scan report saved to {SCAN_REPORT_PATH}")
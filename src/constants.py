@@ -1,6 +1,7 @@
 from datetime import timedelta
 from pathlib import Path
 from enum import IntEnum
+from urllib.parse import urlparse
 import sys
 import os
 
@@ -10,17 +11,137 @@ WORK_DIR_PATH: Path = (
     if getattr(sys, 'frozen', False)\
     else Path.joinpath(Path(__file__).resolve().parents[1], TMP_FOLDER_NAME
 )
+# Environment overrides, used to run the pipeline against local stand-ins (benchmarks/bench_pipeline.py)
+if 'ABF_UPDATER_WORK_DIR' in os.environ:
+    WORK_DIR_PATH = Path(os.environ['ABF_UPDATER_WORK_DIR'])
 CRASH_LOG_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'crash.log')
 FILES_CACHE_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'mirror_cache.json')
+DAEMON_SOCKET_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'daemon.sock')
+KNOWN_HASHES_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'filestore_hashes.json')
+TARBALL_CACHE_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'tarball_cache')
+# Rehash cached tarballs before reusing them to detect corrupted entries
+TARBALL_CACHE_VERIFY_HASH: bool = True
+# Objects unused for longer are removed, then the least recently used ones until the cache fits into the size limit
+TARBALL_CACHE_MAX_AGE: timedelta = timedelta(days=90)
+TARBALL_CACHE_MAX_BYTES: int = int(os.environ.get('ABF_UPDATER_TARBALL_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+TARBALL_CACHE_PRUNE_INTERVAL: timedelta = timedelta(hours=1)
+# Member lists of every listed tarball by sha1, kept to diff package versions without decompressing them again
+TARBALL_INDEX_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'tarball_index.sqlite3')
+MIRROR_INDEX_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'mirror_index.sqlite3')
+MIRROR_INDEX_MMAP_SIZE: int = 256 * 1024 * 1024
+# Several processes may share the work dir: the index is rebuilt by one of them under this lock while the others wait
+MIRROR_INDEX_LOCK_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'mirror_index.lock')
+# Seconds a connection waits for another process writing the index
+MIRROR_INDEX_BUSY_TIMEOUT: float = 60
+# Every process checks out and downloads into its own numbered slot
+WORKSPACES_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'workspaces')
+FILE_LOCK_POLL_INTERVAL: float = 0.1
+# Stage spans as json lines and the Prometheus textfile (point ABF_UPDATER_METRICS_TEXTFILE to the node_exporter textfile directory)
+METRICS_LOG_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'metrics.jsonl')
+METRICS_TEXTFILE_PATH: Path = Path(os.environ.get('ABF_UPDATER_METRICS_TEXTFILE', Path.joinpath(WORK_DIR_PATH, 'metrics.prom')))
+METRICS_PREFIX: str = "abf_updater"
 
 SPEC_FILE_SUFFIXES: list[str] = ["spec"]
 HASH_FILE_SUFFIXES: list[str] = ["yml", "yaml"]
 ARCHITECTURES_SPECIFIC_PREFIXES: list[str] = ["armhf", "aarch64", "i386", "universal-darwin", "win", "amd64", "freebsd", "x86_64"]
 TARBALL_SUFFIX: str = "tar.xz"
+# Tarballs are rooted at texmf-dist, %files entries are matched after stripping these prefixes
+TEXMFDIST_MACROS: list[str] = ["%{_texmfdistdir}", "%_texmfdistdir"]
+# Tarball members that are never packaged (TeX Live package metadata)
+UNPACKAGED_TARBALL_PREFIXES: tuple[str, ...] = ("tlpkg/",)
+TARBALL_LISTING_WORKERS: int = min(4, os.cpu_count() or 1)
 
-MIRROR_BASE_URL: str = "https://mirror.truenetwork.ru/CTAN/systems/texlive/tlnet/archive/"
-CACHE_LIFESPAN: timedelta = timedelta(days=7)
-ABF_UPLOAD_URI: str = "http://file-store.rosalinux.ru/api/v1/upload"
+MIRROR_BASE_URL: str = os.environ.get('ABF_UPDATER_MIRROR_URL', "https://mirror.truenetwork.ru/CTAN/systems/texlive/tlnet/archive/")
+# tlnet archive directories of CTAN mirrors, ranked by a probe and used for failover (comma separated in ABF_UPDATER_MIRROR_URLS).
+# Only mirrors whose autoindex listing format is known to parse belong here
+MIRROR_URLS: list[str] = [
+    url.strip() for url in os.environ.get('ABF_UPDATER_MIRROR_URLS', '').split(',') if url.strip()
+] or [MIRROR_BASE_URL]
+MIRROR_RANKING_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'mirror_ranking.json')
+MIRROR_RANKING_LIFESPAN: timedelta = timedelta(hours=6)
+# Small file updated on every tlnet sync, its Last-Modified shows how fresh a mirror is
+MIRROR_FRESHNESS_FILE: str = "../tlpkg/texlive.tlpdb.sha512"
+# Mirrors lagging behind the freshest one by more than this are only used as a last resort
+MIRROR_MAX_LAG: timedelta = timedelta(days=1)
+# TeX Live package database: revision and catalogue (ctan) version of every package in a single download
+TLPDB_FILE: str = "../tlpkg/texlive.tlpdb.xz"
+TLPDB_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'tlpdb.json')
+MIRROR_PROBE_BYTES: int = 256 * 1024
+MIRROR_PROBE_TIMEOUT: float = 10
+# Retries on the same mirror before failing over to the next one
+MIRROR_RETRIES: int = 1
+MIRROR_LISTING_CHUNK_SIZE: int = 64 * 1024
+# A listing with fewer files than this share of the index is rejected and the next mirror is tried
+MIRROR_LISTING_MIN_RATIO: float = 0.9
+# The listing is cut into blocks of whole lines parsed in a process pool while the rest is downloading
+MIRROR_LISTING_PARSE_CHUNK_SIZE: int = 1024 * 1024
+# 1 parses on the event loop without a pool (set ABF_UPDATER_LISTING_WORKERS to override)
+MIRROR_LISTING_PARSE_WORKERS: int = int(os.environ.get('ABF_UPDATER_LISTING_WORKERS', min(4, os.cpu_count() or 1)))
+DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+# Partial downloads live in this folder of the process workspace, data/ of a checkout only holds complete tarballs
+PARTIAL_DOWNLOADS_DIR: str = ".partial"
+PARTIAL_DOWNLOAD_SUFFIX: str = ".part"
+# Received byte ranges of a partial download, used to resume it after an interruption
+PARTIAL_DOWNLOAD_STATE_SUFFIX: str = ".part.json"
+# Files at least this large are fetched as DOWNLOAD_SEGMENTS parallel Range requests
+DOWNLOAD_SEGMENT_THRESHOLD: int = 32 * 1024 * 1024
+DOWNLOAD_SEGMENTS: int = 4
+# Mirror listing is revalidated with a conditional request, so the interval can be short
+CACHE_LIFESPAN: timedelta = timedelta(hours=1)
+CTAN_BASE_URL: str = os.environ.get('ABF_UPDATER_CTAN_URL', "https://ctan.org")
+# Seconds to wait before requesting the ctan package list again after a failure
+CTAN_PACKAGES_RETRY_INTERVAL: float = 300
+# Seconds the package list and versions are reused, long-running processes (the daemon) pick up new releases after that
+CTAN_CACHE_LIFESPAN: float = CACHE_LIFESPAN.total_seconds()
+ABF_FILE_STORE_URL: str = os.environ.get('ABF_UPDATER_FILE_STORE_URL', "http://file-store.rosalinux.ru")
+ABF_UPLOAD_URI: str = f"{ABF_FILE_STORE_URL}/api/v1/upload"
+ABF_FILE_STORE_CHECK_URI: str = f"{ABF_FILE_STORE_URL}/api/v1/file_stores.json"
+ABF_REPO_URL_TEMPLATE: str = "https://abf.io/import/texlive-{}.git"
+# Single file of a repo without cloning it: repo url without .git, branch and path inside the repo
+ABF_RAW_FILE_URL_TEMPLATE: str = "{repo}/raw/{branch}/{path}"
+ABF_BRANCH: str = "rosa2023.1"
+
+# Per stage concurrency of batch updates
+BATCH_GIT_CONCURRENCY: int = 4
+BATCH_CTAN_CONCURRENCY: int = 8
+BATCH_DOWNLOAD_CONCURRENCY: int = 4
+BATCH_UPLOAD_CONCURRENCY: int = 4
+# Spec files read or fetched at once by the staleness scan
+SCAN_CONCURRENCY: int = 16
+SCAN_REPORT_PATH: Path = Path.joinpath(WORK_DIR_PATH, 'scan_report.json')
+
+# Keep existing checkouts and update them with fetch + reset instead of cloning again
+GIT_REUSE_CHECKOUTS: bool = True
+# First time clone options: history depth (None for full history), partial clone filter such as "blob:none"
+# and a branch to clone exclusively (None to clone every branch)
+GIT_CLONE_DEPTH: int | None = 1
+GIT_CLONE_FILTER: str | None = None
+GIT_CLONE_BRANCH: str | None = None
+
+# Connection pool policy of RequestsHandler
+CONNECTION_LIMIT: int = 64
+DEFAULT_HOST_CONCURRENCY: int = 8
+HOST_CONCURRENCY: dict[str, int] = {
+    **{urlparse(url).hostname: 8 for url in MIRROR_URLS},
+    urlparse(CTAN_BASE_URL).hostname: 8,
+    urlparse(ABF_UPLOAD_URI).hostname: 4
+}
+KEEPALIVE_TIMEOUT: float = 30
+DNS_CACHE_TTL: int = 600
+# Large tarballs take minutes to download, so only connect and read stalls are limited
+TOTAL_TIMEOUT: float | None = None
+CONNECT_TIMEOUT: float | None = 30
+READ_TIMEOUT: float | None = 60
+REQUEST_RETRIES: int = 4
+RETRY_BACKOFF_BASE: float = 0.5
+RETRY_BACKOFF_MAX: float = 30
+RETRYABLE_STATUSES: list[int] = [408, 429, 500, 502, 503, 504]
+
+DAEMON_HOST: str = "127.0.0.1"
+# Required by the tcp mode, any local user can connect to 127.0.0.1 (sent as "Authorization: Bearer <token>")
+DAEMON_TOKEN: str | None = os.environ.get('ABF_UPDATER_DAEMON_TOKEN') or None
+# Finished and failed jobs kept for GET /jobs, older ones are forgotten
+DAEMON_FINISHED_JOBS_LIMIT: int = 200
 
 DECLINE_VALUES: list[str] = ['n', 'no']
 ACCEPT_VALUES: list[str] = ['y', 'yes']
@@ -38,4 +159,17 @@ class PackageTypes(IntEnum):
     SOURCE = 2
     DOC = 3
 
+
+class TaskType(IntEnum):
+    UPDATE_PACKAGE = 1
+    CREATE_PACKAGE = 2
+    PARSE_MIRROR = 3
+    GET_PACKAGE_FILES = 4
+    CLONE_REMOTE_REPO = 5
+    BATCH_UPDATE_PACKAGES = 6
+    SCAN_PACKAGES = 7
+    EXIT = 8
+    AWAIT_TASK = 9
+
+
 RESERVED_TASK_TYPES: int = 1
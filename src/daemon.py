@@ -0,0 +1,219 @@
+import os
+import hmac
+import json
+import asyncio
+import argparse
+import itertools
+import logging
+
+from datetime import datetime
+from pathlib import Path
+
+from aiohttp import web
+from pydantic import ValidationError
+
+from src.actions.actions import get_user_data, create_requests_handler
+from src.actions.batch import BatchUpdater
+from src.constants import DAEMON_SOCKET_PATH, DAEMON_HOST, DAEMON_TOKEN, DAEMON_FINISHED_JOBS_LIMIT
+from src.schemas.daemon import JobSchema, JobStatus, JobType
+from src.schemas.tasks import BatchUpdateTaskDataSchema, ParseMirrorTaskDataSchema
+from src.schemas.tasks_input import to_repo_url
+from src.schemas.user_data import UserDataSchema, LoginDataSchema
+from src.services.ctan import CtanVersionProvider
+from src.services.directory_structure import create_work_dir
+from src.services.metrics import MetricsRecorder
+from src.services.mirror_index import MirrorIndex
+from src.services.tarball_index import TarballIndex
+from src.services.network_requests import RequestsHandler
+from src.services.parsers import parse_mirror
+from src.utils import create_logger, non_interactive
+
+logger = create_logger('Daemon', logging.INFO)
+
+
+class UpdaterDaemon:
+    # Keeps the http session, ctan cache, mirror index and checkouts warm between jobs
+    def __init__(self, user_data: UserDataSchema, finished_jobs_limit: int = DAEMON_FINISHED_JOBS_LIMIT):
+        self.user_data: UserDataSchema = user_data
+        self.requests_handler: RequestsHandler = create_requests_handler()
+        self.version_provider: CtanVersionProvider = CtanVersionProvider(self.requests_handler)
+        self.mirror_index: MirrorIndex | None = None
+        self.tarball_index: TarballIndex = TarballIndex()
+        self.metrics: MetricsRecorder = MetricsRecorder()
+        self.jobs: dict[int, JobSchema] = {}
+        self.finished_jobs_limit: int = finished_jobs_limit
+        self.__job_ids: itertools.count = itertools.count(1)
+        self.__queue: asyncio.Queue[int] = asyncio.Queue()
+
+    async def warm_up(self) -> None:
+        token = non_interactive.set(True)
+        try:
+            self.mirror_index = await parse_mirror(self.requests_handler)
+            await self.version_provider.known_packages()
+        finally:
+            non_interactive.reset(token)
+        logger.info("Daemon is ready")
+
+    def submit(self, job_type: JobType, data: dict) -> JobSchema:
+        job: JobSchema = JobSchema(id=next(self.__job_ids), type=job_type, data=data)
+        self.jobs[job.id] = job
+        self.__queue.put_nowait(job.id)
+        return job
+
+    async def worker(self) -> None:
+        # Jobs run one at a time so that two jobs never touch the same checkout, packages of a job run concurrently
+        while True:
+            job: JobSchema = self.jobs[await self.__queue.get()]
+            job.status = JobStatus.RUNNING
+            job.started_at = datetime.now()
+            logger.info(f"Starting job {job.id} ({job.type.name})")
+            token = non_interactive.set(True)
+            self.metrics.start_task(job.type.name)
+            try:
+                await self.__run(job)
+                job.status = JobStatus.FINISHED
+            except Exception as e:
+                job.status = JobStatus.FAILED
+                job.error = f"{type(e).__name__}: {e}"
+            finally:
+                non_interactive.reset(token)
+                self.metrics.finish_task()
+            job.finished_at = datetime.now()
+            logger.info(f"Job {job.id} {job.status.name}")
+            self.forget_finished_jobs()
+
+    def forget_finished_jobs(self) -> None:
+        # Jobs are kept in submission order, the oldest finished ones go first
+        finished: list[int] = [job.id for job in self.jobs.values() if job.status in (JobStatus.FINISHED, JobStatus.FAILED)]
+        for job_id in finished[:max(len(finished) - self.finished_jobs_limit, 0)]:
+            del self.jobs[job_id]
+
+    async def __run(self, job: JobSchema) -> None:
+        if job.type == JobType.PARSE_MIRROR:
+            data: ParseMirrorTaskDataSchema = ParseMirrorTaskDataSchema.model_validate(job.data)
+            with self.metrics.span('mirror_index') as span:
+                self.mirror_index = await parse_mirror(self.requests_handler, True, data.export_json, self.mirror_index)
+                span.files = self.mirror_index.count()
+            return
+        job.report = await BatchUpdater(
+            self.requests_handler,
+            self.version_provider,
+            self.user_data.abf_credentials,
+            BatchUpdateTaskDataSchema.model_validate(job.data),
+            self.mirror_index,
+            self.metrics,
+            self.tarball_index
+        ).run()
+
+
+def create_app(daemon: UpdaterDaemon, token: str | None = None) -> web.Application:
+    @web.middleware
+    async def authenticate(request: web.Request, handler) -> web.StreamResponse:
+        if token is not None and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            return web.json_response({'error': 'Missing or invalid token'}, status=401)
+        return await handler(request)
+
+    def bad_request(message: str) -> web.HTTPBadRequest:
+        return web.HTTPBadRequest(text=json.dumps({'error': message}), content_type='application/json')
+
+    async def submit_job(request: web.Request) -> web.Response:
+        try:
+            payload: dict = await request.json()
+        except json.JSONDecodeError as e:
+            raise bad_request(f"Request body is not valid JSON ({e})")
+        if not isinstance(payload, dict):
+            raise bad_request("Request body must be a JSON object")
+        job_type_name: str = str(payload.pop('type', '')).upper()
+        if job_type_name not in JobType.__members__:
+            return web.json_response({'error': f"Unknown job type, expected one of {list(JobType.__members__)}"}, status=400)
+        job_type: JobType = JobType[job_type_name]
+        try:
+            if job_type == JobType.UPDATE:
+                repo_urls: any = payload.get('repo_urls', [])
+                # Anything but a list is left to the schema to reject
+                if isinstance(repo_urls, list):
+                    payload['repo_urls'] = [to_repo_url(str(target)) for target in repo_urls]
+                data: dict = BatchUpdateTaskDataSchema.model_validate(payload).model_dump()
+            else:
+                data = ParseMirrorTaskDataSchema.model_validate(payload).model_dump()
+        except ValidationError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        return web.json_response(daemon.submit(job_type, data).model_dump(mode='json'), status=202)
+
+    async def list_jobs(request: web.Request) -> web.Response:
+        return web.json_response([job.model_dump(mode='json', exclude={'report'}) for job in daemon.jobs.values()])
+
+    async def get_job(request: web.Request) -> web.Response:
+        job: JobSchema | None = daemon.jobs.get(int(request.match_info['job_id']))
+        if job is None:
+            return web.json_response({'error': 'Job not found'}, status=404)
+        return web.json_response(job.model_dump(mode='json'))
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response({host: stats.model_dump() for host, stats in daemon.requests_handler.host_stats.items()})
+
+    async def get_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=daemon.metrics.render_textfile(), content_type='text/plain')
+
+    app: web.Application = web.Application(middlewares=[authenticate])
+    app.router.add_post('/jobs', submit_job)
+    app.router.add_get('/jobs', list_jobs)
+    app.router.add_get(r'/jobs/{job_id:\d+}', get_job)
+    app.router.add_get('/stats', get_stats)
+    app.router.add_get('/metrics', get_metrics)
+    return app
+
+
+def get_daemon_user_data() -> UserDataSchema:
+    # Credentials can be provided through the environment to start the daemon unattended
+    email: str | None = os.environ.get('ABF_EMAIL')
+    password: str | None = os.environ.get('ABF_PASSWORD')
+    if email and password:
+        return UserDataSchema(abf_credentials=LoginDataSchema(email=email, password=password))
+    return get_user_data()
+
+
+async def start_site(runner: web.AppRunner, socket_path: Path | None, port: int | None) -> None:
+    if port is not None:
+        site: web.BaseSite = web.TCPSite(runner, DAEMON_HOST, port)
+        logger.info(f"Listening on http://{DAEMON_HOST}:{port}")
+        await site.start()
+        return
+    socket_path.unlink(missing_ok=True)
+    site = web.UnixSite(runner, str(socket_path))
+    logger.info(f"Listening on {socket_path}")
+    # The socket is created accessible to the owner only, no other local user can connect
+    umask: int = os.umask(0o177)
+    try:
+        await site.start()
+    finally:
+        os.umask(umask)
+
+
+async def serve(socket_path: Path | None, port: int | None, token: str | None = None) -> None:
+    # Jobs push with the stored ABF credentials, so only the owner of the daemon may submit them
+    create_work_dir()
+    daemon: UpdaterDaemon = UpdaterDaemon(get_daemon_user_data())
+    await daemon.warm_up()
+    runner: web.AppRunner = web.AppRunner(create_app(daemon, token))
+    await runner.setup()
+    await start_site(runner, socket_path, port)
+    try:
+        await daemon.worker()
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the updater as a daemon accepting jobs over http")
+    parser.add_argument('--socket', type=Path, default=DAEMON_SOCKET_PATH, help="Unix socket to listen on")
+    parser.add_argument('--port', type=int, help=f"Listen on {DAEMON_HOST}:<port> instead of a unix socket, requires a token")
+    parser.add_argument('--token', default=DAEMON_TOKEN, help="Token clients send as \"Authorization: Bearer <token>\" (ABF_UPDATER_DAEMON_TOKEN)")
+    args = parser.parse_args()
+    if args.port is not None and not args.token:
+        parser.error("--port requires a token (--token or ABF_UPDATER_DAEMON_TOKEN), every local user can connect to it")
+    asyncio.run(serve(args.socket, args.port, args.token))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,24 @@
 import asyncio
 import logging
+import threading
 
-from src.constants import ExitStatus
-from src.schemas.tasks import TaskType
+from src.constants import ExitStatus, TaskType
 
 from src.actions.TaskHandler import TaskHandler
-from src.actions.actions import get_user_data, get_task
+from src.actions.actions import get_user_data, get_task, preload_modules
 
 from src.utils import create_logger, check_for_exit_condition
 
 # TODO account for pearl and macros in spec file
 # TODO Non default hash file
 # TODO add automatic build request
-# TODO Handle file structure change
+# TODO Handle file structure change (added and removed tarball files are only reported, %files is not updated)
 
 logger = create_logger('Root', logging.INFO)
 
 async def main():
     selected_task: TaskType = TaskType.AWAIT_TASK
+    threading.Thread(target=preload_modules, daemon=True).start()
     task_handler: TaskHandler = TaskHandler(get_user_data())
 
     while selected_task != TaskType.EXIT:
@@ -0,0 +1,12 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class TarballCacheEntrySchema(BaseModel):
+    file_name: str
+    upload_time: datetime
+    size: float
+    # Integrity metadata of the stored object
+    sha1: str
+    size_bytes: int
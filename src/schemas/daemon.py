@@ -0,0 +1,34 @@
+from datetime import datetime
+from enum import IntEnum
+
+from pydantic import BaseModel, Field, field_serializer
+
+from src.schemas.reports import BatchReportSchema
+
+
+class JobType(IntEnum):
+    UPDATE = 1
+    PARSE_MIRROR = 2
+
+
+class JobStatus(IntEnum):
+    QUEUED = 1
+    RUNNING = 2
+    FINISHED = 3
+    FAILED = 4
+
+
+class JobSchema(BaseModel):
+    id: int
+    type: JobType
+    status: JobStatus = Field(default=JobStatus.QUEUED)
+    data: dict = Field(default_factory=dict)
+    submitted_at: datetime = Field(default_factory=datetime.now)
+    started_at: datetime | None = Field(default=None)
+    finished_at: datetime | None = Field(default=None)
+    report: BatchReportSchema | None = Field(default=None)
+    error: str = Field(default="")
+
+    @field_serializer('type', 'status', when_used='json')
+    def serialize_enum(self, value: IntEnum) -> str:
+        return value.name
@@ -0,0 +1,61 @@
+from datetime import datetime
+from enum import IntEnum
+
+from pydantic import BaseModel, Field, field_serializer
+
+
+class SpanStatus(IntEnum):
+    OK = 1
+    FAILED = 2
+
+
+class SpanSchema(BaseModel):
+    task: str
+    stage: str
+    package: str = Field(default="")
+    started_at: datetime = Field(default_factory=datetime.now)
+    duration: float = Field(default=0)
+    status: SpanStatus = Field(default=SpanStatus.OK)
+    # Filled by the stage: bytes downloaded/uploaded, number of processed files and cache usage
+    bytes: int = Field(default=0)
+    files: int = Field(default=0)
+    cache_hits: int = Field(default=0)
+    cache_misses: int = Field(default=0)
+
+    @field_serializer('status', when_used='json')
+    def serialize_status(self, status: SpanStatus) -> str:
+        return status.name
+
+    def record_cache(self, hit: bool) -> None:
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+
+class StageTotalsSchema(BaseModel):
+    count: int = Field(default=0)
+    failures: int = Field(default=0)
+    duration: float = Field(default=0)
+    bytes: int = Field(default=0)
+    files: int = Field(default=0)
+    cache_hits: int = Field(default=0)
+    cache_misses: int = Field(default=0)
+
+    @property
+    def throughput(self) -> float:
+        # Bytes per second
+        return self.bytes / self.duration if self.duration > 0 else 0
+
+    def add(self, span: SpanSchema) -> None:
+        self.count += 1
+        self.failures += span.status == SpanStatus.FAILED
+        self.duration += span.duration
+        self.bytes += span.bytes
+        self.files += span.files
+        self.cache_hits += span.cache_hits
+        self.cache_misses += span.cache_misses
+
+    def merge(self, other: 'StageTotalsSchema') -> None:
+        for field in StageTotalsSchema.model_fields:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+from src.constants import MIRROR_PROBE_BYTES
+
+
+class MirrorProbeSchema(BaseModel):
+    url: str
+    # Seconds until the response headers of the freshness file arrive
+    latency: float | None = Field(default=None)
+    # Bytes per second while reading the beginning of the archive listing
+    throughput: float | None = Field(default=None)
+    last_modified: datetime | None = Field(default=None)
+    stale: bool = Field(default=False)
+    error: str = Field(default="")
+
+    @property
+    def score(self) -> float:
+        # Estimated time to fetch MIRROR_PROBE_BYTES, lower is better
+        if self.latency is None or not self.throughput:
+            return float('inf')
+        return self.latency + MIRROR_PROBE_BYTES / self.throughput
+
+
+class MirrorRankingSchema(BaseModel):
+    checked_at: datetime = Field(default_factory=datetime.now)
+    probes: list[MirrorProbeSchema] = Field(default_factory=list)
+
+    @property
+    def urls(self) -> list[str]:
+        # Fresh mirrors by score, then stale ones and unreachable ones as a last resort
+        return [
+            probe.url
+            for probe in sorted(self.probes, key=lambda x: (bool(x.error), x.stale, x.score))
+        ]
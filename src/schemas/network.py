@@ -0,0 +1,44 @@
+from pydantic import BaseModel, Field
+
+from src.constants import (
+    CONNECTION_LIMIT, DEFAULT_HOST_CONCURRENCY, HOST_CONCURRENCY, KEEPALIVE_TIMEOUT, DNS_CACHE_TTL,
+    TOTAL_TIMEOUT, CONNECT_TIMEOUT, READ_TIMEOUT, REQUEST_RETRIES, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX
+)
+
+
+class ConnectionPolicySchema(BaseModel):
+    limit: int = Field(default=CONNECTION_LIMIT)
+    default_host_concurrency: int = Field(default=DEFAULT_HOST_CONCURRENCY)
+    host_concurrency: dict[str, int] = Field(default_factory=lambda: dict(HOST_CONCURRENCY))
+    keepalive_timeout: float = Field(default=KEEPALIVE_TIMEOUT)
+    dns_cache_ttl: int = Field(default=DNS_CACHE_TTL)
+    total_timeout: float | None = Field(default=TOTAL_TIMEOUT)
+    connect_timeout: float | None = Field(default=CONNECT_TIMEOUT)
+    read_timeout: float | None = Field(default=READ_TIMEOUT)
+    retries: int = Field(default=REQUEST_RETRIES)
+    backoff_base: float = Field(default=RETRY_BACKOFF_BASE)
+    backoff_max: float = Field(default=RETRY_BACKOFF_MAX)
+
+    def concurrency(self, host: str) -> int:
+        return self.host_concurrency.get(host, self.default_host_concurrency)
+
+
+class HostStatsSchema(BaseModel):
+    requests: int = Field(default=0)
+    responses: int = Field(default=0)
+    failures: int = Field(default=0)
+    retries: int = Field(default=0)
+    in_flight: int = Field(default=0)
+    waiting: int = Field(default=0)
+    # Time until response headers arrive, in seconds
+    total_latency: float = Field(default=0)
+    max_latency: float = Field(default=0)
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.responses if self.responses > 0 else 0
+
+    def record_latency(self, latency: float) -> None:
+        self.responses += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
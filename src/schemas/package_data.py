@@ -1,8 +1,9 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from pathlib import Path
 from collections import defaultdict
 from src.constants import PackageTypes
-from typing import DefaultDict, Annotated
+from typing import DefaultDict, Annotated, NamedTuple
 
 
 class IncludedFileSchema(BaseModel):
@@ -31,11 +32,69 @@ class SpecFileDataSchema(BaseModel):
         return f"Name: {self.name} Version: {self.version} Release: {self.release}"
 
 
+class PackageVersions(NamedTuple):
+    # Spec file data before and after the update
+    old: SpecFileDataSchema
+    new: SpecFileDataSchema
+
+
+class MirrorListingEntry(NamedTuple):
+    file_name: str
+    upload_date: str
+    size: str
+
+
 class FileMetadataSchema(BaseModel):
     version: str = Field(default='')
     type: PackageTypes
     upload_time: datetime
     size: float
+    # Exact size from the mirror listing, 0 if the listing only gives a rounded one
+    size_bytes: int = Field(default=0)
+
+
+class DownloadedFileSchema(BaseModel):
+    path: Path
+    type: PackageTypes
+    sha1: str
+    from_cache: bool = Field(default=False)
+    # Set once the file is sent to filestore, files already stored there are not uploaded
+    uploaded: bool = Field(default=False)
+
+
+class DownloadSegmentSchema(BaseModel):
+    start: int
+    # Exclusive, None until the size of the file is known
+    end: int | None = Field(default=None)
+    received: int = Field(default=0)
+
+    @property
+    def offset(self) -> int:
+        return self.start + self.received
+
+    @property
+    def is_complete(self) -> bool:
+        return self.end is not None and self.offset >= self.end
+
+    @property
+    def range_header(self) -> str:
+        return f"bytes={self.offset}-{self.end - 1 if self.end is not None else ''}"
+
+
+class PartialDownloadSchema(BaseModel):
+    # Mirror metadata of the file being downloaded, a partial file of another upload is never resumed
+    upload_time: datetime
+    size: float
+    size_bytes: int = Field(default=0)
+    segments: list[DownloadSegmentSchema] = Field(default_factory=list)
+
+    @property
+    def received(self) -> int:
+        return sum(segment.received for segment in self.segments)
+
+    def matches(self, source_data: FileMetadataSchema) -> bool:
+        return self.upload_time == source_data.upload_time and self.size == source_data.size \
+            and source_data.size_bytes in (0, self.size_bytes)
 
 
 class PackageMetadataSchema(BaseModel):
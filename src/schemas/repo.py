@@ -2,7 +2,7 @@ from pathlib import Path
 from git import Repo
 from pydantic import BaseModel
 
-from src.constants import WORK_DIR_PATH
+from src.services.work_dir import workspace_path
 
 
 class RepoDataSchema(BaseModel):
@@ -12,7 +12,7 @@ class RepoDataSchema(BaseModel):
 
     @property
     def path(self) -> Path:
-        return Path.joinpath(WORK_DIR_PATH, self.name)
+        return Path.joinpath(workspace_path(), self.name)
 
     @property
     def data_path(self) -> Path:
@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from enum import IntEnum
+
+from pydantic import BaseModel, Field, field_serializer
+
+from src.constants import PackageTypes
+
+
+class UpdateStatus(IntEnum):
+    UPDATED = 1
+    PREPARED = 2
+    UP_TO_DATE = 3
+    FAILED = 4
+
+
+class PackageUpdateReportSchema(BaseModel):
+    repo_url: str
+    name: str = Field(default="")
+    status: UpdateStatus = Field(default=UpdateStatus.FAILED)
+    old_version: str = Field(default="")
+    new_version: str = Field(default="")
+    message: str = Field(default="")
+    duration: float = Field(default=0)
+
+    @field_serializer('status', when_used='json')
+    def serialize_status(self, status: UpdateStatus) -> str:
+        return status.name
+
+
+class BatchReportSchema(BaseModel):
+    packages: list[PackageUpdateReportSchema] = Field(default_factory=list)
+
+    def count(self, status: UpdateStatus) -> int:
+        return sum(package.status == status for package in self.packages)
+
+    @property
+    def failed(self) -> list[PackageUpdateReportSchema]:
+        return [package for package in self.packages if package.status == UpdateStatus.FAILED]
+
+
+class StalenessStatus(IntEnum):
+    # Ordered by urgency, the scan report is ranked by it
+    OUTDATED = 1
+    MIRROR_CHANGED = 2
+    UP_TO_DATE = 3
+    UNKNOWN = 4
+    FAILED = 5
+
+
+class PackageStalenessReportSchema(BaseModel):
+    target: str
+    name: str = Field(default="")
+    status: StalenessStatus = Field(default=StalenessStatus.FAILED)
+    spec_version: str = Field(default="")
+    ctan_version: str = Field(default="")
+    revision: int = Field(default=0)
+    # Last commit touching the spec file and newest upload of the package tarballs to the mirror
+    spec_updated_at: datetime | None = Field(default=None)
+    mirror_updated_at: datetime | None = Field(default=None)
+    message: str = Field(default="")
+
+    @field_serializer('status', when_used='json')
+    def serialize_status(self, status: StalenessStatus) -> str:
+        return status.name
+
+    @property
+    def lag(self) -> timedelta | None:
+        # How long the mirror has had tarballs newer than the spec file
+        if self.spec_updated_at is None or self.mirror_updated_at is None:
+            return None
+        return self.mirror_updated_at - self.spec_updated_at
+
+    @property
+    def needs_update(self) -> bool:
+        return self.status in (StalenessStatus.OUTDATED, StalenessStatus.MIRROR_CHANGED)
+
+
+class ScanReportSchema(BaseModel):
+    created_at: datetime = Field(default_factory=datetime.now)
+    packages: list[PackageStalenessReportSchema] = Field(default_factory=list)
+
+    def count(self, status: StalenessStatus) -> int:
+        return sum(package.status == status for package in self.packages)
+
+    @property
+    def ranked(self) -> list[PackageStalenessReportSchema]:
+        # Outdated versions first, then the longest unhandled mirror updates
+        return sorted(
+            [package for package in self.packages if package.needs_update],
+            key=lambda x: (x.status, x.lag is None, -x.lag.total_seconds() if x.lag is not None else 0, x.name)
+        )
+
+
+class TarballDiffSchema(BaseModel):
+    file_name: str
+    type: PackageTypes
+    old_sha1: str = Field(default="")
+    new_sha1: str
+    # False when the previous tarball was never indexed, nothing is known about the change then
+    known: bool = Field(default=False)
+    added: list[str] = Field(default_factory=list)
+    removed: list[str] = Field(default_factory=list)
+    # Present in both with a different size or mode
+    changed: list[str] = Field(default_factory=list)
+    # Added files already shipped by the current tarballs of other packages (path => packages), rpm would report a file conflict
+    conflicts: dict[str, list[str]] = Field(default_factory=dict)
+
+    @property
+    def is_structure_changed(self) -> bool:
+        return bool(self.added or self.removed)
+
+    def __str__(self) -> str:
+        conflicts: str = f" !{len(self.conflicts)}" if self.conflicts else ""
+        return f"{self.file_name}: +{len(self.added)} -{len(self.removed)} ~{len(self.changed)}{conflicts}"
+
+
+class FilesVerificationReportSchema(BaseModel):
+    missing: dict[PackageTypes, list[str]] = Field(default_factory=dict)
+    unclaimed: dict[PackageTypes, list[str]] = Field(default_factory=dict)
+    skipped: list[str] = Field(default_factory=list)
+
+    @property
+    def is_ok(self) -> bool:
+        return not self.missing and not self.unclaimed
+
+    def __str__(self) -> str:
+        return f"Missing: {sum(map(len, self.missing.values()))} Unclaimed: {sum(map(len, self.unclaimed.values()))}"
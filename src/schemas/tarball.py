@@ -0,0 +1,8 @@
+from typing import NamedTuple
+
+
+class TarballMember(NamedTuple):
+    path: str
+    size: int
+    mode: int
+    is_dir: bool
@@ -1,8 +1,8 @@
-from enum import IntEnum
 from typing import Self
 
 from pydantic import BaseModel
 
+from src.constants import BATCH_GIT_CONCURRENCY, BATCH_CTAN_CONCURRENCY, BATCH_DOWNLOAD_CONCURRENCY, BATCH_UPLOAD_CONCURRENCY, SCAN_CONCURRENCY
 from src.utils import handle_bool_input
 import src.schemas.tasks_input as cli_input
 
@@ -22,6 +22,46 @@ class UpdatePackageTaskDataSchema(TaskData):
             delete_comments=handle_bool_input("Remove present comments y/n? ")
         )
 
+class BatchUpdateTaskDataSchema(TaskData):
+    repo_urls: list[str]
+    delete_comments: bool
+    push: bool
+    git_concurrency: int = BATCH_GIT_CONCURRENCY
+    ctan_concurrency: int = BATCH_CTAN_CONCURRENCY
+    download_concurrency: int = BATCH_DOWNLOAD_CONCURRENCY
+    upload_concurrency: int = BATCH_UPLOAD_CONCURRENCY
+
+    @classmethod
+    def from_cli(cls) -> Self:
+        return BatchUpdateTaskDataSchema(
+            repo_urls=cli_input.get_repo_urls(),
+            delete_comments=handle_bool_input("Remove present comments y/n? "),
+            push=handle_bool_input("Push updated packages without confirmation y/n? ")
+        )
+
+class ScanPackagesTaskDataSchema(TaskData):
+    # Repo urls or paths to existing checkouts
+    targets: list[str]
+    # Ask the ctan json api for packages without a catalogue version in the TeX Live package database
+    ctan_fallback: bool = False
+    concurrency: int = SCAN_CONCURRENCY
+
+    @classmethod
+    def from_cli(cls) -> Self:
+        return ScanPackagesTaskDataSchema(
+            targets=cli_input.get_scan_targets(),
+            ctan_fallback=handle_bool_input("Query ctan.org for packages without a catalogue version y/n? ")
+        )
+
+class ParseMirrorTaskDataSchema(TaskData):
+    export_json: bool
+
+    @classmethod
+    def from_cli(cls) -> Self:
+        return ParseMirrorTaskDataSchema(
+            export_json=handle_bool_input("Export mirror index to mirror_cache.json y/n? ")
+        )
+
 class CloneRemoteRepoTaskDataSchema(TaskData):
     repo_url: str
 
@@ -29,12 +69,3 @@ class CloneRemoteRepoTaskDataSchema(TaskData):
     def from_cli(cls) -> Self:
         return CloneRemoteRepoTaskDataSchema(repo_url=cli_input.get_repo_url())
 
-
-class TaskType(IntEnum):
-    UPDATE_PACKAGE = 1
-    CREATE_PACKAGE = 2
-    PARSE_MIRROR = 3
-    GET_PACKAGE_FILES = 4
-    CLONE_REMOTE_REPO = 5
-    EXIT = 6
-    AWAIT_TASK = 7
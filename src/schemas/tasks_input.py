@@ -1,3 +1,6 @@
+from pathlib import Path
+
+from src.constants import ABF_REPO_URL_TEMPLATE
 from src.utils import handle_input
 
 def get_repo_url() -> str:
@@ -5,3 +8,21 @@ def get_repo_url() -> str:
         "Type repo url to update: ",
         lambda x: x[-4:] == '.git' and not x.startswith('git')
     )
+
+def to_repo_url(target: str) -> str:
+    if target.endswith('.git'):
+        return target
+    return ABF_REPO_URL_TEMPLATE.format(target.removeprefix('texlive-'))
+
+def get_targets(text: str) -> list[str]:
+    user_input: str = handle_input(text, lambda x: x.strip() != '')
+    return Path(user_input).read_text().split() if Path(user_input).is_file() else user_input.split()
+
+def get_repo_urls() -> list[str]:
+    targets: list[str] = get_targets("Type repo urls or package names separated by spaces (or a path to a file listing them): ")
+    # Preserve the order while dropping duplicates
+    return list(dict.fromkeys(to_repo_url(target) for target in targets))
+
+def get_scan_targets() -> list[str]:
+    targets: list[str] = get_targets("Type repo urls, package names or checkout paths separated by spaces (or a path to a file listing them): ")
+    return list(dict.fromkeys(target if Path(target).is_dir() else to_repo_url(target) for target in targets))
@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+
+class TlpdbPackageSchema(BaseModel):
+    revision: int = Field(default=0)
+    # Version from the ctan catalogue, empty for packages not described there
+    catalogue_version: str = Field(default="")
+
+
+class TlpdbSchema(BaseModel):
+    checked_at: datetime = Field(default_factory=datetime.now)
+    source_url: str = Field(default="")
+    etag: str = Field(default="")
+    last_modified: str = Field(default="")
+    packages: dict[str, TlpdbPackageSchema] = Field(default_factory=dict)
+
+    @property
+    def validators(self) -> dict[str, str]:
+        validators: dict[str, str] = {}
+        if self.etag:
+            validators["If-None-Match"] = self.etag
+        if self.last_modified:
+            validators["If-Modified-Since"] = self.last_modified
+        return validators
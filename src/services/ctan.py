@@ -0,0 +1,105 @@
+import time
+import asyncio
+import logging
+
+from src.constants import CTAN_BASE_URL, CTAN_PACKAGES_RETRY_INTERVAL, CTAN_CACHE_LIFESPAN
+from src.schemas.package_data import SpecFileDataSchema
+from src.services.network_requests import RequestsHandler, RETRYABLE_ERRORS
+from src.services.parsers import parse_package_data
+from src.utils import check_for_exit_condition, create_logger
+
+logger = create_logger('Ctan', logging.INFO)
+
+
+def normalize_version(version: str) -> str:
+    # Same normalization as the "version" row of the ctan.org package page: "1.2 2020-01-01" => "1.2"
+    return version.strip().split()[0].replace('-', '') if version.strip() else ''
+
+
+class CtanVersionProvider:
+    def __init__(self, requests_handler: RequestsHandler, base_url: str = CTAN_BASE_URL, cache_lifespan: float = CTAN_CACHE_LIFESPAN):
+        self.requests_handler: RequestsHandler = requests_handler
+        self.base_url: str = base_url.rstrip('/')
+        self.cache_lifespan: float = cache_lifespan
+        # name => (version, time.monotonic() of the request)
+        self.__versions: dict[str, tuple[str, float]] = {}
+        self.__known_packages: set[str] | None = None
+        self.__known_packages_fetched_at: float | None = None
+        self.__known_packages_lock: asyncio.Lock = asyncio.Lock()
+        self.__known_packages_failed_at: float | None = None
+
+    async def __get_json(self, path: str) -> any:
+        url: str = f"{self.base_url}{path}"
+
+        async def fetch() -> any:
+            async with self.requests_handler.request('GET', url) as response:
+                if not response.ok:
+                    return None
+                return await response.json(content_type=None)
+        return await self.requests_handler.retry(fetch, url)
+
+    async def known_packages(self) -> set[str] | None:
+        # A single request lists every package on ctan, unknown names are rejected without a request of their own
+        async with self.__known_packages_lock:
+            if (self.__known_packages is not None and self.__is_fresh(self.__known_packages_fetched_at)) or self.__is_backing_off():
+                # An expired list is still used while ctan is unavailable
+                return self.__known_packages
+            packages: list[dict] | None = None
+            try:
+                packages = await self.__get_json("/json/2.0/packages")
+            except RETRYABLE_ERRORS as e:
+                logger.warning(f"Failed to fetch ctan package list: {e}")
+            if isinstance(packages, list):
+                self.__known_packages = {package['key'] for package in packages if 'key' in package}
+                self.__known_packages_fetched_at = time.monotonic()
+            else:
+                self.__known_packages_failed_at = time.monotonic()
+            return self.__known_packages
+
+    def __is_fresh(self, fetched_at: float | None) -> bool:
+        return fetched_at is not None and time.monotonic() - fetched_at < self.cache_lifespan
+
+    def __is_backing_off(self) -> bool:
+        # Do not request the package list for every package while ctan is unavailable
+        return self.__known_packages_failed_at is not None and time.monotonic() - self.__known_packages_failed_at < CTAN_PACKAGES_RETRY_INTERVAL
+
+    async def __fetch_version(self, name: str) -> str | None:
+        try:
+            package: dict | None = await self.__get_json(f"/json/2.0/pkg/{name}")
+        except RETRYABLE_ERRORS as e:
+            logger.warning(f"Failed to fetch {name} from ctan json api: {e}")
+            return None
+        if not isinstance(package, dict) or not isinstance(package.get('version'), dict):
+            return None
+        version_data: dict = package['version']
+        return normalize_version(version_data.get('number') or version_data.get('date') or '') or None
+
+    async def get_version(self, name: str) -> str | None:
+        cached: tuple[str, float] | None = self.__versions.get(name)
+        if cached is not None and self.__is_fresh(cached[1]):
+            return cached[0]
+        known_packages: set[str] | None = await self.known_packages()
+        if known_packages is not None and name not in known_packages:
+            return None
+        version: str | None = await self.__fetch_version(name)
+        if version is not None:
+            self.__versions[name] = (version, time.monotonic())
+        return version
+
+    async def get_versions(self, names: list[str]) -> dict[str, str | None]:
+        await self.known_packages()
+        unique_names: list[str] = list(dict.fromkeys(names))
+        versions: list[str | None] = await asyncio.gather(*[self.get_version(name) for name in unique_names])
+        return dict(zip(unique_names, versions))
+
+    async def get_package_data(self, package_data: SpecFileDataSchema) -> SpecFileDataSchema:
+        version: str | None = await self.get_version(package_data.short_name)
+        if version is not None:
+            return SpecFileDataSchema(name=package_data.name, version=version)
+        known_packages: set[str] | None = await self.known_packages()
+        check_for_exit_condition(
+            known_packages is not None and package_data.short_name not in known_packages,
+            message="Failed to retrieve package data. Package not found on ctan.org"
+        )
+        logger.info("Ctan json api is unavailable, falling back to the package page")
+        return await parse_package_data(self.requests_handler, package_data, self.base_url)
@@ -1,11 +1,15 @@
+import asyncio
 import tarfile
 
+from concurrent.futures import ProcessPoolExecutor
+
 from git import rmtree
 from pathlib import Path
 
 from src.schemas.package_data import SpecFileDataSchema
+from src.schemas.tarball import TarballMember
 from src.utils import check_for_exit_condition, create_logger
-from src.constants import WORK_DIR_PATH, PackageTypes, TARBALL_SUFFIX, SPEC_FILE_SUFFIXES, HASH_FILE_SUFFIXES
+from src.constants import WORK_DIR_PATH, PackageTypes, TARBALL_SUFFIX, SPEC_FILE_SUFFIXES, HASH_FILE_SUFFIXES, TARBALL_LISTING_WORKERS
 
 import os
 import logging
@@ -14,15 +18,25 @@ logger = create_logger('DirStructure', logging.INFO)
 
 
 def create_work_dir():
-    if WORK_DIR_PATH.is_dir():
-        return
-    os.mkdir(WORK_DIR_PATH)
+    # Parallel instances may create it at the same time
+    WORK_DIR_PATH.mkdir(parents=True, exist_ok=True)
 
 def create_repo_subfolders(repo_path: Path) -> Path:
     data_path: Path = Path.joinpath(repo_path, 'data')
     os.mkdir(data_path)
     return data_path
 
+def clear_stale_sources(data_path: Path, keep: set[str]) -> None:
+    # Tarballs of a previous version or of source types no longer shipped would be listed and verified as well
+    for path in data_path.iterdir():
+        if path.name in keep:
+            continue
+        if path.is_dir():
+            rmtree(path)
+        else:
+            path.unlink()
+
+
 def sources_save_path(package_name: str, repo_data_path: Path, source_type: PackageTypes) -> [str, Path]:
     extra: str = ""
     if source_type == PackageTypes.SOURCE:
@@ -47,19 +61,45 @@ def verify_file_presence(repo_path: Path) -> tuple[Path, Path]:
         elif suffix in HASH_FILE_SUFFIXES:
             hash_file_name = file
 
-    check_for_exit_condition(hash_file_name, lambda x: x == "", message="Spec file not found")
+    check_for_exit_condition(spec_file_name, lambda x: x == "", message="Spec file not found")
     check_for_exit_condition(hash_file_name, lambda x: x == "", message="Hash file not found")
 
     return Path.joinpath(repo_path, spec_file_name), Path.joinpath(repo_path, hash_file_name)
 
 
-def log_tarballs_structure(data_path: Path):
-    for file_name in os.listdir(data_path):
-        tarball = tarfile.open(Path.joinpath(data_path, file_name), "r:xz")
+def list_tarball(tarball_path: Path) -> list[TarballMember]:
+    # Stream mode reads member headers sequentially and skips file contents without random access
+    with tarfile.open(tarball_path, "r|xz") as tarball:
+        return [TarballMember(member.name, member.size, member.mode, member.isdir()) for member in tarball]
+
+
+async def list_tarballs(data_path: Path, known: dict[str, list[TarballMember]] | None = None) -> dict[str, list[TarballMember]]:
+    # known: members of tarballs listed before (tarball index), these are not decompressed again
+    known = known or {}
+    all_file_names: list[str] = sorted(file_name for file_name in os.listdir(data_path) if file_name.endswith(TARBALL_SUFFIX))
+    file_names: list[str] = [file_name for file_name in all_file_names if file_name not in known]
+    listed: dict[str, list[TarballMember]] = {}
+    if file_names:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        # Decompression is CPU bound, every tarball is listed in its own process off the event loop
+        pool: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=min(len(file_names), TARBALL_LISTING_WORKERS))
+        try:
+            members: list[list[TarballMember]] = await asyncio.gather(*[
+                loop.run_in_executor(pool, list_tarball, Path.joinpath(data_path, file_name))
+                for file_name in file_names
+            ])
+        finally:
+            # Waiting for the workers to exit must not block the event loop, tarballs not yet listed are dropped on failure
+            await asyncio.to_thread(pool.shutdown, cancel_futures=True)
+        listed = dict(zip(file_names, members))
+    return {file_name: known[file_name] if file_name in known else listed[file_name] for file_name in all_file_names}
+
+
+def log_tarballs_structure(tarballs: dict[str, list[TarballMember]]):
+    for file_name, members in tarballs.items():
         logger.info(f'======Файловая структура "{file_name}"======')
-        for name in tarball.getnames():
-            logger.info(name)
-        tarball.close()
+        for member in members:
+            logger.info(member.path)
 
 
 def log_package_files(package_data: SpecFileDataSchema):
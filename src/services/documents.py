@@ -0,0 +1,49 @@
+import stat
+
+from pathlib import Path
+from typing import Callable, Iterator, Self
+
+from src.services.work_dir import write_atomic
+
+
+class TextDocument:
+    def __init__(self, path: Path, lines: list[str], modified: bool = False):
+        self.path: Path = path
+        self.lines: list[str] = lines
+        self.modified: bool = modified
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        with open(path, 'rb') as file:
+            raw_content: bytes = file.read()
+        # Replace CRLF (Windows-style) and CR (old Mac-style) with LF (Unix-style)
+        content: bytes = raw_content.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        return cls(path, content.decode(errors='surrogateescape').splitlines(keepends=True), content != raw_content)
+
+    def sections(self) -> Iterator[tuple[int, str, str, list[str]]]:
+        for i, line in enumerate(self.lines):
+            words: list[str] = line.split()
+            if not words:
+                continue
+            section: str = words[0].replace('"', '').replace(':', '').lower()
+            yield i, section, line, words
+
+    def scan(self, action: Callable) -> None:
+        for _, section, line, words in self.sections():
+            action(section, line, words)
+
+    def edit(self, action: Callable, remove_single_quotes: bool = True) -> None:
+        for i, section, line, words in self.sections():
+            new_content: str = action(section, line, words)
+            if remove_single_quotes:
+                new_content = new_content.replace("'", '')
+            if new_content != line:
+                self.lines[i] = new_content
+                self.modified = True
+
+    def save(self) -> None:
+        if not self.modified:
+            return
+        # Keeps the permissions of the original file, such as the executable bit of scripts
+        write_atomic(self.path, ''.join(self.lines).encode(errors='surrogateescape'), stat.S_IMODE(self.path.stat().st_mode))
+        self.modified = False
@@ -1,14 +1,14 @@
 import logging
 
 from src.schemas.package_data import SpecFileDataSchema, PackageTypes, IncludedFileSchema
-from src.utils import iter_file, check_for_exit_condition, create_logger
-from pathlib import Path
+from src.services.documents import TextDocument
+from src.utils import check_for_exit_condition, create_logger
 
 logger = create_logger("FileParser", logging.INFO)
 
 
-def parse_spec_file(spec_file_path: Path) -> SpecFileDataSchema:
-    logger.info("Parsing spec file for package data")
+def parse_spec_file(spec_document: TextDocument) -> SpecFileDataSchema:
+    logger.debug("Parsing spec file for package data")
     package_data: SpecFileDataSchema = SpecFileDataSchema()
 
     def executor(section: str, current_line: str, words: list[str]):
@@ -27,11 +27,11 @@ def parse_spec_file(spec_file_path: Path) -> SpecFileDataSchema:
                 data_type = PackageTypes.DOC
             package_data.included_files.append(IncludedFileSchema(path=words[-1], type=data_type))
 
-    iter_file(spec_file_path, executor, read_only=True)
+    spec_document.scan(executor)
     return package_data
 
 
-def update_spec_file(spec_file_path: Path, old_data: SpecFileDataSchema, new_data: SpecFileDataSchema, remove_comments: bool = False):
+def update_spec_file(spec_document: TextDocument, old_data: SpecFileDataSchema, new_data: SpecFileDataSchema, remove_comments: bool = False):
     logger.info("Updating spec file")
 
     def executor(section: str, current_line: str, words: list[str]):
@@ -43,11 +43,33 @@ def update_spec_file(spec_file_path: Path, old_data: SpecFileDataSchema, new_dat
             # Remove potentially obsolete comments
             return ''
         return current_line
-    iter_file(spec_file_path, executor)
+    spec_document.edit(executor)
     logger.info("Updated spec file")
 
 
-def update_hash_file(hash_file_path: Path, file_hashes: dict[PackageTypes, str]) -> int:
+def read_hash_file(hash_document: TextDocument) -> dict[PackageTypes, str]:
+    file_hashes: dict[PackageTypes, str] = {}
+    sources_part_flag: bool = False
+
+    # Same sections as update_hash_file changes
+    def executor(section: str, current_line: str, words: list[str]):
+        nonlocal sources_part_flag
+        if len(words) == 1 and section == "sources":
+            sources_part_flag = True
+            return
+        elif sources_part_flag and len(words) == 1:
+            return
+        if "doc" in section:
+            file_hashes[PackageTypes.DOC] = words[-1]
+        elif "source" in section:
+            file_hashes[PackageTypes.SOURCE] = words[-1]
+        else:
+            file_hashes[PackageTypes.MAIN] = words[-1]
+    hash_document.scan(executor)
+    return file_hashes
+
+
+def update_hash_file(hash_document: TextDocument, file_hashes: dict[PackageTypes, str]) -> int:
     logger.info("Updating hash file")
 
     sources_part_flag: bool = False
@@ -69,7 +91,7 @@ def update_hash_file(hash_file_path: Path, file_hashes: dict[PackageTypes, str])
         if "source" in section:
             return line_base + f"{file_hashes[PackageTypes.SOURCE]}\n"
         return line_base + f"{file_hashes[PackageTypes.MAIN]}\n"
-    iter_file(hash_file_path, executor)
+    hash_document.edit(executor)
     check_for_exit_condition(updates_counter, lambda x: x != len(file_hashes),"Not all of the provided hashes were used")
     logger.info("Updated hashes in .abf.yml")
     return updates_counter
@@ -0,0 +1,156 @@
+import re
+import logging
+
+from bisect import bisect_left
+
+from src.constants import PackageTypes, TEXMFDIST_MACROS, UNPACKAGED_TARBALL_PREFIXES
+from src.schemas.package_data import IncludedFileSchema
+from src.schemas.reports import FilesVerificationReportSchema
+from src.schemas.tarball import TarballMember
+from src.utils import create_logger
+
+logger = create_logger('FilesVerification', logging.INFO)
+
+GLOB_CHARACTERS: re.Pattern = re.compile(r'[*?\[]')
+BRACES_PATTERN: re.Pattern = re.compile(r'\{([^{}]*,[^{}]*)}')
+
+
+def glob_to_regex(pattern: str) -> re.Pattern:
+    # Unlike fnmatch, wildcards never cross "/" and a matched directory claims everything below it
+    regex: str = ''
+    i: int = 0
+    while i < len(pattern):
+        character: str = pattern[i]
+        i += 1
+        if character == '*':
+            regex += '[^/]*'
+        elif character == '?':
+            regex += '[^/]'
+        elif character == '[' and ']' in pattern[i + 1:]:
+            end: int = pattern.index(']', i + 1)
+            content: str = pattern[i:end]
+            regex += '[' + ('^' + content[1:] if content.startswith('!') else content) + ']'
+            i = end + 1
+        else:
+            regex += re.escape(character)
+    return re.compile(regex + '(?:/.*)?')
+
+
+class PathIndex:
+    def __init__(self, members: list[tuple[str, PackageTypes]]):
+        members.sort()
+        self.paths: list[str] = [path for path, _ in members]
+        self.types: list[PackageTypes] = [file_type for _, file_type in members]
+        # Difference array of claimed ranges, resolved once in unclaimed()
+        self.__claims: list[int] = [0] * (len(self.paths) + 1)
+
+    def __subtree_range(self, directory: str) -> tuple[int, int]:
+        if not directory:
+            return 0, len(self.paths)
+        # Paths located below the directory form a contiguous range of the sorted list ("0" follows "/")
+        start: int = bisect_left(self.paths, directory + '/')
+        return start, bisect_left(self.paths, directory + '0', start)
+
+    def __claim(self, start: int, end: int) -> None:
+        if start < end:
+            self.__claims[start] += 1
+            self.__claims[end] -= 1
+
+    def claim(self, pattern: str) -> int:
+        components: list[str] = [component for component in pattern.split('/') if component not in ('', '.')]
+        static_components: list[str] = []
+        for component in components:
+            if GLOB_CHARACTERS.search(component):
+                break
+            static_components.append(component)
+        prefix: str = '/'.join(static_components)
+        start, end = self.__subtree_range(prefix)
+        if len(static_components) == len(components):
+            self.__claim(start, end)
+            matched: int = end - start
+            exact: int = bisect_left(self.paths, prefix)
+            if exact < len(self.paths) and self.paths[exact] == prefix:
+                self.__claim(exact, exact + 1)
+                matched += 1
+            return matched
+        matcher: re.Pattern = glob_to_regex('/'.join(components))
+        matched = 0
+        for i in range(start, end):
+            if matcher.fullmatch(self.paths[i]):
+                self.__claim(i, i + 1)
+                matched += 1
+        return matched
+
+    def unclaimed(self) -> list[tuple[str, PackageTypes]]:
+        result: list[tuple[str, PackageTypes]] = []
+        claims: int = 0
+        for i, path in enumerate(self.paths):
+            claims += self.__claims[i]
+            if claims == 0:
+                result.append((path, self.types[i]))
+        return result
+
+
+def tarball_type(file_name: str) -> PackageTypes:
+    if '.doc.' in file_name:
+        return PackageTypes.DOC
+    if '.source.' in file_name:
+        return PackageTypes.SOURCE
+    return PackageTypes.MAIN
+
+
+def expand_braces(pattern: str) -> list[str]:
+    match: re.Match | None = BRACES_PATTERN.search(pattern)
+    if match is None:
+        return [pattern]
+    return [
+        expanded
+        for option in match.group(1).split(',')
+        for expanded in expand_braces(pattern[:match.start()] + option + pattern[match.end():])
+    ]
+
+
+def to_tarball_path(spec_path: str) -> str | None:
+    for macro in TEXMFDIST_MACROS:
+        if spec_path.startswith(macro):
+            return spec_path[len(macro):].strip('/')
+    # Files outside of texmf-dist are not shipped in the tarballs
+    return None
+
+
+def build_index(tarballs: dict[str, list[TarballMember]]) -> PathIndex:
+    members: list[tuple[str, PackageTypes]] = []
+    for file_name, tarball_members in tarballs.items():
+        file_type: PackageTypes = tarball_type(file_name)
+        paths: list[str] = [member.path.removeprefix('./') for member in tarball_members if not member.is_dir]
+        members.extend((path, file_type) for path in paths if not path.startswith(UNPACKAGED_TARBALL_PREFIXES))
+    return PathIndex(members)
+
+
+def verify_package_files(included_files: list[IncludedFileSchema], tarballs: dict[str, list[TarballMember]]) -> FilesVerificationReportSchema:
+    index: PathIndex = build_index(tarballs)
+    report: FilesVerificationReportSchema = FilesVerificationReportSchema()
+    for included_file in included_files:
+        tarball_path: str | None = to_tarball_path(included_file.path)
+        if tarball_path is None:
+            report.skipped.append(included_file.path)
+            continue
+        matched: int = sum(index.claim(pattern) for pattern in expand_braces(tarball_path))
+        if not matched:
+            report.missing.setdefault(included_file.type or PackageTypes.MAIN, []).append(included_file.path)
+    for path, file_type in index.unclaimed():
+        report.unclaimed.setdefault(file_type, []).append(path)
+    return report
+
+
+def log_verification_report(report: FilesVerificationReportSchema) -> None:
+    if report.is_ok:
+        logger.info("Files listed in %files match the tarballs")
+    for file_type, paths in report.missing.items():
+        for path in paths:
+            logger.warning(f"{file_type.name}: {path} is listed in %files but missing in the tarballs")
+    for file_type, paths in report.unclaimed.items():
+        for path in paths:
+            logger.warning(f"{file_type.name}: {path} is present in the tarballs but not listed in %files")
+    for path in report.skipped:
+        logger.info(f"Skipped {path}: not a texmf-dist path")
@@ -1,27 +1,67 @@
-import os
+import time
 
 import git
 import logging
 
 from git import rmtree
 
-from src.utils import check_for_exit_condition, handle_bool_input, create_logger
+from src.utils import check_for_exit_condition, handle_bool_input, create_logger, non_interactive
 from src.schemas.package_data import SpecFileDataSchema
-from src.constants import ExitStatus, WORK_DIR_PATH
+from src.constants import ExitStatus, ABF_BRANCH, GIT_REUSE_CHECKOUTS, GIT_CLONE_DEPTH, GIT_CLONE_FILTER, GIT_CLONE_BRANCH
+from datetime import datetime, timezone
 from pathlib import Path
 
 logger = create_logger("Git", logging.INFO)
 
 
+def clone_options() -> list[str]:
+    options: list[str] = []
+    if GIT_CLONE_DEPTH is not None:
+        options.append(f"--depth={GIT_CLONE_DEPTH}")
+    if GIT_CLONE_FILTER is not None:
+        options.append(f"--filter={GIT_CLONE_FILTER}")
+    if GIT_CLONE_BRANCH is not None:
+        options.extend([f"--branch={GIT_CLONE_BRANCH}", "--single-branch"])
+    elif GIT_CLONE_DEPTH is not None:
+        # Shallow clones are single branch by default, but every branch is needed to pick the latest one
+        options.append("--no-single-branch")
+    return options
+
+
+def reuse_repo(repo_url: str, repo_path: Path) -> git.Repo | None:
+    if not Path.joinpath(repo_path, '.git').is_dir():
+        return None
+    try:
+        repo: git.Repo = git.Repo(repo_path)
+        if repo.remote('origin').url != repo_url:
+            return None
+        logger.info("Fetching existing project repo...")
+        start_time: float = time.perf_counter()
+        fetch_options: dict = {'prune': True}
+        if GIT_CLONE_DEPTH is not None:
+            fetch_options['depth'] = GIT_CLONE_DEPTH
+        repo.remote('origin').fetch(**fetch_options)
+        logger.info(f"Fetched successfully in {time.perf_counter() - start_time:.2f}s")
+        return repo
+    except (git.InvalidGitRepositoryError, git.CommandError, ValueError) as e:
+        logger.warning(f"Failed to reuse existing checkout, cloning from scratch: {e}")
+        return None
+
+
 def clone_repo(repo_url: str, repo_path: Path, create_data_folder: bool = False) -> git.Repo:
-    if repo_path.is_dir():
-        rmtree(repo_path)
     try:
-        logger.info("Cloning project repo...")
-        repo: git.Repo = git.Repo.clone_from(repo_url, repo_path)
+        repo: git.Repo | None = reuse_repo(repo_url, repo_path) if GIT_REUSE_CHECKOUTS else None
+        if repo is None:
+            if repo_path.is_dir():
+                rmtree(repo_path)
+            options: list[str] = clone_options()
+            logger.info(f"Cloning project repo {' '.join(options)}...")
+            start_time: float = time.perf_counter()
+            repo = git.Repo.clone_from(repo_url, repo_path, multi_options=options)
+            logger.info(f"Cloned successfully in {time.perf_counter() - start_time:.2f}s")
         if create_data_folder:
-            os.mkdir(Path.joinpath(repo_path, 'data'))
-        logger.info("Cloned successfully")
+            # data/ survives reused checkouts (git clean excludes it), the download stage removes files of other versions
+            Path.joinpath(repo_path, 'data').mkdir(exist_ok=True)
         return repo
     except git.CommandError as e:
         check_for_exit_condition(True, message="Error occurred while cloning repo. Check your internet connection and insure that abf.io is responding, then try again", error=str(e))
@@ -29,10 +69,23 @@ def clone_repo(repo_url: str, repo_path: Path, create_data_folder: bool = False)
 
 def checkout_latest(repo: git.Repo) -> None:
     selected_branch: str = [ref.name for ref in repo.references if ref.name.startswith('origin/')][-1].split('/')[-1]
-    if "rosa2023.1" not in selected_branch:
-        continue_flag: bool = handle_bool_input(f'"rosa2023.1" branch not found. Proceed with "{selected_branch}" y/n?')
+    if ABF_BRANCH not in selected_branch:
+        check_for_exit_condition(non_interactive.get(), message=f'"{ABF_BRANCH}" branch not found, got "{selected_branch}". Aborting...')
+        continue_flag: bool = handle_bool_input(f'"{ABF_BRANCH}" branch not found. Proceed with "{selected_branch}" y/n?')
         check_for_exit_condition(not continue_flag, message="Aborting...", type=ExitStatus.EARLY_RETURN)
     repo.git.checkout(selected_branch)
+    # Reused checkouts might contain leftovers of previous runs
+    repo.git.reset('--hard', f'origin/{selected_branch}')
+    repo.git.clean('-fdx', '-e', '/data')
+
+
+def last_commit_time(repo_path: Path, file_path: Path) -> datetime | None:
+    # In shallow checkouts this is the time of the oldest fetched commit if the file has not changed since
+    try:
+        timestamp: str = git.Repo(repo_path).git.log('-1', '--format=%ct', '--', file_path.name)
+    except (git.InvalidGitRepositoryError, git.NoSuchPathError, git.CommandError):
+        return None
+    return datetime.fromtimestamp(int(timestamp), timezone.utc).replace(tzinfo=None) if timestamp else None
 
 
 def commit_and_push(repo: git.Repo, files_to_commit: list[Path], old_package_data: SpecFileDataSchema, new_package_data: SpecFileDataSchema) -> None:
@@ -0,0 +1,153 @@
+import re
+import time
+import logging
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from src.constants import ExitStatus, METRICS_LOG_PATH, METRICS_TEXTFILE_PATH, METRICS_PREFIX
+from src.schemas.metrics import SpanSchema, SpanStatus, StageTotalsSchema
+from src.schemas.package_data import DownloadedFileSchema
+from src.services.work_dir import FileLock, write_atomic
+from src.utils import create_logger, TaskAbortedError
+
+logger = create_logger('Metrics', logging.INFO)
+
+# name, type, help and the StageTotalsSchema field exported for every (task, stage) pair
+EXPORTED_METRICS: list[tuple[str, str, str, str]] = [
+    ('stage_runs_total', 'counter', 'Number of finished stage spans', 'count'),
+    ('stage_failures_total', 'counter', 'Number of failed stage spans', 'failures'),
+    ('stage_duration_seconds_total', 'counter', 'Time spent in the stage', 'duration'),
+    ('stage_bytes_total', 'counter', 'Bytes transferred by the stage', 'bytes'),
+    ('stage_files_total', 'counter', 'Files processed by the stage', 'files'),
+    ('stage_cache_hits_total', 'counter', 'Stage work served from a cache', 'cache_hits'),
+    ('stage_cache_misses_total', 'counter', 'Stage work not found in a cache', 'cache_misses'),
+]
+SAMPLE_PATTERN: re.Pattern = re.compile(rf'^{METRICS_PREFIX}_(\w+)\{{task="([^"]*)",stage="([^"]*)"\}} (\S+)$')
+
+
+def render_totals(totals: dict[tuple[str, str], StageTotalsSchema]) -> str:
+    lines: list[str] = []
+    for name, metric_type, description, field in EXPORTED_METRICS:
+        lines.append(f"# HELP {METRICS_PREFIX}_{name} {description}")
+        lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+        for (task, stage), stage_totals in sorted(totals.items()):
+            lines.append(f'{METRICS_PREFIX}_{name}{{task="{task}",stage="{stage}"}} {getattr(stage_totals, field)}')
+    # Ignored as a comment by the Prometheus text format, required by OpenMetrics
+    lines.append("# EOF")
+    return '\n'.join(lines) + '\n'
+
+
+def parse_totals(text: str) -> dict[tuple[str, str], StageTotalsSchema]:
+    # Reads back a textfile written by render_totals, unknown lines are skipped
+    fields: dict[str, str] = {name: field for name, _, _, field in EXPORTED_METRICS}
+    values: dict[tuple[str, str], dict[str, str]] = {}
+    for line in text.splitlines():
+        match: re.Match | None = SAMPLE_PATTERN.match(line)
+        if match is None or match.group(1) not in fields:
+            continue
+        name, task, stage, value = match.groups()
+        values.setdefault((task, stage), {})[fields[name]] = value
+    return {key: StageTotalsSchema.model_validate(stage_values) for key, stage_values in values.items()}
+
+
+class MetricsRecorder:
+    def __init__(self, log_path: Path | None = METRICS_LOG_PATH, textfile_path: Path | None = METRICS_TEXTFILE_PATH):
+        self.log_path: Path | None = log_path
+        self.textfile_path: Path | None = textfile_path
+        self.task: str = ""
+        # Spans of the current task and totals of every task since the process started
+        self.spans: list[SpanSchema] = []
+        self.totals: dict[tuple[str, str], StageTotalsSchema] = {}
+        # Totals not yet added to the textfile
+        self.unexported: dict[tuple[str, str], StageTotalsSchema] = {}
+
+    def start_task(self, task: str) -> None:
+        self.task = task
+        self.spans = []
+
+    @contextmanager
+    def span(self, stage: str, package: str = "") -> Iterator[SpanSchema]:
+        span: SpanSchema = SpanSchema(task=self.task, stage=stage, package=package)
+        start_time: float = time.perf_counter()
+        try:
+            yield span
+        except TaskAbortedError as e:
+            # Early returns, such as an already up to date package, are not failures
+            if e.type == ExitStatus.ERROR:
+                span.status = SpanStatus.FAILED
+            raise
+        except BaseException:
+            span.status = SpanStatus.FAILED
+            raise
+        finally:
+            span.duration = round(time.perf_counter() - start_time, 4)
+            self.record(span)
+
+    def record(self, span: SpanSchema) -> None:
+        self.spans.append(span)
+        self.totals.setdefault((span.task, span.stage), StageTotalsSchema()).add(span)
+        self.unexported.setdefault((span.task, span.stage), StageTotalsSchema()).add(span)
+        if self.log_path is None:
+            return
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_path, 'a') as f:
+            f.write(span.model_dump_json() + '\n')
+
+    def summary(self) -> dict[str, StageTotalsSchema]:
+        # Stage totals of the current task in the order the stages started
+        stages: dict[str, StageTotalsSchema] = {}
+        for span in sorted(self.spans, key=lambda x: x.started_at):
+            stages.setdefault(span.stage, StageTotalsSchema()).add(span)
+        return stages
+
+    def log_summary(self) -> None:
+        if not self.spans:
+            return
+        logger.info(f"======{self.task} stages======")
+        logger.info(f"{'stage':<16} | {'runs':>5} | {'time':>9} | {'MiB':>9} | {'MiB/s':>8} | {'files':>6} | {'cache':>9}")
+        for stage, totals in self.summary().items():
+            logger.info(
+                f"{stage:<16} | {totals.count:>5} | {totals.duration:>8.3f}s | {totals.bytes / 1024 ** 2:>9.2f} | "
+                f"{totals.throughput / 1024 ** 2:>8.2f} | {totals.files:>6} | {totals.cache_hits:>4}/{totals.cache_misses:<4}"
+                + (f" | failed {totals.failures}" if totals.failures else "")
+            )
+
+    def render_textfile(self) -> str:
+        return render_totals(self.totals)
+
+    def export_textfile(self) -> None:
+        if self.textfile_path is None or not self.unexported:
+            return
+        # Every run and every parallel process adds its totals to the counters already in the file, the lock keeps
+        # two of them from reading the same file. Collectors (node_exporter textfile) may read at any moment, so it is replaced atomically
+        with FileLock.next_to(self.textfile_path):
+            totals: dict[tuple[str, str], StageTotalsSchema] = (
+                parse_totals(self.textfile_path.read_text()) if self.textfile_path.is_file() else {}
+            )
+            for key, stage_totals in self.unexported.items():
+                totals.setdefault(key, StageTotalsSchema()).merge(stage_totals)
+            write_atomic(self.textfile_path, render_totals(totals))
+        self.unexported = {}
+
+    def finish_task(self) -> None:
+        self.log_summary()
+        self.export_textfile()
+
+
+def record_downloads(span: SpanSchema, files: list[DownloadedFileSchema]) -> None:
+    for file_data in files:
+        span.files += 1
+        span.record_cache(file_data.from_cache)
+        if not file_data.from_cache:
+            span.bytes += file_data.path.stat().st_size
+
+
+def record_uploads(span: SpanSchema, files: list[DownloadedFileSchema]) -> None:
+    # Files skipped because filestore already has them count as cache hits
+    for file_data in files:
+        span.files += 1
+        span.record_cache(not file_data.uploaded)
+        if file_data.uploaded:
+            span.bytes += file_data.path.stat().st_size
@@ -0,0 +1,281 @@
+import sys
+import json
+import sqlite3
+import logging
+
+from array import array
+
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, NamedTuple
+
+from src.constants import PackageTypes, MIRROR_INDEX_MMAP_SIZE, MIRROR_INDEX_BUSY_TIMEOUT
+from src.schemas.package_data import AvailableSourcesSchema, PackageMetadataSchema, FileMetadataSchema
+from src.services.work_dir import write_atomic
+from src.utils import create_logger
+
+logger = create_logger('MirrorIndex', logging.INFO)
+
+
+class MirrorIndexRow(NamedTuple):
+    file_name: str
+    package: str
+    version_specific: bool
+    version: str
+    type: PackageTypes
+    upload_time: int
+    size: float
+    size_bytes: int
+
+
+PACKAGE_TYPES: dict[int, PackageTypes] = {package_type.value: package_type for package_type in PackageTypes}
+
+
+class MirrorIndexColumns:
+    # Parsed listing stored column-wise: typed arrays for numbers and interned package names and versions
+    # instead of a tuple with its own int, float and str objects per file
+    __slots__ = ('file_names', 'packages', 'version_specific', 'versions', 'types', 'upload_times', 'sizes', 'size_bytes')
+
+    def __init__(self):
+        self.file_names: list[str] = []
+        self.packages: list[str] = []
+        self.version_specific: bytearray = bytearray()
+        self.versions: list[str] = []
+        self.types: array = array('B')
+        self.upload_times: array = array('q')
+        self.sizes: array = array('d')
+        self.size_bytes: array = array('q')
+
+    def __len__(self) -> int:
+        return len(self.file_names)
+
+    def append(self, row: MirrorIndexRow) -> None:
+        self.file_names.append(row.file_name)
+        self.packages.append(sys.intern(row.package))
+        self.version_specific.append(row.version_specific)
+        self.versions.append(sys.intern(row.version))
+        self.types.append(row.type)
+        self.upload_times.append(row.upload_time)
+        self.sizes.append(row.size)
+        self.size_bytes.append(row.size_bytes)
+
+    def extend(self, other: 'MirrorIndexColumns') -> None:
+        # Chunks parsed in other processes come back with their own copies of the strings
+        self.file_names.extend(other.file_names)
+        self.packages.extend(map(sys.intern, other.packages))
+        self.version_specific.extend(other.version_specific)
+        self.versions.extend(map(sys.intern, other.versions))
+        self.types.extend(other.types)
+        self.upload_times.extend(other.upload_times)
+        self.sizes.extend(other.sizes)
+        self.size_bytes.extend(other.size_bytes)
+
+    def __iter__(self) -> Iterator[MirrorIndexRow]:
+        for file_name, package, version_specific, version, package_type, upload_time, size, size_bytes in zip(
+                self.file_names, self.packages, self.version_specific, self.versions,
+                self.types, self.upload_times, self.sizes, self.size_bytes
+        ):
+            yield MirrorIndexRow(file_name, package, bool(version_specific), version, PACKAGE_TYPES[package_type], upload_time, size, size_bytes)
+
+
+class MirrorListing(NamedTuple):
+    rows: MirrorIndexColumns
+    etag: str | None
+    last_modified: str | None
+
+
+class MirrorIndexDelta(NamedTuple):
+    added: int
+    changed: int
+    removed: int
+
+    @property
+    def is_empty(self) -> bool:
+        return self.added == self.changed == self.removed == 0
+
+
+def to_timestamp(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def from_timestamp(value: int) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+
+class MirrorIndex:
+    __SCHEMA_VERSION: str = "2"
+    __ROW_COLUMNS: str = "file_name, package, version_specific, version, type, upload_time, size, size_bytes"
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Opening is lazy: no data is read until a package is requested
+        self.__connection: sqlite3.Connection = sqlite3.connect(path, timeout=MIRROR_INDEX_BUSY_TIMEOUT, check_same_thread=False)
+        self.__connection.execute(f"PRAGMA mmap_size = {MIRROR_INDEX_MMAP_SIZE}")
+        self.__connection.execute("PRAGMA journal_mode = WAL")
+        self.__create_schema()
+
+    def __create_schema(self) -> None:
+        with self.__connection:
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            if self.get_metadata("schema_version") not in (None, self.__SCHEMA_VERSION):
+                logger.info("Mirror index format changed, discarding old index")
+                self.__connection.execute("DROP TABLE IF EXISTS files")
+                self.__connection.execute("DELETE FROM metadata")
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "file_name TEXT PRIMARY KEY, "
+                "package TEXT NOT NULL, "
+                "version_specific INTEGER NOT NULL, "
+                "version TEXT NOT NULL, "
+                "type INTEGER NOT NULL, "
+                "upload_time INTEGER NOT NULL, "
+                "size REAL NOT NULL, "
+                "size_bytes INTEGER NOT NULL, "
+                # Last time the entry was confirmed by the mirror listing and last time it differed from it
+                "checked_at INTEGER NOT NULL, "
+                "changed_at INTEGER NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS files_package ON files (package)")
+            self.set_metadata("schema_version", self.__SCHEMA_VERSION)
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    def get_metadata(self, key: str) -> str | None:
+        row: tuple | None = self.__connection.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_metadata(self, key: str, value: str) -> None:
+        self.__connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def is_empty(self) -> bool:
+        return self.__connection.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
+
+    def count(self) -> int:
+        return self.__connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    @property
+    def update_time(self) -> datetime | None:
+        value: str | None = self.get_metadata("update_time")
+        return datetime.fromisoformat(value) if value else None
+
+    @property
+    def checked_at(self) -> datetime | None:
+        value: str | None = self.get_metadata("checked_at")
+        return datetime.fromisoformat(value) if value else None
+
+    def listing_validators(self, url: str) -> dict[str, str]:
+        # Conditional request headers for the listing the index was built from, validators of another mirror do not apply
+        validators: dict[str, str] = {}
+        if self.is_empty or self.get_metadata("source_url") != url:
+            return validators
+        etag: str | None = self.get_metadata("etag")
+        last_modified: str | None = self.get_metadata("last_modified")
+        if etag:
+            validators["If-None-Match"] = etag
+        if last_modified:
+            validators["If-Modified-Since"] = last_modified
+        return validators
+
+    def __set_validators(self, etag: str | None, last_modified: str | None) -> None:
+        self.set_metadata("etag", etag or "")
+        self.set_metadata("last_modified", last_modified or "")
+
+    def mark_unchanged(self, etag: str | None = None, last_modified: str | None = None) -> None:
+        now: datetime = datetime.now()
+        with self.__connection:
+            self.__connection.execute("UPDATE files SET checked_at = ?", (to_timestamp(now),))
+            self.set_metadata("checked_at", now.isoformat())
+            if etag or last_modified:
+                self.__set_validators(etag, last_modified)
+
+    def apply_listing(self, rows: Iterable[MirrorIndexRow], etag: str | None = None, last_modified: str | None = None, source_url: str | None = None) -> MirrorIndexDelta:
+        now: datetime = datetime.now()
+        now_timestamp: int = to_timestamp(now)
+        stored: dict[str, tuple] = {
+            file_name: (upload_time, size, size_bytes)
+            for file_name, upload_time, size, size_bytes in self.__connection.execute("SELECT file_name, upload_time, size, size_bytes FROM files")
+        }
+        added: int = 0
+        changed: int = 0
+
+        def upserts() -> Iterator[tuple]:
+            # Rows are streamed into sqlite, no second copy of the listing is built
+            nonlocal added, changed
+            for row in rows:
+                fingerprint: tuple | None = stored.pop(row.file_name, None)
+                if fingerprint == (row.upload_time, row.size, row.size_bytes):
+                    continue
+                if fingerprint is None:
+                    added += 1
+                else:
+                    changed += 1
+                yield *row, now_timestamp, now_timestamp
+
+        with self.__connection:
+            self.__connection.executemany(
+                f"INSERT OR REPLACE INTO files ({self.__ROW_COLUMNS}, checked_at, changed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                upserts()
+            )
+            # Files left in stored are no longer listed by the mirror
+            removed: list[tuple[str]] = [(file_name,) for file_name in stored]
+            self.__connection.executemany("DELETE FROM files WHERE file_name = ?", removed)
+            self.__connection.execute("UPDATE files SET checked_at = ?", (now_timestamp,))
+            self.set_metadata("checked_at", now.isoformat())
+            if added or changed or removed:
+                self.set_metadata("update_time", now.isoformat())
+            self.__set_validators(etag, last_modified)
+            self.set_metadata("source_url", source_url or "")
+        return MirrorIndexDelta(added=added, changed=changed, removed=len(removed))
+
+    def rows(self, package: str | None = None) -> list[MirrorIndexRow]:
+        if package is None:
+            cursor: sqlite3.Cursor = self.__connection.execute(f"SELECT {self.__ROW_COLUMNS} FROM files ORDER BY file_name")
+        else:
+            cursor = self.__connection.execute(
+                f"SELECT {self.__ROW_COLUMNS} FROM files WHERE package = ? ORDER BY file_name", (package,)
+            )
+        return [MirrorIndexRow(*row) for row in cursor]
+
+    def freshness(self, package: str) -> dict[str, datetime]:
+        return {
+            file_name: from_timestamp(checked_at)
+            for file_name, checked_at in self.__connection.execute(
+                "SELECT file_name, checked_at FROM files WHERE package = ?", (package,)
+            )
+        }
+
+    @staticmethod
+    def __to_file_metadata(row: MirrorIndexRow) -> FileMetadataSchema:
+        return FileMetadataSchema(
+            version=row.version,
+            type=PackageTypes(row.type),
+            upload_time=from_timestamp(row.upload_time),
+            size=row.size,
+            size_bytes=row.size_bytes
+        )
+
+    def get_package(self, package: str) -> PackageMetadataSchema:
+        package_data: PackageMetadataSchema = PackageMetadataSchema()
+        for row in self.rows(package):
+            storage: list[FileMetadataSchema] = package_data.version_specific if row.version_specific else package_data.general
+            storage.append(self.__to_file_metadata(row))
+        return package_data
+
+    def get_repo_related(self, repo_name: str) -> list[FileMetadataSchema]:
+        return self.get_package(repo_name).general
+
+    def to_available_sources(self) -> AvailableSourcesSchema:
+        sources: AvailableSourcesSchema = AvailableSourcesSchema(update_time=self.update_time or datetime.now())
+        for row in self.rows():
+            package_data: PackageMetadataSchema = sources.files[row.package]
+            storage: list[FileMetadataSchema] = package_data.version_specific if row.version_specific else package_data.general
+            storage.append(self.__to_file_metadata(row))
+        return sources
+
+    def export_json(self, path: Path) -> None:
+        write_atomic(path, json.dumps(self.to_available_sources().model_dump(), indent=4, sort_keys=True, default=str))
+        logger.info(f"Exported mirror index to {path}")
@@ -0,0 +1,133 @@
+import time
+import asyncio
+import aiohttp
+import logging
+
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Awaitable, Callable, TypeVar
+from urllib.parse import urljoin
+
+from src.constants import (
+    MIRROR_URLS, MIRROR_RANKING_PATH, MIRROR_RANKING_LIFESPAN, MIRROR_FRESHNESS_FILE, MIRROR_MAX_LAG,
+    MIRROR_PROBE_BYTES, MIRROR_PROBE_TIMEOUT, MIRROR_RETRIES, MIRROR_LISTING_CHUNK_SIZE
+)
+from src.schemas.mirrors import MirrorProbeSchema, MirrorRankingSchema
+from src.services.network_requests import RequestsHandler, MirrorError, MIRROR_ERRORS
+from src.services.work_dir import write_atomic
+from src.utils import create_logger
+
+logger = create_logger('Mirrors', logging.INFO)
+T = TypeVar('T')
+
+
+class MirrorSelector:
+    def __init__(self, requests_handler: RequestsHandler, urls: list[str] = MIRROR_URLS, ranking_path: Path = MIRROR_RANKING_PATH):
+        self.requests_handler: RequestsHandler = requests_handler
+        self.urls: list[str] = list(dict.fromkeys(urls))
+        self.ranking_path: Path = ranking_path
+        self.__ranked: list[str] | None = None
+        self.__lock: asyncio.Lock = asyncio.Lock()
+
+    @property
+    def retries(self) -> int | None:
+        # With other mirrors to fail over to, a failing mirror is not retried for long
+        return MIRROR_RETRIES if len(self.urls) > 1 else None
+
+    async def ranked(self) -> list[str]:
+        async with self.__lock:
+            if self.__ranked is None:
+                self.__ranked = await self.__rank()
+        return list(self.__ranked)
+
+    async def __rank(self) -> list[str]:
+        if len(self.urls) == 1:
+            return self.urls
+        ranking: MirrorRankingSchema | None = load_ranking(self.ranking_path)
+        if ranking is None or ranking.checked_at + MIRROR_RANKING_LIFESPAN < datetime.now() \
+                or {probe.url for probe in ranking.probes} != set(self.urls):
+            logger.info(f"Probing {len(self.urls)} mirrors")
+            ranking = await self.probe_all()
+            save_ranking(self.ranking_path, ranking)
+        for probe in sorted(ranking.probes, key=lambda x: ranking.urls.index(x.url)):
+            state: str = probe.error or ("stale" if probe.stale else "ok")
+            latency: str = f"{probe.latency:.3f}s" if probe.latency is not None else "-"
+            throughput: str = f"{probe.throughput / 1024 ** 2:.2f} MiB/s" if probe.throughput else "-"
+            logger.info(f"{probe.url}: latency {latency} throughput {throughput} last sync {probe.last_modified or '-'} ({state})")
+        return ranking.urls
+
+    async def probe_all(self) -> MirrorRankingSchema:
+        probes: list[MirrorProbeSchema] = list(await asyncio.gather(*[self.probe(url) for url in self.urls]))
+        mark_stale(probes)
+        return MirrorRankingSchema(probes=probes)
+
+    async def probe(self, url: str) -> MirrorProbeSchema:
+        probe: MirrorProbeSchema = MirrorProbeSchema(url=url)
+        timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=MIRROR_PROBE_TIMEOUT)
+        try:
+            freshness_url: str = urljoin(url, MIRROR_FRESHNESS_FILE)
+            start_time: float = time.perf_counter()
+            async with self.requests_handler.request('GET', freshness_url, timeout=timeout) as response:
+                probe.latency = time.perf_counter() - start_time
+                if not response.ok:
+                    raise MirrorError(freshness_url, response.status)
+                if 'Last-Modified' in response.headers:
+                    probe.last_modified = parsedate_to_datetime(response.headers['Last-Modified'])
+            received: int = 0
+            start_time = time.perf_counter()
+            async with self.requests_handler.request('GET', url, timeout=timeout) as response:
+                if not response.ok:
+                    raise MirrorError(url, response.status)
+                async for chunk in response.content.iter_chunked(MIRROR_LISTING_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received >= MIRROR_PROBE_BYTES:
+                        break
+            probe.throughput = received / max(time.perf_counter() - start_time, 1e-6)
+        except (*MIRROR_ERRORS, ValueError) as e:
+            probe.error = f"{type(e).__name__}: {e}"
+        return probe
+
+    def demote(self, url: str) -> None:
+        # A mirror failing during the run is tried last for the rest of it
+        if self.__ranked is None or self.__ranked[-1] == url or url not in self.__ranked:
+            return
+        self.__ranked.remove(url)
+        self.__ranked.append(url)
+
+    async def run(self, operation: Callable[[str], Awaitable[T]], description: str) -> T:
+        # operation receives the base url of a mirror and is repeated on the next mirror if it fails
+        urls: list[str] = await self.ranked()
+        if not urls:
+            raise ValueError(f"{description} has no mirror to run on, the list of mirror urls is empty (ABF_UPDATER_MIRROR_URLS)")
+        last_error: Exception | None = None
+        for base_url in urls:
+            try:
+                return await operation(base_url)
+            except MIRROR_ERRORS as e:
+                logger.warning(f"{description} failed on {base_url} ({type(e).__name__}: {e}). Trying the next mirror")
+                self.demote(base_url)
+                last_error = e
+        raise last_error
+
+
+def mark_stale(probes: list[MirrorProbeSchema]) -> None:
+    synced: list[MirrorProbeSchema] = [probe for probe in probes if not probe.error and probe.last_modified is not None]
+    if not synced:
+        return
+    newest: datetime = max(probe.last_modified for probe in synced)
+    for probe in synced:
+        probe.stale = newest - probe.last_modified > MIRROR_MAX_LAG
+
+
+def load_ranking(path: Path) -> MirrorRankingSchema | None:
+    if not path.is_file():
+        return None
+    try:
+        return MirrorRankingSchema.model_validate_json(path.read_text())
+    except ValueError:
+        return None
+
+
+def save_ranking(path: Path, ranking: MirrorRankingSchema) -> None:
+    write_atomic(path, ranking.model_dump_json(indent=4))
@@ -1,30 +1,182 @@
+import os
+import glob
+import json
+import time
+import random
+import hashlib
 import asyncio
 import aiohttp
 import aiofiles
 import logging
 
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, TypeVar, TYPE_CHECKING
+from urllib.parse import urlparse
 
-from src.constants import ABF_UPLOAD_URI, PackageTypes, MIRROR_BASE_URL
-from src.schemas.package_data import FileMetadataSchema
+from src.constants import (
+    ABF_UPLOAD_URI, ABF_FILE_STORE_CHECK_URI, KNOWN_HASHES_PATH, PackageTypes, DOWNLOAD_CHUNK_SIZE, PARTIAL_DOWNLOADS_DIR,
+    PARTIAL_DOWNLOAD_SUFFIX, PARTIAL_DOWNLOAD_STATE_SUFFIX, DOWNLOAD_SEGMENT_THRESHOLD, DOWNLOAD_SEGMENTS, TARBALL_CACHE_VERIFY_HASH, RETRYABLE_STATUSES
+)
+from src.schemas.package_data import FileMetadataSchema, DownloadedFileSchema, DownloadSegmentSchema, PartialDownloadSchema
+from src.schemas.cache import TarballCacheEntrySchema
+from src.schemas.network import ConnectionPolicySchema, HostStatsSchema
 from src.schemas.user_data import LoginDataSchema
-from src.services.directory_structure import sources_save_path
+from src.services.directory_structure import sources_save_path, clear_stale_sources
+from src.services.tarball_cache import TarballCache, file_sha1
+from src.services.work_dir import FileLock, hold_lock, write_atomic, workspace_path
 from src.utils import check_for_exit_condition, create_logger
 
+if TYPE_CHECKING:
+    from src.services.mirrors import MirrorSelector
+
 logger = create_logger("Network", logging.INFO)
 
 
+class RetryableStatusError(Exception):
+    def __init__(self, url: str, status: int):
+        super().__init__(f"{url} responded with http code {status}")
+        self.status: int = status
+
+
+class MirrorError(Exception):
+    # The mirror can not serve the request, another mirror might
+    def __init__(self, url: str, status: int):
+        super().__init__(f"{url} responded with http code {status}")
+        self.status: int = status
+
+
+class IncompleteListingError(MirrorError):
+    # The listing parsed to far fewer files than the index holds: a truncated or changed page, not a real removal
+    def __init__(self, url: str, rows: int, stored: int):
+        Exception.__init__(self, f"{url} lists {rows} files, the mirror index holds {stored}")
+        self.status: int = 200
+
+
+class SizeMismatchError(Exception):
+    # The mirror serves a file of another size than the mirror index expects
+    def __init__(self, url: str, expected: int, received: int):
+        super().__init__(f"{url} has {received} bytes, expected {expected}")
+
+
+class RangeNotSupportedError(Exception):
+    pass
+
+
+RETRYABLE_ERRORS: tuple[type[Exception], ...] = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError, RetryableStatusError)
+MIRROR_ERRORS: tuple[type[Exception], ...] = (*RETRYABLE_ERRORS, MirrorError, SizeMismatchError)
+T = TypeVar('T')
+
+
 class RequestsHandler:
-    def __init__(self):
-        self.session: aiohttp.ClientSession = aiohttp.ClientSession()
+    def __init__(self, policy: ConnectionPolicySchema | None = None):
+        self.policy: ConnectionPolicySchema = policy or ConnectionPolicySchema()
+        self.session: aiohttp.ClientSession = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.policy.limit,
+                ttl_dns_cache=self.policy.dns_cache_ttl,
+                keepalive_timeout=self.policy.keepalive_timeout
+            ),
+            timeout=aiohttp.ClientTimeout(
+                total=self.policy.total_timeout,
+                sock_connect=self.policy.connect_timeout,
+                sock_read=self.policy.read_timeout
+            )
+        )
+        self.host_stats: dict[str, HostStatsSchema] = {}
+        self.__host_limits: dict[str, asyncio.Semaphore] = {}
+        # Hashes known to be present on filestore, uploads of these files are skipped
+        self.known_hashes: set[str] = load_known_hashes()
+        self.tarball_cache: TarballCache = TarballCache()
+        self.__mirrors: 'MirrorSelector | None' = None
+
+    @property
+    def mirrors(self) -> 'MirrorSelector':
+        if self.__mirrors is None:
+            from src.services.mirrors import MirrorSelector
+            self.__mirrors = MirrorSelector(self)
+        return self.__mirrors
 
     async def close_session(self):
         await self.session.close()
 
-    async def __file_upload_task(self, username: str, password: str, file, hashed_list: dict[PackageTypes, str], file_type: PackageTypes):
-        files = {'file_store[file]': file}
-        response = await self.session.post(ABF_UPLOAD_URI, auth=aiohttp.BasicAuth(username, password), data=files)
-        return_value = (await response.json())['sha1_hash']
+    def __host_limit(self, host: str) -> asyncio.Semaphore:
+        if host not in self.__host_limits:
+            self.__host_limits[host] = asyncio.Semaphore(self.policy.concurrency(host))
+        return self.__host_limits[host]
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        host: str = urlparse(url).hostname or ''
+        stats: HostStatsSchema = self.host_stats.setdefault(host, HostStatsSchema())
+        stats.waiting += 1
+        async with self.__host_limit(host):
+            stats.waiting -= 1
+            stats.in_flight += 1
+            stats.requests += 1
+            start_time: float = time.perf_counter()
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    stats.record_latency(time.perf_counter() - start_time)
+                    if response.status in RETRYABLE_STATUSES:
+                        raise RetryableStatusError(url, response.status)
+                    yield response
+            except RETRYABLE_ERRORS:
+                stats.failures += 1
+                raise
+            finally:
+                stats.in_flight -= 1
+
+    def __backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries of parallel requests from hitting the host at the same moment
+        return random.uniform(0, min(self.policy.backoff_max, self.policy.backoff_base * 2 ** attempt))
+
+    async def retry(self, operation: Callable[[], Awaitable[T]], url: str, retries: int | None = None) -> T:
+        # Only idempotent operations (GETs, filestore uploads deduplicated by hash) are passed here
+        retries = self.policy.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                return await operation()
+            except RETRYABLE_ERRORS as e:
+                if attempt == retries:
+                    raise
+                delay: float = self.__backoff(attempt)
+                self.host_stats.setdefault(urlparse(url).hostname or '', HostStatsSchema()).retries += 1
+                logger.warning(f"Request to {url} failed ({type(e).__name__}: {e}). Retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def log_host_stats(self) -> None:
+        for host, stats in sorted(self.host_stats.items()):
+            logger.info(
+                f"{host}: requests {stats.requests} failures {stats.failures} retries {stats.retries} "
+                f"latency avg {stats.average_latency:.3f}s max {stats.max_latency:.3f}s"
+            )
+
+    async def __file_exists_in_filestore(self, sha1: str) -> bool:
+        async def check() -> bool:
+            async with self.request('GET', ABF_FILE_STORE_CHECK_URI, params={'hash': sha1}) as response:
+                if not response.ok:
+                    return False
+                # Filestore replies with a list of stored files matching the hash
+                return len(await response.json(content_type=None)) > 0
+        return await self.retry(check, ABF_FILE_STORE_CHECK_URI)
+
+    async def __upload_file(self, username: str, password: str, file_path: Path) -> str | list[str]:
+        async def upload() -> str | list[str]:
+            # The file is reopened on every attempt as a failed upload consumes it
+            with open(file_path, 'rb') as file:
+                files = {'file_store[file]': file}
+                async with self.request('POST', ABF_UPLOAD_URI, auth=aiohttp.BasicAuth(username, password), data=files) as response:
+                    return (await response.json())['sha1_hash']
+        return await self.retry(upload, ABF_UPLOAD_URI)
+
+    async def __file_upload_task(self, username: str, password: str, file_data: DownloadedFileSchema, hashed_list: dict[PackageTypes, str]):
+        if file_data.sha1 in self.known_hashes or await self.__file_exists_in_filestore(file_data.sha1):
+            logger.info(f"{file_data.path.name} is already present on filestore. Skipping upload")
+            self.known_hashes.add(file_data.sha1)
+            hashed_list[file_data.type] = file_data.sha1
+            return
+        return_value = await self.__upload_file(username, password, file_data.path)
         if len(return_value) == 1:
             received_hash: str = return_value[0].split('-')[0].strip()
             # If file already exists hash the following string is returned: "hash - file already exists"
@@ -33,58 +185,234 @@ class RequestsHandler:
                 lambda x: len(x) == 1,
                 "Failed to parse incoming hash. Start the process again for the issue to be resolved"
             )
-            hashed_list[file_type] = received_hash
-            return
-        hashed_list[file_type] = return_value
-        return
+            return_value = received_hash
+        if return_value != file_data.sha1:
+            logger.warning(f"Filestore hash of {file_data.path.name} differs from the local one")
+        file_data.uploaded = True
+        self.known_hashes.add(return_value)
+        hashed_list[file_data.type] = return_value
 
-    async def __file_download_task(self, package_short_name: str, data_path: Path, source_data: FileMetadataSchema, saved_file_paths: list[tuple[Path, PackageTypes]]) -> None:
+    async def __file_download_task(self, package_short_name: str, data_path: Path, source_data: FileMetadataSchema, saved_files: list[DownloadedFileSchema]) -> None:
         source_name, source_save_path = sources_save_path(package_short_name, data_path, source_data.type)
-        response: aiohttp.ClientResponse = await self.session.get(MIRROR_BASE_URL + source_name, allow_redirects=True)
-        check_for_exit_condition(not response.ok, message=f"Failed to download file with http code {response.status}")
-        file = await aiofiles.open(source_save_path, 'wb')
-        await file.write(await response.read())
-        await file.close()
-        saved_file_paths.append((source_save_path, source_data.type))
-
-    async def download_files(self, package_short_name: str, data_path: Path, sources: list[FileMetadataSchema]) -> list[tuple[Path, PackageTypes]]:
-        saved_paths: list[tuple[Path, PackageTypes]] = []
+        if await self.__restore_from_cache(source_name, source_data, source_save_path, saved_files):
+            return
+
+        async def download(base_url: str) -> str:
+            url: str = base_url + source_name
+            return await self.retry(lambda: self.__download_file(url, source_save_path, source_data), url, self.mirrors.retries)
+        sha1: str = await self.mirrors.run(download, f"Download of {source_name}")
+        # Copies across file systems can take a while, so cache writes run in a worker thread
+        await asyncio.to_thread(self.tarball_cache.store, source_name, source_data, source_save_path, sha1)
+        saved_files.append(DownloadedFileSchema(path=source_save_path, type=source_data.type, sha1=sha1))
+
+    async def __download_file(self, url: str, save_path: Path, source_data: FileMetadataSchema) -> str:
+        # Received ranges are kept next to the partial file, so a failed attempt, another mirror
+        # or the next run continues from where the download stopped
+        partial_save_path, state_path = partial_download_paths(save_path.name, source_data)
+        state: PartialDownloadSchema | None = load_partial_download(partial_save_path, state_path, source_data)
+        if state is None:
+            discard_partial_downloads_of(save_path.name)
+            state = new_partial_download(partial_save_path, source_data)
+        elif state.received > 0:
+            logger.info(f"Resuming {save_path.name} from {state.received} of {state.size_bytes or '?'} bytes")
+        # Hashing while streaming is only possible when the whole file arrives in order
+        sha1 = hashlib.sha1() if len(state.segments) == 1 and state.received == 0 else None
+        try:
+            try:
+                await self.__download_segments(url, partial_save_path, state, sha1)
+            except RangeNotSupportedError:
+                logger.info(f"{url} ignores Range requests. Downloading {save_path.name} as a whole")
+                state = new_partial_download(partial_save_path, source_data, segmented=False)
+                sha1 = hashlib.sha1()
+                await self.__download_segments(url, partial_save_path, state, sha1)
+        except SizeMismatchError:
+            discard_partial_download(partial_save_path, state_path)
+            raise
+        finally:
+            if partial_save_path.is_file():
+                save_partial_download(state_path, state)
+
+        os.truncate(partial_save_path, state.size_bytes)
+        if source_data.size_bytes and state.size_bytes != source_data.size_bytes:
+            discard_partial_download(partial_save_path, state_path)
+            raise SizeMismatchError(url, source_data.size_bytes, state.size_bytes)
+        sha1_hex: str = sha1.hexdigest() if sha1 is not None else await asyncio.to_thread(file_sha1, partial_save_path)
+        # The complete file appears under its final name only once fully written
+        os.replace(partial_save_path, save_path)
+        state_path.unlink(missing_ok=True)
+        return sha1_hex
+
+    async def __download_segments(self, url: str, partial_save_path: Path, state: PartialDownloadSchema, sha1) -> None:
+        tasks: list[asyncio.Task] = [
+            asyncio.create_task(self.__download_segment(url, partial_save_path, state, segment, sha1))
+            for segment in state.segments if not segment.is_complete
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # A failed segment stops the others, the ranges received so far are kept
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def __download_segment(self, url: str, partial_save_path: Path, state: PartialDownloadSchema, segment: DownloadSegmentSchema, sha1) -> None:
+        headers: dict[str, str] = {}
+        ranged: bool = segment.offset > 0 or len(state.segments) > 1
+        if ranged:
+            headers['Range'] = segment.range_header
+        async with self.request('GET', url, headers=headers, allow_redirects=True) as response:
+            if not response.ok:
+                raise MirrorError(url, response.status)
+            if ranged and response.status != 206:
+                raise RangeNotSupportedError(url)
+            total: int | None = response_total_size(response)
+            if total is not None:
+                if state.size_bytes and total != state.size_bytes:
+                    raise SizeMismatchError(url, state.size_bytes, total)
+                state.size_bytes = total
+                if segment.end is None:
+                    segment.end = total
+            async with aiofiles.open(partial_save_path, 'r+b') as file:
+                await file.seek(segment.offset)
+                # Only DOWNLOAD_CHUNK_SIZE bytes of every segment are held in memory at once
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    if segment.end is not None:
+                        chunk = chunk[:segment.end - segment.offset]
+                    if sha1 is not None:
+                        sha1.update(chunk)
+                    await file.write(chunk)
+                    segment.received += len(chunk)
+                    if segment.is_complete:
+                        break
+        if segment.end is None:
+            # Neither Content-Length nor Content-Range was sent, the end of the stream is the end of the file
+            segment.end = segment.offset
+            state.size_bytes = segment.end
+        if not segment.is_complete:
+            raise aiohttp.ClientPayloadError(f"{url} closed the connection after {segment.offset} of {segment.end} bytes")
+
+    async def __restore_from_cache(self, source_name: str, source_data: FileMetadataSchema, source_save_path: Path, saved_files: list[DownloadedFileSchema]) -> bool:
+        entry: TarballCacheEntrySchema | None = self.tarball_cache.lookup(source_name, source_data)
+        if entry is None:
+            return False
+        try:
+            if TARBALL_CACHE_VERIFY_HASH and not await asyncio.to_thread(self.tarball_cache.verify, entry):
+                return False
+            await asyncio.to_thread(self.tarball_cache.materialize, entry, source_save_path)
+        except FileNotFoundError:
+            # Pruned by another process after the lookup
+            return False
+        logger.info(f"Reused cached {source_name}")
+        saved_files.append(DownloadedFileSchema(path=source_save_path, type=source_data.type, sha1=entry.sha1, from_cache=True))
+        return True
+
+    async def download_files(self, package_short_name: str, data_path: Path, sources: list[FileMetadataSchema]) -> list[DownloadedFileSchema]:
+        data_path.mkdir(exist_ok=True)
+        clear_stale_sources(data_path, {sources_save_path(package_short_name, data_path, source.type)[0] for source in sources})
+        saved_files: list[DownloadedFileSchema] = []
         tasks = [
-            asyncio.create_task(self.__file_download_task(package_short_name, data_path, source, saved_paths))
+            asyncio.create_task(self.__file_download_task(package_short_name, data_path, source, saved_files))
             for source in sources
         ]
         try:
             await asyncio.gather(*tasks)
-        except aiohttp.ClientConnectionError:
-            check_for_exit_condition(True, message="No internet connection. Aborting...")
-        return saved_paths
+        except MIRROR_ERRORS as e:
+            check_for_exit_condition(True, message=f"Failed to download source files ({type(e).__name__}: {e}). Aborting...")
+        await asyncio.to_thread(self.tarball_cache.prune_if_due)
+        return saved_files
 
     async def download_and_upload_files(self, abf_credentials: LoginDataSchema, package_short_name: str, data_path: Path, sources: list[FileMetadataSchema]) -> dict[PackageTypes, str]:
         logger.info(f"Downloading {len(sources)} source files")
-        saved_paths: list[tuple[Path, PackageTypes]] = await self.download_files(package_short_name, data_path, sources)
+        saved_files: list[DownloadedFileSchema] = await self.download_files(package_short_name, data_path, sources)
         logger.info("Finished Downloading")
         logger.info(f"Uploading {len(sources)} source files to filestore")
-        file_hashes: dict[PackageTypes, str] = await self.upload_to_filestore(abf_credentials, saved_paths)
+        file_hashes: dict[PackageTypes, str] = await self.upload_to_filestore(abf_credentials, saved_files)
         logger.info("Source files uploaded")
         return file_hashes
 
-    async def upload_to_filestore(self, abf_credentials: LoginDataSchema, files_data: list[tuple[Path, PackageTypes]]) -> dict[PackageTypes, str]:
-        opened_files: list = []
+    async def upload_to_filestore(self, abf_credentials: LoginDataSchema, files_data: list[DownloadedFileSchema]) -> dict[PackageTypes, str]:
         file_hashes: dict[PackageTypes, str] = {}
-
-        def close_files():
-            for file in opened_files:
-                file.close()
-        for file_data in files_data:
-            opened_files.append(open(file_data[0], 'rb'))
         try:
             tasks = [
-                asyncio.create_task(self.__file_upload_task(abf_credentials.email, abf_credentials.password, file, file_hashes, files_data[i][1]))
-                for i, file in enumerate(opened_files)
+                asyncio.create_task(self.__file_upload_task(abf_credentials.email, abf_credentials.password, file_data, file_hashes))
+                for file_data in files_data
             ]
             await asyncio.gather(*tasks)
         except Exception:
-            close_files()
             check_for_exit_condition(True, message=f"Failed to upload file to filestore. Check for internet connection, credentials spelling and try again")
-        close_files()
+        finally:
+            await save_known_hashes(self.known_hashes)
         return file_hashes
+
+
+def response_total_size(response: aiohttp.ClientResponse) -> int | None:
+    if response.status == 206:
+        # Content-Range: bytes <first>-<last>/<total>
+        total: str = response.headers.get('Content-Range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+    return response.content_length
+
+
+def partial_download_paths(file_name: str, source_data: FileMetadataSchema) -> tuple[Path, Path]:
+    # Outside of data/, the workspace slot belongs to this process and is taken again by the next one.
+    # The upload time tells apart partial files of different uploads of the same file name
+    directory: Path = Path.joinpath(workspace_path(), PARTIAL_DOWNLOADS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    name: str = f"{file_name}-{source_data.upload_time:%Y%m%d%H%M%S}"
+    return Path.joinpath(directory, name + PARTIAL_DOWNLOAD_SUFFIX), Path.joinpath(directory, name + PARTIAL_DOWNLOAD_STATE_SUFFIX)
+
+
+def discard_partial_downloads_of(file_name: str) -> None:
+    # Partial files of earlier uploads are never resumed
+    for path in Path.joinpath(workspace_path(), PARTIAL_DOWNLOADS_DIR).glob(f"{glob.escape(file_name)}-*"):
+        path.unlink(missing_ok=True)
+
+
+def new_partial_download(partial_save_path: Path, source_data: FileMetadataSchema, segmented: bool = True) -> PartialDownloadSchema:
+    size_bytes: int = source_data.size_bytes
+    segments: list[DownloadSegmentSchema] = [DownloadSegmentSchema(start=0, end=size_bytes or None)]
+    if segmented and size_bytes >= DOWNLOAD_SEGMENT_THRESHOLD:
+        bounds: list[int] = [size_bytes * i // DOWNLOAD_SEGMENTS for i in range(DOWNLOAD_SEGMENTS + 1)]
+        segments = [DownloadSegmentSchema(start=start, end=end) for start, end in zip(bounds, bounds[1:])]
+    with open(partial_save_path, 'wb') as file:
+        # Segments are written at their offsets, so the file is allocated at its full size
+        file.truncate(size_bytes if len(segments) > 1 else 0)
+    return PartialDownloadSchema(upload_time=source_data.upload_time, size=source_data.size, size_bytes=size_bytes, segments=segments)
+
+
+def load_partial_download(partial_save_path: Path, state_path: Path, source_data: FileMetadataSchema) -> PartialDownloadSchema | None:
+    if not partial_save_path.is_file() or not state_path.is_file():
+        return None
+    try:
+        state: PartialDownloadSchema = PartialDownloadSchema.model_validate_json(state_path.read_text())
+    except ValueError:
+        return None
+    written: int = max((segment.offset for segment in state.segments), default=0)
+    if not state.matches(source_data) or partial_save_path.stat().st_size < written:
+        logger.info(f"Discarding outdated partial download {partial_save_path.name}")
+        return None
+    return state
+
+
+def save_partial_download(state_path: Path, state: PartialDownloadSchema) -> None:
+    write_atomic(state_path, state.model_dump_json())
+
+
+def discard_partial_download(partial_save_path: Path, state_path: Path) -> None:
+    partial_save_path.unlink(missing_ok=True)
+    state_path.unlink(missing_ok=True)
+
+
+def load_known_hashes() -> set[str]:
+    if not KNOWN_HASHES_PATH.is_file():
+        return set()
+    with open(KNOWN_HASHES_PATH, 'r') as f:
+        return set(json.load(f))
+
+
+async def save_known_hashes(known_hashes: set[str]) -> None:
+    # Other processes may have saved hashes since this one loaded them, both sets are kept
+    async with hold_lock(FileLock.next_to(KNOWN_HASHES_PATH)):
+        known_hashes.update(load_known_hashes())
+        write_atomic(KNOWN_HASHES_PATH, json.dumps(sorted(known_hashes)))
@@ -1,27 +1,44 @@
-import json
+import re
+import asyncio
+import itertools
 import aiohttp
+import calendar
 import logging
 
-from bs4 import BeautifulSoup, PageElement
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import cache
+
+from bs4 import BeautifulSoup
+from typing import Iterator, AsyncIterator
+from urllib.parse import unquote
 
-from src.services.network_requests import RequestsHandler
+from src.services.network_requests import RequestsHandler, MirrorError, IncompleteListingError, MIRROR_ERRORS
 from src.utils import check_for_exit_condition, create_logger, is_cache_valid
-from src.constants import MIRROR_BASE_URL, PackageTypes, FILES_CACHE_PATH, ARCHITECTURES_SPECIFIC_PREFIXES
-from src.schemas.package_data import SpecFileDataSchema, AvailableSourcesSchema, PackageMetadataSchema, FileMetadataSchema
+from src.services.work_dir import FileLock, hold_lock
+from src.services.mirror_index import MirrorIndex, MirrorIndexRow, MirrorIndexColumns, MirrorIndexDelta, MirrorListing, to_timestamp
+from src.constants import MIRROR_BASE_URL, CTAN_BASE_URL, PackageTypes, FILES_CACHE_PATH, MIRROR_INDEX_PATH, MIRROR_INDEX_LOCK_PATH, ARCHITECTURES_SPECIFIC_PREFIXES, MIRROR_LISTING_CHUNK_SIZE, MIRROR_LISTING_MIN_RATIO, MIRROR_LISTING_PARSE_CHUNK_SIZE, MIRROR_LISTING_PARSE_WORKERS
+from src.schemas.package_data import SpecFileDataSchema, MirrorListingEntry
 from dateutil.parser import parse
-from datetime import datetime
 
 logger = create_logger('Parser', logging.INFO)
 
+# Month names of nginx autoindex listings, independent of the current locale
+LISTING_MONTHS: dict[str, int] = {
+    month: i for i, month in enumerate(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1)
+}
+
 
 async def get_soup(request_handler: RequestsHandler, url: str) -> BeautifulSoup:
-    response: aiohttp.ClientResponse = await request_handler.session.get(url)
-    check_for_exit_condition(not response.ok, message="Failed to retrieve package data. Package not found on ctan.org")
-    return BeautifulSoup(await response.text(), 'html.parser')
+    async def fetch() -> str:
+        async with request_handler.request('GET', url) as response:
+            check_for_exit_condition(not response.ok, message="Failed to retrieve package data. Package not found on ctan.org")
+            return await response.text()
+    return BeautifulSoup(await request_handler.retry(fetch, url), 'html.parser')
 
 
-async def parse_package_data(request_handler: RequestsHandler, package_data: SpecFileDataSchema) -> SpecFileDataSchema:
-    soup: BeautifulSoup = await get_soup(request_handler, f"https://ctan.org/pkg/{package_data.short_name}")
+async def parse_package_data(request_handler: RequestsHandler, package_data: SpecFileDataSchema, base_url: str = CTAN_BASE_URL) -> SpecFileDataSchema:
+    soup: BeautifulSoup = await get_soup(request_handler, f"{base_url}/pkg/{package_data.short_name}")
     table_of_context = soup.find('table')
     logger.info("Collecting up to date data about a package")
     check_for_exit_condition(table_of_context, lambda x: x is None, "Failed to parse page on ctan.org")
@@ -34,53 +51,203 @@ async def parse_package_data(request_handler: RequestsHandler, package_data: Spe
             break
     return new_pacakge_data
 
-async def parse_mirror(requests_handler: RequestsHandler, force_update: bool = False) -> AvailableSourcesSchema:
+class MirrorListingTokenizer:
+    # Matches a single autoindex row: <a href="name.tar.xz">name.tar.xz</a>   28-Feb-2019 00:24   329012
+    __entry_pattern: re.Pattern = re.compile(rb'<a href="([^"]+)">[^<]*</a>\s+(\S+\s+\S+)\s+(\S+)')
+
+    def __init__(self):
+        self.__buffer: bytes = b''
+
+    def feed(self, chunk: bytes) -> Iterator[MirrorListingEntry]:
+        self.__buffer += chunk
+        lines: list[bytes] = self.__buffer.split(b'\n')
+        # The last line might be incomplete, keep it until the next chunk arrives
+        self.__buffer = lines.pop()
+        for line in lines:
+            entry: MirrorListingEntry | None = self.__parse_line(line)
+            if entry is not None:
+                yield entry
+
+    def close(self) -> Iterator[MirrorListingEntry]:
+        entry: MirrorListingEntry | None = self.__parse_line(self.__buffer)
+        self.__buffer = b''
+        if entry is not None:
+            yield entry
+
+    @classmethod
+    def __parse_line(cls, line: bytes) -> MirrorListingEntry | None:
+        match: re.Match | None = cls.__entry_pattern.search(line)
+        if match is None:
+            return None
+        href, upload_date, size = match.groups()
+        # Skip "../" and subdirectories
+        if href.endswith(b'/'):
+            return None
+        return MirrorListingEntry(unquote(href.decode()), upload_date.decode(), size.decode())
+
+
+class MirrorListingChunker:
+    # Cuts the listing into blocks of whole lines, every block is tokenized and parsed on its own
+    def __init__(self, chunk_size: int = MIRROR_LISTING_PARSE_CHUNK_SIZE):
+        self.chunk_size: int = chunk_size
+        self.__buffer: bytearray = bytearray()
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        self.__buffer += data
+        if len(self.__buffer) < self.chunk_size:
+            return
+        end: int = self.__buffer.rfind(b'\n') + 1
+        if end:
+            yield bytes(self.__buffer[:end])
+            del self.__buffer[:end]
+
+    def close(self) -> Iterator[bytes]:
+        if self.__buffer:
+            yield bytes(self.__buffer)
+            self.__buffer.clear()
+
+
+async def fetch_mirror_listing(requests_handler: RequestsHandler, validators: dict[str, str], url: str = MIRROR_BASE_URL) -> MirrorListing | None:
+    async def fetch() -> MirrorListing | None:
+        async with requests_handler.request('GET', url, headers=validators) as response:
+            if response.status == 304:
+                return None
+            if not response.ok:
+                raise MirrorError(url, response.status)
+            logger.info(f"Starting parsing process of {url}. May take a while")
+            rows: MirrorIndexColumns = await parse_listing_chunks(iter_listing_chunks(response))
+            logger.info(f"Parsing completed. Parsed {len(rows)} source files")
+            return MirrorListing(rows, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return await requests_handler.retry(fetch, url, requests_handler.mirrors.retries)
+
+
+async def iter_listing_chunks(response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+    chunker: MirrorListingChunker = MirrorListingChunker()
+    async for data in response.content.iter_chunked(MIRROR_LISTING_CHUNK_SIZE):
+        for chunk in chunker.feed(data):
+            yield chunk
+    for chunk in chunker.close():
+        yield chunk
+
+
+def parse_listing_chunk(chunk: bytes) -> MirrorIndexColumns:
+    # Runs in a worker process, the columns are sent back as a few arrays and lists
+    tokenizer: MirrorListingTokenizer = MirrorListingTokenizer()
+    rows: MirrorIndexColumns = MirrorIndexColumns()
+    for entry in itertools.chain(tokenizer.feed(chunk), tokenizer.close()):
+        rows.append(parse_listing_entry(entry))
+    return rows
+
+
+async def parse_listing_chunks(chunks: AsyncIterator[bytes], workers: int = MIRROR_LISTING_PARSE_WORKERS) -> MirrorIndexColumns:
+    rows: MirrorIndexColumns = MirrorIndexColumns()
+    if workers <= 1:
+        async for chunk in chunks:
+            rows.extend(parse_listing_chunk(chunk))
+        return rows
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    parsed: list[asyncio.Future] = []
+    pool: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        # Blocks are submitted as they arrive, so parsing overlaps with the download of the rest
+        async for chunk in chunks:
+            parsed.append(loop.run_in_executor(pool, parse_listing_chunk, chunk))
+        for i, future in enumerate(parsed, 1):
+            # Merged in listing order
+            rows.extend(await future)
+            if i % 10 == 0:
+                logger.info(f"Parsed {len(rows)} source files")
+    finally:
+        # Waiting for the workers to exit must not block the event loop, blocks not yet parsed are dropped on failure
+        await asyncio.to_thread(pool.shutdown, cancel_futures=True)
+    return rows
+
+
+@cache
+def listing_day_timestamp(day: str) -> int:
+    # "28-Feb-2019" => epoch seconds of its midnight (UTC), the listing has a few thousand distinct days
+    return calendar.timegm((int(day[7:11]), LISTING_MONTHS[day[3:6]], int(day[0:2]), 0, 0, 0))
+
+
+def parse_listing_date(value: str) -> int:
+    # Fixed nginx autoindex format "28-Feb-2019 00:24", dateutil is only used for anything else
+    if len(value) == 17 and value[2] == value[6] == '-' and value[11] == ' ' and value[14] == ':':
+        try:
+            return listing_day_timestamp(value[:11]) + int(value[12:14]) * 3600 + int(value[15:17]) * 60
+        except (KeyError, ValueError):
+            pass
+    return to_timestamp(parse(value))
+
+
+def parse_listing_entry(entry: MirrorListingEntry) -> MirrorIndexRow:
+    source_name_split: list[str] = entry.file_name.split('.')
+    # [0] - package_name
+    # [1] - source type (source | docs | tar => not present => main)
+    # [-1], [-2] - file suffix
+    # [-3] - potential version such as r15878
+    size_is_exact: bool = not entry.size[-1].isalpha()
+    package_size: float = round(int(entry.size) / 1024, 2) if size_is_exact else float(entry.size[:-1])
+
+    package_type_str: str = source_name_split[1].lower()
+    package_type: PackageTypes = PackageTypes.MAIN
+    if package_type_str == 'doc':
+        package_type = PackageTypes.DOC
+    elif package_type_str == 'source':
+        package_type = PackageTypes.SOURCE
+
+    version_specific: bool = source_name_split[-3][0] == 'r' or any([tag in entry.file_name for tag in ARCHITECTURES_SPECIFIC_PREFIXES])
+    return MirrorIndexRow(
+        file_name=entry.file_name,
+        package=source_name_split[0],
+        version_specific=version_specific,
+        version=source_name_split[-3] if version_specific else '',
+        type=package_type,
+        upload_time=parse_listing_date(entry.upload_date),
+        size=package_size,
+        size_bytes=int(entry.size) if size_is_exact else 0
+    )
+
+
+async def parse_mirror(requests_handler: RequestsHandler, force_update: bool = False, export_json: bool = False, mirror_index: MirrorIndex | None = None) -> MirrorIndex:
     logger.info("Acquiring available source files list")
-    if is_cache_valid(FILES_CACHE_PATH) and not force_update:
+    # An already opened index (kept by long-running processes) is revalidated in place
+    mirror_index = mirror_index or MirrorIndex(MIRROR_INDEX_PATH)
+    if is_cache_valid(mirror_index.checked_at) and not mirror_index.is_empty and not force_update:
         logger.info("Found valid cached data")
-        if not FILES_CACHE_PATH.is_file():
-            FILES_CACHE_PATH.touch()
-        with open(FILES_CACHE_PATH, 'r') as f:
-            return AvailableSourcesSchema.model_validate_json(f.read())
-    if force_update:
-        logger.info("Force update requested. Ignoring cache")
-    elif FILES_CACHE_PATH.is_file():
-        logger.info("Found outdated cache, refetching...")
-    soup: BeautifulSoup = await get_soup(requests_handler, MIRROR_BASE_URL)
-    packages_data: list[PageElement] = list(soup.find('pre').children)[2:]
-    packages_data_parsed: AvailableSourcesSchema = AvailableSourcesSchema()
-    logger.info("Starting parsing process. May take a while")
-    for i in range(0, len(packages_data), 2):
-        if i % 10000 == 0:
-            logger.info(f"Parsed {i // 2}/{len(packages_data) // 2} source files")
-        page_elements_package: PageElement = packages_data[i]
-        page_elements_metadata: PageElement = packages_data[i + 1]
-
-        source_name_split: list[str] = page_elements_package.text.split('.')
-        # [0] - package_name
-        # [1] - source type (source | docs | tar => not present => main)
-        # [-1], [-2] - file suffix
-        # [-3] - potential version such as r15878
-        upload_date_str, package_size_str = page_elements_metadata.text.rsplit(maxsplit=1)
-        upload_date: datetime = parse(upload_date_str)
-        package_size: float = round(int(package_size_str) / 1024, 2) if not package_size_str[-1].isalpha() else float(package_size_str[:-1])
-
-        package_type_str: str = source_name_split[1].lower()
-        package_type: PackageTypes = PackageTypes.MAIN
-        if package_type_str == 'doc':
-            package_type = PackageTypes.DOC
-        elif package_type_str == 'source':
-            package_type = PackageTypes.SOURCE
-
-        package_storage: PackageMetadataSchema = packages_data_parsed.files[source_name_split[0]]
-        file_data: FileMetadataSchema = FileMetadataSchema(type=package_type, upload_time=upload_date, size=package_size)
-        if source_name_split[-3][0] == 'r' or any([tag in page_elements_package.text for tag in ARCHITECTURES_SPECIFIC_PREFIXES]):
-            file_data.version = source_name_split[-3]
-            package_storage.version_specific.append(file_data)
-        else:
-            package_storage.general.append(file_data)
-    logger.info("Parsing completed")
-    with open(FILES_CACHE_PATH, 'w') as f:
-        f.write(json.dumps(packages_data_parsed.model_dump(), indent=4, sort_keys=True, default=str))
-    logger.info("Saved parsed data for future reuse")
-    return packages_data_parsed
+    else:
+        seen_checked_at: datetime | None = mirror_index.checked_at
+        async with hold_lock(FileLock(MIRROR_INDEX_LOCK_PATH)):
+            # Another process may have refreshed the index while this one was waiting for the lock
+            if mirror_index.checked_at != seen_checked_at and is_cache_valid(mirror_index.checked_at) and not mirror_index.is_empty:
+                logger.info("Mirror index was refreshed by another process")
+            else:
+                if force_update:
+                    logger.info("Force update requested. Revalidating cache")
+                elif not mirror_index.is_empty:
+                    logger.info("Found outdated cache, revalidating...")
+                await refresh_mirror_index(requests_handler, mirror_index)
+    if export_json:
+        mirror_index.export_json(FILES_CACHE_PATH)
+    return mirror_index
+
+
+async def refresh_mirror_index(requests_handler: RequestsHandler, mirror_index: MirrorIndex) -> None:
+    stored: int = mirror_index.count()
+
+    async def fetch(base_url: str) -> tuple[str, MirrorListing | None]:
+        listing: MirrorListing | None = await fetch_mirror_listing(requests_handler, mirror_index.listing_validators(base_url), base_url)
+        # Applying an empty or truncated listing would remove most of the index
+        if listing is not None and (not listing.rows or len(listing.rows) < stored * MIRROR_LISTING_MIN_RATIO):
+            raise IncompleteListingError(base_url, len(listing.rows), stored)
+        return base_url, listing
+
+    try:
+        base_url, listing = await requests_handler.mirrors.run(fetch, "Mirror listing")
+    except MIRROR_ERRORS as e:
+        check_for_exit_condition(True, message=f"Failed to retrieve mirror listing from every mirror ({type(e).__name__}: {e})")
+    if listing is None:
+        mirror_index.mark_unchanged()
+        logger.info("Mirror listing has not changed since the last check")
+        return
+    delta: MirrorIndexDelta = mirror_index.apply_listing(listing.rows, listing.etag, listing.last_modified, base_url)
+    logger.info(f"Saved parsed data for future reuse. Added: {delta.added} Changed: {delta.changed} Removed: {delta.removed}")
@@ -0,0 +1,36 @@
+import asyncio
+
+from typing import Awaitable, Callable
+
+
+class StageGraph:
+    # Every stage starts as soon as the stages it depends on have finished and receives their results in order,
+    # stages without a path between them run concurrently
+    def __init__(self):
+        self.__stages: dict[str, tuple[Callable[..., Awaitable], tuple[str, ...]]] = {}
+
+    def add(self, name: str, operation: Callable[..., Awaitable], *dependencies: str) -> None:
+        # Dependencies have to be added first, so the graph can not contain cycles
+        for dependency in dependencies:
+            if dependency not in self.__stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+        self.__stages[name] = (operation, dependencies)
+
+    async def run(self) -> dict[str, any]:
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str) -> any:
+            operation, dependencies = self.__stages[name]
+            return await operation(*[await tasks[dependency] for dependency in dependencies])
+
+        for name in self.__stages:
+            tasks[name] = asyncio.create_task(run_stage(name), name=name)
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            # The first failure stops every stage still running
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,152 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+
+from pathlib import Path
+
+from src.constants import (
+    TARBALL_CACHE_PATH, DOWNLOAD_CHUNK_SIZE, TARBALL_CACHE_MAX_AGE, TARBALL_CACHE_MAX_BYTES, TARBALL_CACHE_PRUNE_INTERVAL
+)
+from src.schemas.cache import TarballCacheEntrySchema
+from src.schemas.package_data import FileMetadataSchema
+from src.services.work_dir import write_atomic
+from src.utils import create_logger
+
+logger = create_logger('TarballCache', logging.INFO)
+
+
+def file_sha1(file_path: Path) -> str:
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def link_or_copy(source: Path, destination: Path) -> None:
+    # Linked or copied under a temporary name first, another process never sees a partial file at destination.
+    # The name is unique per call, threads of one process materializing the same file do not share it
+    tmp_path: Path = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}")
+    try:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            # Hardlinks are not possible across file systems
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+        # rename does nothing when both names already link to the same file, the temporary one would be left behind
+        tmp_path.unlink(missing_ok=True)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+class TarballCache:
+    # objects/<sha1[:2]>/<sha1> holds the content, keys/<key>.json maps mirror metadata to an object
+    def __init__(self, path: Path = TARBALL_CACHE_PATH):
+        self.objects_path: Path = Path.joinpath(path, 'objects')
+        self.keys_path: Path = Path.joinpath(path, 'keys')
+        self.pruned_marker_path: Path = Path.joinpath(path, '.pruned')
+
+    @staticmethod
+    def __key(file_name: str, source_data: FileMetadataSchema) -> str:
+        # A new upload of the same file on the mirror changes the key, so stale entries are never hit.
+        # Listings without exact sizes fall back to the rounded one, lookup still compares exact sizes when known
+        size: int | float = source_data.size_bytes or source_data.size
+        return hashlib.sha1(f"{file_name}|{source_data.upload_time.isoformat()}|{size}".encode()).hexdigest()
+
+    def __object_path(self, sha1: str) -> Path:
+        return Path.joinpath(self.objects_path, sha1[:2], sha1)
+
+    def __key_path(self, file_name: str, source_data: FileMetadataSchema) -> Path:
+        return Path.joinpath(self.keys_path, f"{self.__key(file_name, source_data)}.json")
+
+    def find(self, sha1: str) -> Path | None:
+        object_path: Path = self.__object_path(sha1)
+        return object_path if object_path.is_file() else None
+
+    def lookup(self, file_name: str, source_data: FileMetadataSchema) -> TarballCacheEntrySchema | None:
+        key_path: Path = self.__key_path(file_name, source_data)
+        if not key_path.is_file():
+            return None
+        entry: TarballCacheEntrySchema = TarballCacheEntrySchema.model_validate_json(key_path.read_text())
+        if source_data.size_bytes not in (0, entry.size_bytes):
+            return None
+        object_path: Path = self.__object_path(entry.sha1)
+        if not object_path.is_file() or object_path.stat().st_size != entry.size_bytes:
+            logger.warning(f"Cached {file_name} is missing or truncated. Discarding entry")
+            key_path.unlink(missing_ok=True)
+            return None
+        return entry
+
+    def verify(self, entry: TarballCacheEntrySchema) -> bool:
+        object_path: Path = self.__object_path(entry.sha1)
+        if file_sha1(object_path) == entry.sha1:
+            return True
+        logger.warning(f"Cached {entry.file_name} is corrupted. Discarding object")
+        object_path.unlink(missing_ok=True)
+        return False
+
+    def materialize(self, entry: TarballCacheEntrySchema, destination: Path) -> None:
+        object_path: Path = self.__object_path(entry.sha1)
+        # mtime of an object is its last use, pruning removes the least recently used ones first
+        os.utime(object_path)
+        link_or_copy(object_path, destination)
+
+    def store(self, file_name: str, source_data: FileMetadataSchema, file_path: Path, sha1: str) -> None:
+        object_path: Path = self.__object_path(sha1)
+        if not object_path.is_file():
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            link_or_copy(file_path, object_path)
+        entry: TarballCacheEntrySchema = TarballCacheEntrySchema(
+            file_name=file_name,
+            upload_time=source_data.upload_time,
+            size=source_data.size,
+            sha1=sha1,
+            size_bytes=object_path.stat().st_size
+        )
+        key_path: Path = self.__key_path(file_name, source_data)
+        write_atomic(key_path, entry.model_dump_json())
+
+    def prune(self, max_age: float = TARBALL_CACHE_MAX_AGE.total_seconds(), max_bytes: int = TARBALL_CACHE_MAX_BYTES) -> None:
+        objects: list[tuple[float, int, Path]] = []
+        for object_path in self.objects_path.glob('*/*'):
+            try:
+                stat: os.stat_result = object_path.stat()
+            except FileNotFoundError:
+                continue
+            objects.append((stat.st_mtime, stat.st_size, object_path))
+        objects.sort()
+        total_bytes: int = sum(size for _, size, _ in objects)
+        expired_before: float = time.time() - max_age
+        removed: int = 0
+        for mtime, size, object_path in objects:
+            if mtime >= expired_before and total_bytes <= max_bytes:
+                break
+            object_path.unlink(missing_ok=True)
+            total_bytes -= size
+            removed += 1
+        if removed:
+            logger.info(f"Removed {removed} cached tarballs, {total_bytes} bytes remain")
+        for key_path in self.keys_path.glob('*.json'):
+            try:
+                entry: TarballCacheEntrySchema = TarballCacheEntrySchema.model_validate_json(key_path.read_text())
+            except (FileNotFoundError, ValueError):
+                key_path.unlink(missing_ok=True)
+                continue
+            if not self.__object_path(entry.sha1).is_file():
+                key_path.unlink(missing_ok=True)
+
+    def prune_if_due(self) -> None:
+        # Every run stores new objects, but scanning the whole cache once per interval is enough
+        try:
+            if time.time() - self.pruned_marker_path.stat().st_mtime < TARBALL_CACHE_PRUNE_INTERVAL.total_seconds():
+                return
+        except FileNotFoundError:
+            if not self.objects_path.is_dir():
+                return
+        self.pruned_marker_path.touch()
+        self.prune()
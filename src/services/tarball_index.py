@@ -0,0 +1,200 @@
+import asyncio
+import sqlite3
+import logging
+
+from datetime import datetime
+from pathlib import Path
+
+from src.constants import PackageTypes, TARBALL_INDEX_PATH, MIRROR_INDEX_BUSY_TIMEOUT
+from src.schemas.package_data import DownloadedFileSchema
+from src.schemas.reports import TarballDiffSchema
+from src.schemas.tarball import TarballMember
+from src.services.directory_structure import list_tarball, list_tarballs
+from src.services.tarball_cache import TarballCache
+from src.utils import create_logger
+
+logger = create_logger('TarballIndex', logging.INFO)
+
+
+class TarballIndex:
+    # tarballs: one row per listed content (sha1), members: its member list, latest: current tarball of every package and type
+    __SCHEMA_VERSION: str = "1"
+
+    def __init__(self, path: Path = TARBALL_INDEX_PATH):
+        self.path: Path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.__connection: sqlite3.Connection = sqlite3.connect(path, timeout=MIRROR_INDEX_BUSY_TIMEOUT, check_same_thread=False)
+        self.__connection.execute("PRAGMA journal_mode = WAL")
+        self.__create_schema()
+
+    def __create_schema(self) -> None:
+        with self.__connection:
+            self.__connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            if self.__get_metadata("schema_version") not in (None, self.__SCHEMA_VERSION):
+                logger.info("Tarball index format changed, discarding old index")
+                for table in ("tarballs", "members", "latest"):
+                    self.__connection.execute(f"DROP TABLE IF EXISTS {table}")
+                self.__connection.execute("DELETE FROM metadata")
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS tarballs ("
+                "sha1 TEXT PRIMARY KEY, "
+                "file_name TEXT NOT NULL, "
+                "package TEXT NOT NULL, "
+                "type INTEGER NOT NULL, "
+                "indexed_at TEXT NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS members ("
+                "sha1 TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                # Order of the member in the archive
+                "position INTEGER NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "mode INTEGER NOT NULL, "
+                "is_dir INTEGER NOT NULL, "
+                "PRIMARY KEY (sha1, path)"
+                ") WITHOUT ROWID"
+            )
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS members_path ON members (path)")
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS latest ("
+                "package TEXT NOT NULL, "
+                "type INTEGER NOT NULL, "
+                "sha1 TEXT NOT NULL, "
+                "PRIMARY KEY (package, type)"
+                ") WITHOUT ROWID"
+            )
+            self.__connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('schema_version', ?)", (self.__SCHEMA_VERSION,))
+
+    def __get_metadata(self, key: str) -> str | None:
+        row: tuple | None = self.__connection.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    def contains(self, sha1: str) -> bool:
+        return self.__connection.execute("SELECT 1 FROM tarballs WHERE sha1 = ?", (sha1,)).fetchone() is not None
+
+    def get_members(self, sha1: str) -> list[TarballMember] | None:
+        if not self.contains(sha1):
+            return None
+        return [
+            TarballMember(path, size, mode, bool(is_dir))
+            for path, size, mode, is_dir in self.__connection.execute(
+                "SELECT path, size, mode, is_dir FROM members WHERE sha1 = ? ORDER BY position", (sha1,)
+            )
+        ]
+
+    def add(self, sha1: str, file_name: str, package: str, file_type: PackageTypes, members: list[TarballMember], latest: bool = True) -> None:
+        with self.__connection:
+            cursor: sqlite3.Cursor = self.__connection.execute(
+                "INSERT OR IGNORE INTO tarballs (sha1, file_name, package, type, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (sha1, file_name, package, file_type, datetime.now().isoformat())
+            )
+            # Same content listed by another process or update: its members are already there
+            if cursor.rowcount:
+                self.__connection.executemany(
+                    "INSERT OR IGNORE INTO members (sha1, path, position, size, mode, is_dir) VALUES (?, ?, ?, ?, ?, ?)",
+                    ((sha1, member.path, position, member.size, member.mode, member.is_dir) for position, member in enumerate(members))
+                )
+            if latest:
+                self.__connection.execute(
+                    "INSERT OR REPLACE INTO latest (package, type, sha1) VALUES (?, ?, ?)", (package, file_type, sha1)
+                )
+
+    def packages_of(self, path: str) -> list[str]:
+        # Packages whose current tarballs ship the path (tarball paths with or without "./")
+        path = path.removeprefix('./')
+        return [
+            package
+            for package, in self.__connection.execute(
+                "SELECT DISTINCT latest.package FROM members JOIN latest ON latest.sha1 = members.sha1 "
+                "WHERE members.path IN (?, ?) ORDER BY latest.package",
+                (path, f"./{path}")
+            )
+        ]
+
+    def __paths(self, query: str, *parameters: str) -> list[str]:
+        return [path for path, in self.__connection.execute(query, parameters)]
+
+    def diff(self, old_sha1: str, new_sha1: str) -> tuple[list[str], list[str], list[str]] | None:
+        # Added, removed and changed files, None if either tarball was never listed
+        if not self.contains(old_sha1) or not self.contains(new_sha1):
+            return None
+        only_in: str = (
+            "SELECT path FROM members WHERE sha1 = ? AND NOT is_dir "
+            "EXCEPT SELECT path FROM members WHERE sha1 = ? AND NOT is_dir ORDER BY path"
+        )
+        return (
+            self.__paths(only_in, new_sha1, old_sha1),
+            self.__paths(only_in, old_sha1, new_sha1),
+            self.__paths(
+                "SELECT new_member.path FROM members AS new_member "
+                "JOIN members AS old_member ON old_member.sha1 = ? AND old_member.path = new_member.path "
+                "WHERE new_member.sha1 = ? AND NOT new_member.is_dir "
+                "AND (new_member.size != old_member.size OR new_member.mode != old_member.mode) ORDER BY new_member.path",
+                old_sha1, new_sha1
+            )
+        )
+
+
+async def index_tarballs(tarball_index: TarballIndex, package: str, data_path: Path, saved_files: list[DownloadedFileSchema]) -> tuple[dict[str, list[TarballMember]], int]:
+    # Tarballs whose content was listed before are read from the index, returns the members and the number of such hits
+    saved: dict[str, DownloadedFileSchema] = {file_data.path.name: file_data for file_data in saved_files}
+    known: dict[str, list[TarballMember]] = {}
+    for file_name, file_data in saved.items():
+        members: list[TarballMember] | None = tarball_index.get_members(file_data.sha1)
+        if members is not None:
+            known[file_name] = members
+    tarballs: dict[str, list[TarballMember]] = await list_tarballs(data_path, known)
+    for file_name, members in tarballs.items():
+        if file_name in saved:
+            tarball_index.add(saved[file_name].sha1, file_name, package, saved[file_name].type, members)
+    return tarballs, len(known)
+
+
+async def diff_tarballs(tarball_index: TarballIndex, package: str, old_hashes: dict[PackageTypes, str], saved_files: list[DownloadedFileSchema], tarball_cache: TarballCache | None = None) -> list[TarballDiffSchema]:
+    # old_hashes: tarballs of the previous version from the hash file, compared with the saved ones of the same type
+    tarball_cache = tarball_cache or TarballCache()
+    diffs: list[TarballDiffSchema] = []
+    for file_data in sorted(saved_files, key=lambda x: x.path.name):
+        diff: TarballDiffSchema = TarballDiffSchema(
+            file_name=file_data.path.name, type=file_data.type, old_sha1=old_hashes.get(file_data.type, ""), new_sha1=file_data.sha1
+        )
+        diffs.append(diff)
+        if not diff.old_sha1:
+            continue
+        # The previous tarball may still be in the tarball cache when it was indexed by nothing yet
+        cached_path: Path | None = tarball_cache.find(diff.old_sha1) if not tarball_index.contains(diff.old_sha1) else None
+        if cached_path is not None:
+            members: list[TarballMember] = await asyncio.to_thread(list_tarball, cached_path)
+            tarball_index.add(diff.old_sha1, diff.file_name, package, diff.type, members, latest=False)
+        changes: tuple[list[str], list[str], list[str]] | None = tarball_index.diff(diff.old_sha1, diff.new_sha1)
+        if changes is not None:
+            diff.known = True
+            diff.added, diff.removed, diff.changed = changes
+            # Only packages updated through the tarball index are known here
+            for path in diff.added:
+                packages: list[str] = [other for other in tarball_index.packages_of(path) if other != package]
+                if packages:
+                    diff.conflicts[path] = packages
+    return diffs
+
+
+def log_tarball_diffs(diffs: list[TarballDiffSchema]) -> None:
+    for diff in diffs:
+        if not diff.known:
+            logger.info(f"{diff.file_name}: previous tarball was never listed, file structure change is unknown")
+            continue
+        if not diff.is_structure_changed:
+            logger.info(f"{diff.file_name}: file structure unchanged ({len(diff.changed)} files changed)")
+            continue
+        logger.warning(f"File structure of {diff.file_name} changed: {diff}")
+        for path in diff.added:
+            logger.warning(f"{diff.type.name}: + {path}")
+            if path in diff.conflicts:
+                logger.warning(f"{diff.type.name}: {path} is also shipped by {', '.join(diff.conflicts[path])}")
+        for path in diff.removed:
+            logger.warning(f"{diff.type.name}: - {path}")
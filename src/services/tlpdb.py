@@ -0,0 +1,98 @@
+import lzma
+import asyncio
+import logging
+
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urljoin
+
+from src.constants import TLPDB_FILE, TLPDB_PATH
+from src.schemas.tlpdb import TlpdbPackageSchema, TlpdbSchema
+from src.services.network_requests import RequestsHandler, MirrorError, MIRROR_ERRORS
+from src.services.work_dir import FileLock, hold_lock, write_atomic
+from src.utils import create_logger, is_cache_valid
+
+logger = create_logger('Tlpdb', logging.INFO)
+
+
+def parse_tlpdb(content: bytes) -> dict[str, TlpdbPackageSchema]:
+    # Records of "key value" lines separated by blank lines, only the fields the scan needs are read
+    packages: dict[str, TlpdbPackageSchema] = {}
+    package: TlpdbPackageSchema | None = None
+    for line in lzma.decompress(content).split(b'\n'):
+        if line.startswith(b'name '):
+            name: str = line[5:].decode()
+            # Architecture specific binaries (name.x86_64-linux) and infrastructure (00texlive.*) are not packaged separately
+            package = TlpdbPackageSchema() if '.' not in name else None
+            if package is not None:
+                packages[name] = package
+        elif package is None:
+            continue
+        elif line.startswith(b'revision '):
+            package.revision = int(line[9:])
+        elif line.startswith(b'catalogue-version '):
+            package.catalogue_version = line[18:].decode(errors='replace').strip()
+    return packages
+
+
+def load_tlpdb_cache(path: Path = TLPDB_PATH) -> TlpdbSchema | None:
+    if not path.is_file():
+        return None
+    try:
+        return TlpdbSchema.model_validate_json(path.read_text())
+    except ValueError:
+        return None
+
+
+def save_tlpdb_cache(tlpdb: TlpdbSchema, path: Path = TLPDB_PATH) -> None:
+    write_atomic(path, tlpdb.model_dump_json())
+
+
+async def load_tlpdb(requests_handler: RequestsHandler, force_update: bool = False) -> TlpdbSchema:
+    cached: TlpdbSchema | None = load_tlpdb_cache()
+    if cached is not None and is_cache_valid(cached.checked_at) and not force_update:
+        return cached
+    async with hold_lock(FileLock.next_to(TLPDB_PATH)):
+        latest: TlpdbSchema | None = load_tlpdb_cache()
+        # Another process may have fetched the database while this one was waiting for the lock
+        if latest is not None and is_cache_valid(latest.checked_at) and (cached is None or latest.checked_at != cached.checked_at):
+            logger.info("TeX Live package database was refreshed by another process")
+            return latest
+        return await fetch_tlpdb(requests_handler, latest)
+
+
+async def fetch_tlpdb(requests_handler: RequestsHandler, cached: TlpdbSchema | None) -> TlpdbSchema:
+    async def fetch(base_url: str) -> TlpdbSchema | None:
+        url: str = urljoin(base_url, TLPDB_FILE)
+        # Validators of a database fetched from another mirror do not apply
+        headers: dict[str, str] = cached.validators if cached is not None and cached.source_url == url else {}
+
+        async def request() -> TlpdbSchema | None:
+            async with requests_handler.request('GET', url, headers=headers) as response:
+                if response.status == 304:
+                    return None
+                if not response.ok:
+                    raise MirrorError(url, response.status)
+                content: bytes = await response.read()
+                return TlpdbSchema(
+                    source_url=url,
+                    etag=response.headers.get('ETag', ''),
+                    last_modified=response.headers.get('Last-Modified', ''),
+                    packages=await asyncio.to_thread(parse_tlpdb, content)
+                )
+        return await requests_handler.retry(request, url, requests_handler.mirrors.retries)
+
+    logger.info("Acquiring TeX Live package database")
+    try:
+        tlpdb: TlpdbSchema | None = await requests_handler.mirrors.run(fetch, "TeX Live package database")
+    except (*MIRROR_ERRORS, lzma.LZMAError) as e:
+        logger.warning(f"Failed to retrieve TeX Live package database ({type(e).__name__}: {e})")
+        return cached or TlpdbSchema()
+    if tlpdb is None:
+        logger.info("TeX Live package database has not changed since the last check")
+        cached.checked_at = datetime.now()
+        tlpdb = cached
+    else:
+        logger.info(f"Parsed {len(tlpdb.packages)} packages of the TeX Live package database")
+    save_tlpdb_cache(tlpdb)
+    return tlpdb
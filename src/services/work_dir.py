@@ -0,0 +1,115 @@
+import os
+import time
+import asyncio
+import logging
+import tempfile
+import itertools
+
+from contextlib import asynccontextmanager
+from functools import cache
+from pathlib import Path
+from typing import AsyncIterator
+
+from src.constants import WORKSPACES_PATH, FILE_LOCK_POLL_INTERVAL
+from src.utils import create_logger
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+logger = create_logger('WorkDir', logging.INFO)
+
+
+class FileLock:
+    # Exclusive advisory lock shared by every process using the work directory.
+    # Locks are bound to the open file, so two FileLock objects of one process exclude each other as well
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self.__file_descriptor: int | None = None
+
+    @classmethod
+    def next_to(cls, path: Path) -> 'FileLock':
+        return cls(path.with_name(path.name + '.lock'))
+
+    def acquire(self, blocking: bool = True) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor: int = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        while True:
+            try:
+                if os.name == 'nt':
+                    msvcrt.locking(file_descriptor, msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(file_descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.__file_descriptor = file_descriptor
+                return True
+            except OSError:
+                if not blocking:
+                    os.close(file_descriptor)
+                    return False
+            # Neither flock nor msvcrt can wait without blocking the thread forever, so the lock is polled
+            time.sleep(FILE_LOCK_POLL_INTERVAL)
+
+    def release(self) -> None:
+        if self.__file_descriptor is None:
+            return
+        if os.name == 'nt':
+            os.lseek(self.__file_descriptor, 0, os.SEEK_SET)
+            msvcrt.locking(self.__file_descriptor, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.__file_descriptor, fcntl.LOCK_UN)
+        os.close(self.__file_descriptor)
+        self.__file_descriptor = None
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+
+@asynccontextmanager
+async def hold_lock(lock: FileLock) -> AsyncIterator[FileLock]:
+    # The lock is polled on the event loop: a cancelled wait leaves no worker thread behind that could take the lock later
+    if not lock.acquire(blocking=False):
+        logger.info(f"Waiting for another process holding {lock.path.name}")
+        while not lock.acquire(blocking=False):
+            await asyncio.sleep(FILE_LOCK_POLL_INTERVAL)
+    try:
+        yield lock
+    finally:
+        lock.release()
+
+
+def write_atomic(path: Path, content: str | bytes, mode: int | None = None) -> None:
+    # Readers in other processes see either the previous file or the complete new one.
+    # The temporary file is only readable by the owner unless mode is given
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(content.encode() if isinstance(content, str) else content)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+# Locks of the taken workspace slots live as long as the process
+__workspace_locks: list[FileLock] = []
+
+
+@cache
+def workspace_path() -> Path:
+    # Every process clones and downloads in its own slot of WORKSPACES_PATH, so parallel instances never share a checkout.
+    # A slot is released when its process exits and the checkouts left in it are reused by the next process taking it
+    for slot in itertools.count():
+        lock: FileLock = FileLock(Path.joinpath(WORKSPACES_PATH, f"{slot}.lock"))
+        if lock.acquire(blocking=False):
+            __workspace_locks.append(lock)
+            path: Path = Path.joinpath(WORKSPACES_PATH, str(slot))
+            path.mkdir(parents=True, exist_ok=True)
+            return path
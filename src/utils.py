@@ -1,16 +1,31 @@
-import fileinput
 import logging
 import os
 import sys
+import threading
 
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Callable
+from functools import cache
+from typing import Callable, TYPE_CHECKING
 from pathlib import Path
 from sys import exit
 
 
 from .constants import ExitStatus, BOOLEAN_INPUT_ANSWERS, ACCEPT_VALUES, CRASH_LOG_PATH, CACHE_LIFESPAN
-from .schemas.package_data import SpecFileDataSchema
+
+if TYPE_CHECKING:
+    # Importing the schemas builds pydantic models, which is kept off the startup path
+    from .schemas.package_data import SpecFileDataSchema
+
+
+# Held while a prompt waits for an answer: records of stages running meanwhile are written once it is answered
+console_lock: threading.RLock = threading.RLock()
+
+
+class ConsoleHandler(logging.StreamHandler):
+    def emit(self, record: logging.LogRecord) -> None:
+        with console_lock:
+            super().emit(record)
 
 
 def create_logger(name: str, level, file_path: Path | None = None) -> logging.Logger:
@@ -18,7 +33,7 @@ def create_logger(name: str, level, file_path: Path | None = None) -> logging.Lo
     if file_path and not file_path.is_file():
         file_path.parent.mkdir(parents=True, exist_ok=True)
         file_path.touch()
-    output_handler = logging.FileHandler(file_path) if file_path is not None else logging.StreamHandler(sys.stdout)
+    output_handler = logging.FileHandler(file_path) if file_path is not None else ConsoleHandler(sys.stdout)
     output_handler.setLevel(level)
     output_handler.setFormatter(formatter)
 
@@ -29,12 +44,27 @@ def create_logger(name: str, level, file_path: Path | None = None) -> logging.Lo
     logger.propagate = False
     return logger
 
-error_logger = create_logger('Crash', logging.CRITICAL, CRASH_LOG_PATH)
+@cache
+def get_error_logger() -> logging.Logger:
+    # Created on first use so that plain imports do not touch the work directory
+    return create_logger('Crash', logging.CRITICAL, CRASH_LOG_PATH)
+
+# Set for unattended runs (batch updates) so that a failing package aborts only its own job
+non_interactive: ContextVar[bool] = ContextVar('non_interactive', default=False)
+
+
+class TaskAbortedError(Exception):
+    def __init__(self, message: str, type: ExitStatus = ExitStatus.ERROR):
+        super().__init__(message)
+        self.type: ExitStatus = type
+
 
 def handle_input(text: str, validator: Callable) -> str:
-    data: str = input(text)
-    while not validator(data):
+    # Prompts may come from worker threads (git), other stages keep running but do not print over the question
+    with console_lock:
         data: str = input(text)
+        while not validator(data):
+            data: str = input(text)
     return data.strip()
 
 
@@ -43,21 +73,6 @@ def handle_bool_input(text: str) -> bool:
     return input_value.lower() in ACCEPT_VALUES
 
 
-def normalize_line_endings(file_paths: list[Path]) -> None:
-    for file_path in file_paths:
-        with open(file_path, 'rb') as file:
-            content = file.read()
-
-        # Replace CRLF (Windows-style) with LF (Unix-style)
-        content = content.replace(b'\r\n', b'\n')
-        # Replace CR (old Mac-style) with LF (Unix-style)
-        content = content.replace(b'\r', b'\n')
-
-        with open(file_path, 'wb') as file:
-            file.write(content)
-    logging.info("Replaced CRLF and CR with LF")
-
-
 def check_for_exit_condition(
         data: any,
         error_checker: Callable = lambda x: x,
@@ -73,40 +88,89 @@ def check_for_exit_condition(
         logging.info(message)
 
     if error:
-        error_logger.critical(error)
-    input("Press any key to continue\n")
+        get_error_logger().critical(error)
+    if non_interactive.get():
+        raise TaskAbortedError(message, type)
+    with console_lock:
+        input("Press any key to continue\n")
     exit()
 
 
-def iter_file(file_path: Path, action: Callable, remove_single_quotes: bool = True, read_only: bool = False) -> None:
-    f = fileinput.input(file_path, inplace=True)
-    for line in f:
-        if line == '\n':
-            sys.stdout.write(line)
+def rpmvercmp(a: str, b: str) -> int:
+    # Same ordering as rpm: alphanumeric segments compared one by one, numbers numerically and newer than letters,
+    # "~" sorts before anything (1.0~rc1 < 1.0) and "^" after the end but before anything else (1.0 < 1.0^1 < 1.0.1)
+    if a == b:
+        return 0
+
+    def is_alnum(char: str) -> bool:
+        return char.isascii() and char.isalnum()
+
+    i: int = 0
+    j: int = 0
+    while i < len(a) or j < len(b):
+        while i < len(a) and not is_alnum(a[i]) and a[i] not in '~^':
+            i += 1
+        while j < len(b) and not is_alnum(b[j]) and b[j] not in '~^':
+            j += 1
+        a_char: str = a[i] if i < len(a) else ''
+        b_char: str = b[j] if j < len(b) else ''
+        if a_char == '~' or b_char == '~':
+            if a_char != '~':
+                return 1
+            if b_char != '~':
+                return -1
+            i, j = i + 1, j + 1
             continue
-        words: list[str] = line.split()
-        section: str = words[0].replace('"', '').replace(':', '').lower()
-        new_content: str | None = action(section, line, words)
-        if read_only:
-            sys.stdout.write(line)
+        if a_char == '^' or b_char == '^':
+            if not a_char:
+                return -1
+            if not b_char:
+                return 1
+            if a_char != '^':
+                return 1
+            if b_char != '^':
+                return -1
+            i, j = i + 1, j + 1
             continue
-        if remove_single_quotes:
-            new_content = new_content.replace("'", '')
-        sys.stdout.write(new_content)
-    f.close()
-
-
-def is_update_needed(old_package: SpecFileDataSchema, proposed_update: SpecFileDataSchema) -> bool:
+        if not a_char or not b_char:
+            break
+        is_number: bool = a_char.isdigit()
+        segment_check: Callable[[str], bool] = (lambda x: x.isascii() and x.isdigit()) if is_number else (lambda x: x.isascii() and x.isalpha())
+        a_end: int = i
+        while a_end < len(a) and segment_check(a[a_end]):
+            a_end += 1
+        b_end: int = j
+        while b_end < len(b) and segment_check(b[b_end]):
+            b_end += 1
+        a_segment: str = a[i:a_end]
+        b_segment: str = b[j:b_end]
+        if not b_segment:
+            # Segments of different kinds: numbers are newer
+            return 1 if is_number else -1
+        if is_number:
+            a_segment, b_segment = a_segment.lstrip('0'), b_segment.lstrip('0')
+            if len(a_segment) != len(b_segment):
+                return 1 if len(a_segment) > len(b_segment) else -1
+        if a_segment != b_segment:
+            return 1 if a_segment > b_segment else -1
+        i, j = a_end, b_end
+    if i >= len(a) and j >= len(b):
+        return 0
+    # The version with segments left is newer
+    return -1 if i >= len(a) else 1
+
+
+def is_update_needed(old_package: 'SpecFileDataSchema', proposed_update: 'SpecFileDataSchema') -> bool:
     if old_package.epoch != proposed_update.epoch:
         return old_package.epoch < proposed_update.epoch
-    if old_package.version != proposed_update.version:
-        # TODO. packaging Version returns an error
-        return True
+    version_order: int = rpmvercmp(old_package.version, proposed_update.version)
+    if version_order != 0:
+        return version_order < 0
     if old_package.release != proposed_update.release:
         return old_package.release < proposed_update.release
     return False
 
-def is_cache_valid(cache_path: Path) -> bool:
-    if not cache_path.is_file():
+def is_cache_valid(checked_at: datetime | None) -> bool:
+    if checked_at is None:
         return False
-    return (datetime.fromtimestamp(cache_path.stat().st_mtime) + CACHE_LIFESPAN) > datetime.today()
\ No newline at end of file
+    return (checked_at + CACHE_LIFESPAN) > datetime.today()
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Constants are read on the first import of src, tests never touch the real work directory
+os.environ.setdefault('ABF_UPDATER_WORK_DIR', tempfile.mkdtemp(prefix='abf_updater_tests_'))
@@ -0,0 +1,33 @@
+import asyncio
+
+from src.actions.batch import BatchUpdater
+from src.schemas.tasks import BatchUpdateTaskDataSchema
+from src.schemas.user_data import LoginDataSchema
+from src.services.ctan import CtanVersionProvider
+from src.services.network_requests import RequestsHandler
+
+
+def default_data() -> BatchUpdateTaskDataSchema:
+    return BatchUpdateTaskDataSchema(repo_urls=["https://abf.io/import/texlive-a.git"], delete_comments=False, push=False)
+
+
+def test_default_concurrency_limits_are_integers():
+    data: BatchUpdateTaskDataSchema = default_data()
+    for field in ('git_concurrency', 'ctan_concurrency', 'download_concurrency', 'upload_concurrency'):
+        assert type(getattr(data, field)) is int
+
+
+def test_default_schema_survives_daemon_round_trip():
+    # Daemon jobs are stored with model_dump and validated again when they run
+    data: BatchUpdateTaskDataSchema = default_data()
+    assert BatchUpdateTaskDataSchema.model_validate(data.model_dump()) == data
+
+
+def test_batch_updater_is_built_from_default_schema():
+    async def build() -> None:
+        requests_handler: RequestsHandler = RequestsHandler()
+        try:
+            BatchUpdater(requests_handler, CtanVersionProvider(requests_handler), LoginDataSchema(email='a@b', password=''), default_data())
+        finally:
+            await requests_handler.close_session()
+    asyncio.run(build())
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from aiohttp import web
+
+from benchmarks.stand_ins import start_stand_in, create_ctan_app
+from src.schemas.package_data import SpecFileDataSchema
+from src.services.ctan import CtanVersionProvider, normalize_version
+from src.services.network_requests import RequestsHandler
+from src.utils import non_interactive, TaskAbortedError
+
+
+async def with_provider(versions: dict[str, str], check, json_api: bool = True, **kwargs) -> None:
+    app: web.Application = create_ctan_app(versions)
+    requested: list[str] = []
+
+    @web.middleware
+    async def record(request: web.Request, handler) -> web.StreamResponse:
+        requested.append(request.path)
+        if not json_api and request.path.startswith('/json/'):
+            return web.Response(status=404)
+        return await handler(request)
+
+    app.middlewares.append(record)
+    runner, base_url = await start_stand_in(app)
+    requests_handler: RequestsHandler = RequestsHandler()
+    token = non_interactive.set(True)
+    try:
+        await check(CtanVersionProvider(requests_handler, base_url, **kwargs), requested)
+    finally:
+        non_interactive.reset(token)
+        await requests_handler.close_session()
+        await runner.cleanup()
+
+
+def test_normalize_version():
+    assert normalize_version('1.2 2020-01-01') == '1.2'
+    assert normalize_version('2020-01-01') == '20200101'
+    assert normalize_version('  ') == ''
+
+
+def test_versions_are_cached_within_lifespan():
+    versions: dict[str, str] = {'pkg': '1.0 2020-01-01'}
+
+    async def check(provider: CtanVersionProvider, requested: list[str]) -> None:
+        assert await provider.get_version('pkg') == '1.0'
+        versions['pkg'] = '1.1 2021-01-01'
+        assert await provider.get_version('pkg') == '1.0'
+    asyncio.run(with_provider(versions, check))
+
+
+def test_expired_versions_and_package_list_are_requested_again():
+    # A long-running daemon has to see releases published after its first job
+    versions: dict[str, str] = {'pkg': '1.0 2020-01-01'}
+
+    async def check(provider: CtanVersionProvider, requested: list[str]) -> None:
+        assert await provider.get_versions(['pkg', 'new']) == {'pkg': '1.0', 'new': None}
+        versions['pkg'] = '1.1 2021-01-01'
+        versions['new'] = '2.0 2021-01-01'
+        assert await provider.get_versions(['pkg', 'new']) == {'pkg': '1.1', 'new': '2.0'}
+    asyncio.run(with_provider(versions, check, cache_lifespan=0))
+
+
+def test_json_api_versions():
+    versions: dict[str, str] = {'pkg': '1.0 2020-01-01', 'dated': '2021-02-03'}
+
+    async def check(provider: CtanVersionProvider, requested: list[str]) -> None:
+        data: SpecFileDataSchema = await provider.get_package_data(SpecFileDataSchema(name='texlive-dated', version='0'))
+        assert (data.name, data.version) == ('texlive-dated', '20210203')
+        assert '/pkg/dated' not in requested
+    asyncio.run(with_provider(versions, check))
+
+
+def test_unknown_package_is_rejected_without_a_request():
+    async def check(provider: CtanVersionProvider, requested: list[str]) -> None:
+        assert await provider.get_version('missing') is None
+        assert requested == ['/json/2.0/packages']
+        with pytest.raises(TaskAbortedError):
+            await provider.get_package_data(SpecFileDataSchema(name='texlive-missing', version='0'))
+    asyncio.run(with_provider({'pkg': '1.0 2020-01-01'}, check))
+
+
+def test_falls_back_to_package_page_without_json_api():
+    async def check(provider: CtanVersionProvider, requested: list[str]) -> None:
+        data: SpecFileDataSchema = await provider.get_package_data(SpecFileDataSchema(name='texlive-pkg', version='0'))
+        assert (data.name, data.version) == ('texlive-pkg', '1.0')
+        assert requested[-1] == '/pkg/pkg'
+    asyncio.run(with_provider({'pkg': '1.0 2020-01-01'}, check, json_api=False))
+
+
+def test_unknown_package_page_aborts_without_json_api():
+    async def check(provider: CtanVersionProvider, requested: list[str]) -> None:
+        with pytest.raises(TaskAbortedError):
+            await provider.get_package_data(SpecFileDataSchema(name='texlive-missing', version='0'))
+    asyncio.run(with_provider({'pkg': '1.0 2020-01-01'}, check, json_api=False))
@@ -0,0 +1,91 @@
+import asyncio
+import stat
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from pathlib import Path
+
+from src.daemon import UpdaterDaemon, create_app, start_site
+from src.schemas.daemon import JobType, JobStatus
+from src.schemas.user_data import UserDataSchema, LoginDataSchema
+
+
+async def post_jobs(body: str) -> tuple[int, dict]:
+    daemon: UpdaterDaemon = UpdaterDaemon(UserDataSchema(abf_credentials=LoginDataSchema(email='a@b', password='')))
+    client: TestClient = TestClient(TestServer(create_app(daemon)))
+    await client.start_server()
+    try:
+        response = await client.post('/jobs', data=body, headers={'Content-Type': 'application/json'})
+        return response.status, await response.json()
+    finally:
+        await client.close()
+        await daemon.requests_handler.close_session()
+
+
+def test_malformed_body_is_rejected():
+    status, payload = asyncio.run(post_jobs('{"type": "update"'))
+    assert status == 400
+    assert 'not valid JSON' in payload['error']
+
+
+def test_non_object_bodies_are_rejected():
+    for body in ('["update"]', '"update"', '5', 'null'):
+        status, payload = asyncio.run(post_jobs(body))
+        assert status == 400, body
+        assert payload['error'] == "Request body must be a JSON object"
+
+
+def test_invalid_repo_urls_are_rejected():
+    status, _ = asyncio.run(post_jobs('{"type": "update", "repo_urls": "a", "delete_comments": false, "push": false}'))
+    assert status == 400
+
+
+def test_valid_job_is_accepted():
+    status, payload = asyncio.run(post_jobs('{"type": "update", "repo_urls": ["pkg"], "delete_comments": false, "push": false}'))
+    assert status == 202
+    assert payload['status'] == 'QUEUED'
+
+
+async def request_with_token(token: str | None, headers: dict[str, str]) -> int:
+    daemon: UpdaterDaemon = UpdaterDaemon(UserDataSchema(abf_credentials=LoginDataSchema(email='a@b', password='')))
+    client: TestClient = TestClient(TestServer(create_app(daemon, token)))
+    await client.start_server()
+    try:
+        return (await client.get('/jobs', headers=headers)).status
+    finally:
+        await client.close()
+        await daemon.requests_handler.close_session()
+
+
+def test_token_is_required_when_set():
+    assert asyncio.run(request_with_token('secret', {})) == 401
+    assert asyncio.run(request_with_token('secret', {'Authorization': 'Bearer wrong'})) == 401
+    assert asyncio.run(request_with_token('secret', {'Authorization': 'Bearer secret'})) == 200
+    assert asyncio.run(request_with_token(None, {})) == 200
+
+
+def test_socket_is_private(tmp_path: Path):
+    async def start() -> int:
+        runner: web.AppRunner = web.AppRunner(web.Application())
+        await runner.setup()
+        try:
+            await start_site(runner, tmp_path / 'daemon.sock', None)
+            return stat.S_IMODE((tmp_path / 'daemon.sock').stat().st_mode)
+        finally:
+            await runner.cleanup()
+    assert asyncio.run(start()) == 0o600
+
+
+def test_oldest_finished_jobs_are_forgotten():
+    async def run() -> list[int]:
+        daemon: UpdaterDaemon = UpdaterDaemon(UserDataSchema(abf_credentials=LoginDataSchema(email='a@b', password='')), finished_jobs_limit=2)
+        try:
+            for i in range(5):
+                daemon.submit(JobType.PARSE_MIRROR, {}).status = JobStatus.RUNNING if i == 0 else JobStatus.FINISHED
+            daemon.submit(JobType.PARSE_MIRROR, {})
+            daemon.forget_finished_jobs()
+            return list(daemon.jobs)
+        finally:
+            await daemon.requests_handler.close_session()
+    # The running and the queued job are kept whatever their age
+    assert asyncio.run(run()) == [1, 4, 5, 6]
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import random
+
+import pytest
+
+from aiohttp import web
+from datetime import datetime
+from pathlib import Path
+
+import src.services.network_requests as network_requests
+from benchmarks.stand_ins import start_stand_in, create_mirror_app
+from src.constants import PackageTypes
+from src.schemas.package_data import FileMetadataSchema, DownloadedFileSchema, PartialDownloadSchema
+from src.services.mirrors import MirrorSelector
+from src.services.network_requests import RequestsHandler, new_partial_download, partial_download_paths, save_partial_download
+from src.services.tarball_cache import TarballCache
+
+CONTENT: bytes = random.Random(0).randbytes(1000)
+
+
+def source_data(upload_time: datetime = datetime(2024, 1, 1)) -> FileMetadataSchema:
+    return FileMetadataSchema(type=PackageTypes.MAIN, upload_time=upload_time, size=round(len(CONTENT) / 1024, 2), size_bytes=len(CONTENT))
+
+
+async def download(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, app: web.Application, source: FileMetadataSchema) -> list[DownloadedFileSchema]:
+    runner, base_url = await start_stand_in(app)
+    requests_handler: RequestsHandler = RequestsHandler()
+    requests_handler.tarball_cache = TarballCache(tmp_path / 'cache')
+    selector: MirrorSelector = MirrorSelector(requests_handler, [f"{base_url}/archive/"], tmp_path / 'ranking.json')
+    monkeypatch.setattr(RequestsHandler, 'mirrors', property(lambda self: selector))
+    try:
+        return await requests_handler.download_files('pkg', tmp_path / 'data', [source])
+    finally:
+        await requests_handler.close_session()
+        await runner.cleanup()
+
+
+def recording_mirror(files_path: Path, ranges: list[str | None]) -> web.Application:
+    (files_path / 'pkg.tar.xz').write_bytes(CONTENT)
+
+    @web.middleware
+    async def record(request: web.Request, handler) -> web.StreamResponse:
+        ranges.append(request.headers.get('Range'))
+        return await handler(request)
+
+    app: web.Application = create_mirror_app(b'', files_path)
+    app.middlewares.append(record)
+    return app
+
+
+def assert_downloaded(saved_files: list[DownloadedFileSchema], source: FileMetadataSchema) -> None:
+    assert len(saved_files) == 1
+    assert saved_files[0].path.read_bytes() == CONTENT
+    assert saved_files[0].sha1 == hashlib.sha1(CONTENT).hexdigest()
+    assert not any(path.exists() for path in partial_download_paths('pkg.tar.xz', source))
+
+
+def test_large_files_are_split_into_segments(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(network_requests, 'DOWNLOAD_SEGMENT_THRESHOLD', 100)
+    state: PartialDownloadSchema = new_partial_download(tmp_path / 'pkg.part', source_data())
+    assert [(segment.start, segment.end) for segment in state.segments] == [(0, 250), (250, 500), (500, 750), (750, 1000)]
+    assert (tmp_path / 'pkg.part').stat().st_size == 1000
+    assert len(new_partial_download(tmp_path / 'pkg.part', source_data(), segmented=False).segments) == 1
+
+
+def test_segmented_download(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(network_requests, 'DOWNLOAD_SEGMENT_THRESHOLD', 100)
+    ranges: list[str | None] = []
+    source: FileMetadataSchema = source_data(datetime(2024, 1, 2))
+    assert_downloaded(asyncio.run(download(tmp_path, monkeypatch, recording_mirror(tmp_path, ranges), source)), source)
+    assert sorted(ranges) == ['bytes=0-249', 'bytes=250-499', 'bytes=500-749', 'bytes=750-999']
+
+
+def test_resume_from_saved_state(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    # A previous run received the beginning of two segments, data/ of the checkout was emptied since
+    monkeypatch.setattr(network_requests, 'DOWNLOAD_SEGMENT_THRESHOLD', 100)
+    source: FileMetadataSchema = source_data(datetime(2024, 1, 3))
+    partial_path, state_path = partial_download_paths('pkg.tar.xz', source)
+    state: PartialDownloadSchema = new_partial_download(partial_path, source)
+    with open(partial_path, 'r+b') as file:
+        for segment, received in zip(state.segments, (100, 0, 250, 0)):
+            file.seek(segment.start)
+            file.write(CONTENT[segment.start:segment.start + received])
+            segment.received = received
+    save_partial_download(state_path, state)
+
+    ranges: list[str | None] = []
+    assert_downloaded(asyncio.run(download(tmp_path, monkeypatch, recording_mirror(tmp_path, ranges), source)), source)
+    assert sorted(ranges) == ['bytes=100-249', 'bytes=250-499', 'bytes=750-999']
+
+
+def test_server_ignoring_range_is_downloaded_as_a_whole(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(network_requests, 'DOWNLOAD_SEGMENT_THRESHOLD', 100)
+    ranges: list[str | None] = []
+
+    async def whole_file(request: web.Request) -> web.Response:
+        ranges.append(request.headers.get('Range'))
+        return web.Response(body=CONTENT)
+
+    app: web.Application = web.Application()
+    app.router.add_get('/archive/{name}', whole_file)
+    source: FileMetadataSchema = source_data(datetime(2024, 1, 4))
+    assert_downloaded(asyncio.run(download(tmp_path, monkeypatch, app, source)), source)
+    assert ranges[-1] is None
@@ -0,0 +1,75 @@
+from src.constants import PackageTypes
+from src.schemas.package_data import IncludedFileSchema
+from src.schemas.reports import FilesVerificationReportSchema
+from src.schemas.tarball import TarballMember
+from src.services.files_verification import PathIndex, expand_braces, verify_package_files
+
+PATHS: list[str] = [
+    'doc/latex/pkg/README.md',
+    'doc/latex/pkg/pkg.pdf',
+    'tex/latex/pkg/pkg.sty',
+    'tex/latex/pkg/pkg.cfg',
+    'tex/latex/pkg/sub/extra.tex',
+    'tex/latex/pkg-extra/other.sty',
+    'tex/latex/pkg.sty'
+]
+
+
+def make_index() -> PathIndex:
+    return PathIndex([(path, PackageTypes.MAIN) for path in PATHS])
+
+
+def unclaimed_paths(index: PathIndex) -> list[str]:
+    return [path for path, _ in index.unclaimed()]
+
+
+def test_directory_claims_its_subtree_only():
+    index: PathIndex = make_index()
+    assert index.claim('tex/latex/pkg') == 3
+    # "pkg-extra" and "pkg.sty" share the prefix but are not below the directory
+    assert unclaimed_paths(index) == ['doc/latex/pkg/README.md', 'doc/latex/pkg/pkg.pdf', 'tex/latex/pkg-extra/other.sty', 'tex/latex/pkg.sty']
+
+
+def test_exact_file_and_missing_path():
+    index: PathIndex = make_index()
+    assert index.claim('./tex/latex/pkg.sty') == 1
+    assert index.claim('tex/latex/missing') == 0
+    assert 'tex/latex/pkg.sty' not in unclaimed_paths(index)
+
+
+def test_wildcards_do_not_cross_directories():
+    index: PathIndex = make_index()
+    assert index.claim('tex/latex/pkg/*.sty') == 1
+    assert index.claim('tex/latex/pkg/pkg.[cs]?[gy]') == 2
+    assert index.claim('tex/latex/pkg/*') == 3
+    assert index.claim('tex/latex/pkg*') == 5
+    assert index.claim('doc/latex/pkg/[!R]*') == 1
+
+
+def test_expand_braces():
+    assert expand_braces('tex/{latex,generic}/pkg') == ['tex/latex/pkg', 'tex/generic/pkg']
+    assert expand_braces('doc/{a,b}/{c,d}') == ['doc/a/c', 'doc/a/d', 'doc/b/c', 'doc/b/d']
+    assert expand_braces('tex/{latex}/pkg') == ['tex/{latex}/pkg']
+
+
+def test_verify_package_files():
+    tarballs: dict[str, list[TarballMember]] = {
+        'pkg.tar.xz': [
+            TarballMember('./tex/latex/pkg/', 0, 0o755, True),
+            TarballMember('./tex/latex/pkg/pkg.sty', 10, 0o644, False),
+            TarballMember('./tlpkg/tlpobj/pkg.tlpobj', 10, 0o644, False)
+        ],
+        'pkg.doc.tar.xz': [
+            TarballMember('./doc/latex/pkg/pkg.pdf', 10, 0o644, False),
+            TarballMember('./doc/latex/pkg/README.md', 10, 0o644, False)
+        ]
+    }
+    report: FilesVerificationReportSchema = verify_package_files([
+        IncludedFileSchema(type=None, path='%{_texmfdistdir}/tex/latex/pkg'),
+        IncludedFileSchema(type=PackageTypes.DOC, path='%{_texmfdistdir}/doc/latex/pkg/*.pdf'),
+        IncludedFileSchema(type=PackageTypes.DOC, path='%{_texmfdistdir}/doc/latex/pkg/{CHANGES,NEWS}'),
+        IncludedFileSchema(type=None, path='%{_datadir}/pkg')
+    ], tarballs)
+    assert report.missing == {PackageTypes.DOC: ['%{_texmfdistdir}/doc/latex/pkg/{CHANGES,NEWS}']}
+    assert report.unclaimed == {PackageTypes.DOC: ['doc/latex/pkg/README.md']}
+    assert report.skipped == ['%{_datadir}/pkg']
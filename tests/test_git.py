@@ -0,0 +1,26 @@
+from pathlib import Path
+
+from benchmarks.synthetic import create_package_remote
+from src.services.directory_structure import clear_stale_sources
+from src.services.git import clone_repo, checkout_latest
+
+
+def test_reused_checkout_keeps_data(tmp_path: Path):
+    remote_path: Path = create_package_remote(tmp_path, 'pkg', '1.0')
+    checkout: Path = tmp_path / 'texlive-pkg'
+    checkout_latest(clone_repo(str(remote_path), checkout, True))
+    (checkout / 'data' / 'pkg.tar.xz').write_bytes(b'tarball')
+    (checkout / 'leftover.txt').write_text('removed by git clean')
+
+    checkout_latest(clone_repo(str(remote_path), checkout, True))
+    assert (checkout / 'data' / 'pkg.tar.xz').read_bytes() == b'tarball'
+    assert not (checkout / 'leftover.txt').exists()
+    assert (checkout / 'texlive-pkg.spec').is_file()
+
+
+def test_clear_stale_sources(tmp_path: Path):
+    for name in ('pkg.tar.xz', 'pkg.doc.tar.xz', 'old.source.tar.xz'):
+        (tmp_path / name).write_bytes(b'')
+    (tmp_path / 'extracted').mkdir()
+    clear_stale_sources(tmp_path, {'pkg.tar.xz', 'pkg.doc.tar.xz', 'pkg.source.tar.xz'})
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['pkg.doc.tar.xz', 'pkg.tar.xz']
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+from src.schemas.metrics import SpanSchema
+from src.services.metrics import MetricsRecorder, parse_totals
+
+
+def run_task(recorder: MetricsRecorder, files: int) -> None:
+    recorder.start_task('UPDATE')
+    recorder.record(SpanSchema(task='UPDATE', stage='download', duration=0.5, bytes=1024, files=files))
+    recorder.export_textfile()
+
+
+def test_runs_add_to_exported_counters(tmp_path: Path):
+    textfile_path: Path = tmp_path / 'metrics.prom'
+    first: MetricsRecorder = MetricsRecorder(None, textfile_path)
+    second: MetricsRecorder = MetricsRecorder(None, textfile_path)
+    run_task(first, 1)
+    run_task(second, 2)
+    run_task(first, 4)
+    # A process exports only what it recorded since its previous export
+    first.export_textfile()
+
+    totals = parse_totals(textfile_path.read_text())
+    assert list(totals) == [('UPDATE', 'download')]
+    assert totals['UPDATE', 'download'].count == 3
+    assert totals['UPDATE', 'download'].files == 7
+    assert totals['UPDATE', 'download'].bytes == 3072
+    assert totals['UPDATE', 'download'].duration == 1.5
+    assert textfile_path.read_text().endswith("# EOF\n")
+    # Each process still serves only its own totals
+    assert parse_totals(first.render_textfile())['UPDATE', 'download'].files == 5
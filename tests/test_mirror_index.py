@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.stand_ins import start_stand_in, create_mirror_app
+from benchmarks.synthetic import generate_listing, LISTING_HEADER, LISTING_FOOTER
+from src.constants import PackageTypes
+from src.services.mirror_index import MirrorIndex, MirrorIndexRow, MirrorIndexDelta
+from src.services.mirrors import MirrorSelector
+from src.services.network_requests import RequestsHandler
+from src.services.parsers import refresh_mirror_index
+from src.utils import non_interactive, TaskAbortedError
+
+
+def make_row(file_name: str, upload_time: int = 1000, size_bytes: int = 2048) -> MirrorIndexRow:
+    return MirrorIndexRow(file_name, file_name.split('.')[0], False, '', PackageTypes.MAIN, upload_time, round(size_bytes / 1024, 2), size_bytes)
+
+
+def test_apply_listing_reports_deltas(tmp_path: Path):
+    mirror_index: MirrorIndex = MirrorIndex(tmp_path / 'index.db')
+    assert mirror_index.apply_listing([make_row('a.tar.xz'), make_row('b.tar.xz'), make_row('c.tar.xz')], '"1"') == MirrorIndexDelta(3, 0, 0)
+    update_time: datetime | None = mirror_index.update_time
+
+    assert mirror_index.apply_listing([make_row('a.tar.xz'), make_row('b.tar.xz'), make_row('c.tar.xz')], '"1"') == MirrorIndexDelta(0, 0, 0)
+    assert mirror_index.update_time == update_time
+
+    delta: MirrorIndexDelta = mirror_index.apply_listing(
+        [make_row('a.tar.xz'), make_row('b.tar.xz', upload_time=2000), make_row('d.tar.xz', size_bytes=4096)], '"2"', source_url='http://mirror/'
+    )
+    assert delta == MirrorIndexDelta(added=1, changed=1, removed=1)
+    assert [(row.file_name, row.upload_time, row.size_bytes) for row in mirror_index.rows()] == [
+        ('a.tar.xz', 1000, 2048), ('b.tar.xz', 2000, 2048), ('d.tar.xz', 1000, 4096)
+    ]
+    assert mirror_index.update_time > update_time
+    assert mirror_index.listing_validators('http://mirror/') == {'If-None-Match': '"2"'}
+    assert mirror_index.listing_validators('http://other/') == {}
+
+
+async def refresh_from(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, mirror_index: MirrorIndex, listings: list[bytes]) -> None:
+    # Every listing is served by its own stand-in mirror, tried in the given order
+    runners = []
+    urls: list[str] = []
+    for i, listing in enumerate(listings):
+        runner, base_url = await start_stand_in(create_mirror_app(listing, tmp_path, etag=f'"listing-{i}"'))
+        runners.append(runner)
+        urls.append(f"{base_url}/archive/")
+    requests_handler: RequestsHandler = RequestsHandler()
+    selector: MirrorSelector = MirrorSelector(requests_handler, urls, tmp_path / 'ranking.json')
+    monkeypatch.setattr(MirrorSelector, 'ranked', lambda self: asyncio.sleep(0, list(urls)))
+    monkeypatch.setattr(RequestsHandler, 'mirrors', property(lambda self: selector))
+    token = non_interactive.set(True)
+    try:
+        await refresh_mirror_index(requests_handler, mirror_index)
+    finally:
+        non_interactive.reset(token)
+        await requests_handler.close_session()
+        for runner in runners:
+            await runner.cleanup()
+
+
+def test_truncated_listing_fails_over_to_next_mirror(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    mirror_index: MirrorIndex = MirrorIndex(tmp_path / 'index.db')
+    asyncio.run(refresh_from(tmp_path, monkeypatch, mirror_index, [generate_listing(200)]))
+    assert mirror_index.count() == 200
+
+    empty: bytes = (LISTING_HEADER + LISTING_FOOTER).encode()
+    truncated: bytes = generate_listing(200)[:len(generate_listing(200)) // 3]
+    asyncio.run(refresh_from(tmp_path, monkeypatch, mirror_index, [empty, truncated, generate_listing(190)]))
+    assert mirror_index.count() == 190
+    assert mirror_index.get_metadata("source_url").endswith('/archive/')
+    assert mirror_index.get_metadata("etag") == '"listing-2"'
+
+
+def test_index_is_kept_when_every_listing_is_empty(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    mirror_index: MirrorIndex = MirrorIndex(tmp_path / 'index.db')
+    asyncio.run(refresh_from(tmp_path, monkeypatch, mirror_index, [generate_listing(50)]))
+    with pytest.raises(TaskAbortedError):
+        asyncio.run(refresh_from(tmp_path, monkeypatch, mirror_index, [b"<html></html>"]))
+    assert mirror_index.count() == 50
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from aiohttp import web
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.stand_ins import start_stand_in, create_mirror_app
+from benchmarks.synthetic import generate_listing
+from src.constants import PackageTypes
+from src.schemas.mirrors import MirrorRankingSchema
+from src.schemas.package_data import FileMetadataSchema, DownloadedFileSchema
+from src.services.mirrors import MirrorSelector, load_ranking
+from src.services.network_requests import RequestsHandler
+from src.services.tarball_cache import TarballCache
+
+CONTENT: bytes = b'tarball' * 100
+
+
+def create_failing_app() -> web.Application:
+    async def unavailable(request: web.Request) -> web.Response:
+        return web.Response(status=503)
+
+    app: web.Application = web.Application()
+    app.router.add_route('*', '/{tail:.*}', unavailable)
+    return app
+
+
+async def with_mirrors(tmp_path: Path, operation) -> tuple[list[str], object]:
+    # Fresh, stale (synced two days earlier) and failing stand-in mirrors, passed to operation in reverse order of preference
+    (tmp_path / 'pkg.tar.xz').write_bytes(CONTENT)
+    apps: list[web.Application] = [
+        create_failing_app(),
+        create_mirror_app(generate_listing(20), tmp_path, last_sync=datetime(2024, 5, 1, tzinfo=timezone.utc)),
+        create_mirror_app(generate_listing(20), tmp_path, last_sync=datetime(2024, 5, 3, tzinfo=timezone.utc))
+    ]
+    runners = []
+    urls: list[str] = []
+    for app in apps:
+        runner, base_url = await start_stand_in(app)
+        runners.append(runner)
+        urls.append(f"{base_url}/archive/")
+    requests_handler: RequestsHandler = RequestsHandler()
+    try:
+        return urls, await operation(requests_handler, urls)
+    finally:
+        await requests_handler.close_session()
+        for runner in runners:
+            await runner.cleanup()
+
+
+def test_probe_ranks_fresh_then_stale_then_failing(tmp_path: Path):
+    async def rank(requests_handler: RequestsHandler, urls: list[str]) -> list[str]:
+        return await MirrorSelector(requests_handler, urls, tmp_path / 'ranking.json').ranked()
+
+    (failing, stale, fresh), ranked = asyncio.run(with_mirrors(tmp_path, rank))
+    assert ranked == [fresh, stale, failing]
+    ranking: MirrorRankingSchema = load_ranking(tmp_path / 'ranking.json')
+    probes = {probe.url: probe for probe in ranking.probes}
+    assert probes[stale].stale and not probes[fresh].stale
+    assert probes[fresh].throughput and probes[fresh].latency is not None
+    assert probes[failing].error.endswith("http code 503")
+
+
+def test_download_fails_over_and_demotes_failing_mirror(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    # The ranking predates the failure, the failing mirror is still tried first
+    source: FileMetadataSchema = FileMetadataSchema(type=PackageTypes.MAIN, upload_time=datetime(2024, 1, 1), size=0.68, size_bytes=len(CONTENT))
+
+    async def download(requests_handler: RequestsHandler, urls: list[str]) -> tuple[list[DownloadedFileSchema], list[str]]:
+        selector: MirrorSelector = MirrorSelector(requests_handler, urls, tmp_path / 'ranking.json')
+        monkeypatch.setattr(RequestsHandler, 'mirrors', property(lambda self: selector))
+        requests_handler.tarball_cache = TarballCache(tmp_path / 'cache')
+        saved_files: list[DownloadedFileSchema] = await requests_handler.download_files('pkg', tmp_path / 'data', [source])
+        return saved_files, await selector.ranked()
+
+    monkeypatch.setattr(MirrorSelector, '_MirrorSelector__rank', lambda self: asyncio.sleep(0, list(self.urls)))
+    (failing, stale, fresh), (saved_files, ranked) = asyncio.run(with_mirrors(tmp_path, download))
+    assert [saved_file.path.read_bytes() for saved_file in saved_files] == [CONTENT]
+    assert ranked == [stale, fresh, failing]
+
+
+def test_run_without_mirrors_raises_descriptive_error(tmp_path: Path):
+    async def run() -> None:
+        requests_handler: RequestsHandler = RequestsHandler()
+        try:
+            await MirrorSelector(requests_handler, [], tmp_path / 'ranking.json').run(asyncio.sleep, "Mirror listing")
+        finally:
+            await requests_handler.close_session()
+
+    with pytest.raises(ValueError, match="Mirror listing has no mirror to run on"):
+        asyncio.run(run())
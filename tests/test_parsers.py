@@ -0,0 +1,101 @@
+import asyncio
+import itertools
+
+import pytest
+
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import generate_listing, listing_file_names
+from src.constants import PackageTypes
+from src.schemas.package_data import MirrorListingEntry
+from src.services.mirror_index import MirrorIndexRow
+from src.services.parsers import MirrorListingTokenizer, MirrorListingChunker, parse_listing_chunks, parse_listing_entry, parse_listing_date
+
+# Rows as served by the nginx autoindex of mirror.truenetwork.ru
+LISTING: bytes = (
+    b'<html>\r\n<head><title>Index of /CTAN/systems/texlive/tlnet/archive/</title></head>\r\n'
+    b'<body>\r\n<h1>Index of /CTAN/systems/texlive/tlnet/archive/</h1><hr><pre><a href="../">../</a>\r\n'
+    b'<a href="subdir/">subdir/</a>                                            01-Jan-2024 00:00                   -\r\n'
+    b'<a href="12many.doc.tar.xz">12many.doc.tar.xz</a>                                  28-Feb-2019 00:24              329012\r\n'
+    b'<a href="12many.source.tar.xz">12many.source.tar.xz</a>                               28-Feb-2019 00:24                4252\r\n'
+    b'<a href="12many.tar.xz">12many.tar.xz</a>                                      28-Feb-2019 00:24                1052\r\n'
+    b'<a href="a2ping.x86_64-linux.r52213.tar.xz">a2ping.x86_64-linux.r52213.tar.xz</a>                  05-Oct-2019 19:21                 340\r\n'
+    b'<a href="aastex%2Bfix.tar.xz">aastex+fix.tar.xz</a>                                  11-Mar-2021 17:05                1.2M\r\n'
+    b'<a href="collection-latexrecommended.x86_64-linux.tar.xz">collection-latexrecommended.x86_64-linux.tar.x..&gt;</a> 11-Mar-2021 17:05                 412\r\n'
+    b'</pre><hr></body>\r\n</html>\r\n'
+)
+EXPECTED: list[MirrorListingEntry] = [
+    MirrorListingEntry('12many.doc.tar.xz', '28-Feb-2019 00:24', '329012'),
+    MirrorListingEntry('12many.source.tar.xz', '28-Feb-2019 00:24', '4252'),
+    MirrorListingEntry('12many.tar.xz', '28-Feb-2019 00:24', '1052'),
+    MirrorListingEntry('a2ping.x86_64-linux.r52213.tar.xz', '05-Oct-2019 19:21', '340'),
+    MirrorListingEntry('aastex+fix.tar.xz', '11-Mar-2021 17:05', '1.2M'),
+    MirrorListingEntry('collection-latexrecommended.x86_64-linux.tar.xz', '11-Mar-2021 17:05', '412')
+]
+
+
+def tokenize(listing: bytes, chunk_size: int) -> list[MirrorListingEntry]:
+    tokenizer: MirrorListingTokenizer = MirrorListingTokenizer()
+    chunks: list[bytes] = [listing[i:i + chunk_size] for i in range(0, len(listing), chunk_size)]
+    return list(itertools.chain(*[tokenizer.feed(chunk) for chunk in chunks], tokenizer.close()))
+
+
+def test_tokenizer_skips_directories_and_unquotes_names():
+    assert tokenize(LISTING, len(LISTING)) == EXPECTED
+
+
+def test_tokenizer_is_independent_of_chunk_boundaries():
+    for chunk_size in (1, 7, 64, 1000):
+        assert tokenize(LISTING, chunk_size) == EXPECTED
+
+
+def test_tokenizer_parses_last_row_without_newline():
+    assert tokenize(b'<a href="pkg.tar.xz">pkg.tar.xz</a>   28-Feb-2019 00:24   10', 5) == [
+        MirrorListingEntry('pkg.tar.xz', '28-Feb-2019 00:24', '10')
+    ]
+
+
+def test_synthetic_listing_is_tokenized_completely():
+    listing: bytes = generate_listing(500)
+    assert [entry.file_name for entry in tokenize(listing, 4096)] == listing_file_names(500)
+
+
+def test_parse_listing_entry():
+    doc, source, main, binary, inexact, _ = [parse_listing_entry(entry) for entry in EXPECTED]
+    assert (doc.package, doc.type, doc.size_bytes, doc.size) == ('12many', PackageTypes.DOC, 329012, round(329012 / 1024, 2))
+    assert (source.type, main.type, main.version_specific) == (PackageTypes.SOURCE, PackageTypes.MAIN, False)
+    assert (binary.version_specific, binary.version) == (True, 'r52213')
+    assert (inexact.size, inexact.size_bytes) == (1.2, 0)
+
+
+def test_parse_listing_date():
+    expected: int = int(datetime(2019, 2, 28, 0, 24, tzinfo=timezone.utc).timestamp())
+    assert parse_listing_date('28-Feb-2019 00:24') == expected
+
+
+def test_chunked_parse_matches_single_pass():
+    listing: bytes = generate_listing(300)
+
+    async def chunks(chunk_size: int):
+        chunker: MirrorListingChunker = MirrorListingChunker(chunk_size)
+        for i in range(0, len(listing), 1000):
+            for chunk in chunker.feed(listing[i:i + 1000]):
+                yield chunk
+        for chunk in chunker.close():
+            yield chunk
+
+    single: list[MirrorIndexRow] = list(asyncio.run(parse_listing_chunks(chunks(len(listing) * 2), workers=1)))
+    split: list[MirrorIndexRow] = list(asyncio.run(parse_listing_chunks(chunks(4096), workers=1)))
+    pooled: list[MirrorIndexRow] = list(asyncio.run(parse_listing_chunks(chunks(4096), workers=2)))
+    assert len(single) == 300
+    assert split == single
+    assert pooled == single
+
+
+def test_interrupted_listing_stops_the_pool():
+    async def chunks():
+        yield generate_listing(50)
+        raise ConnectionResetError("listing interrupted")
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(parse_listing_chunks(chunks(), workers=2))
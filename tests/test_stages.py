@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from src.services.stages import StageGraph
+
+
+def test_dependencies_receive_results_in_order():
+    events: list[str] = []
+
+    async def stage(name: str, delay: float, *results: str) -> str:
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        events.append(f"end {name}")
+        return name + ''.join(f"({result})" for result in results)
+
+    graph: StageGraph = StageGraph()
+    graph.add('a', lambda: stage('a', 0.02))
+    graph.add('b', lambda: stage('b', 0.01))
+    graph.add('c', lambda a, b: stage('c', 0, a, b), 'a', 'b')
+    results: dict[str, str] = asyncio.run(graph.run())
+
+    assert results == {'a': 'a', 'b': 'b', 'c': 'c(a)(b)'}
+    # Independent stages overlap, the dependent one waits for both
+    assert events[:2] == ['start a', 'start b']
+    assert events.index('start c') > max(events.index('end a'), events.index('end b'))
+
+
+def test_unknown_dependency_is_rejected():
+    graph: StageGraph = StageGraph()
+    with pytest.raises(ValueError):
+        graph.add('b', asyncio.sleep, 'a')
+
+
+def test_failure_cancels_running_and_dependent_stages():
+    cancelled: list[str] = []
+    started: list[str] = []
+
+    async def fail() -> None:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("failed")
+
+    async def slow() -> None:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append('slow')
+            raise
+
+    async def dependent(_) -> None:
+        started.append('dependent')
+
+    graph: StageGraph = StageGraph()
+    graph.add('fail', fail)
+    graph.add('slow', slow)
+    graph.add('dependent', dependent, 'fail')
+    with pytest.raises(RuntimeError, match="failed"):
+        asyncio.run(graph.run())
+    assert cancelled == ['slow']
+    assert started == []
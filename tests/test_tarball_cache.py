@@ -0,0 +1,51 @@
+import os
+import time
+import hashlib
+
+from datetime import datetime
+from pathlib import Path
+
+from src.constants import PackageTypes
+from src.schemas.package_data import FileMetadataSchema
+from src.services.tarball_cache import TarballCache
+
+
+def source_data(content: bytes) -> FileMetadataSchema:
+    return FileMetadataSchema(type=PackageTypes.MAIN, upload_time=datetime(2024, 1, 1), size=round(len(content) / 1024, 2), size_bytes=len(content))
+
+
+def store(tarball_cache: TarballCache, tmp_path: Path, file_name: str, content: bytes, age: float = 0) -> FileMetadataSchema:
+    file_path: Path = tmp_path / file_name
+    file_path.write_bytes(content)
+    sha1: str = hashlib.sha1(content).hexdigest()
+    tarball_cache.store(file_name, source_data(content), file_path, sha1)
+    if age:
+        object_path: Path = tarball_cache.find(sha1)
+        os.utime(object_path, (time.time() - age, time.time() - age))
+    return source_data(content)
+
+
+def test_exact_sizes_do_not_collide(tmp_path: Path):
+    # Both sizes round to the same number of KiB
+    tarball_cache: TarballCache = TarballCache(tmp_path / 'cache')
+    first: FileMetadataSchema = store(tarball_cache, tmp_path, 'pkg.tar.xz', b'a' * 1000)
+    second: FileMetadataSchema = source_data(b'b' * 1001)
+    assert first.size == second.size
+    assert tarball_cache.lookup('pkg.tar.xz', first) is not None
+    assert tarball_cache.lookup('pkg.tar.xz', second) is None
+
+
+def test_prune_removes_expired_then_least_recently_used(tmp_path: Path):
+    tarball_cache: TarballCache = TarballCache(tmp_path / 'cache')
+    expired: FileMetadataSchema = store(tarball_cache, tmp_path, 'expired.tar.xz', b'e' * 100, age=1000)
+    old: FileMetadataSchema = store(tarball_cache, tmp_path, 'old.tar.xz', b'o' * 100, age=200)
+    used: FileMetadataSchema = store(tarball_cache, tmp_path, 'used.tar.xz', b'u' * 100, age=300)
+    new: FileMetadataSchema = store(tarball_cache, tmp_path, 'new.tar.xz', b'n' * 100, age=100)
+    tarball_cache.materialize(tarball_cache.lookup('used.tar.xz', used), tmp_path / 'restored.tar.xz')
+
+    tarball_cache.prune(max_age=500, max_bytes=200)
+    assert tarball_cache.lookup('expired.tar.xz', expired) is None
+    assert tarball_cache.lookup('old.tar.xz', old) is None
+    assert tarball_cache.lookup('used.tar.xz', used) is not None
+    assert tarball_cache.lookup('new.tar.xz', new) is not None
+    assert len(list(tarball_cache.keys_path.iterdir())) == 2
@@ -0,0 +1,78 @@
+import io
+import asyncio
+import tarfile
+
+import pytest
+
+from pathlib import Path
+
+from src.constants import PackageTypes
+from src.schemas.package_data import DownloadedFileSchema
+from src.schemas.reports import TarballDiffSchema
+from src.schemas.tarball import TarballMember
+from src.services.directory_structure import list_tarballs
+from src.services.tarball_cache import TarballCache
+from src.services.tarball_index import TarballIndex, diff_tarballs
+
+
+def members(*paths: str, size: int = 10) -> list[TarballMember]:
+    return [TarballMember(path, 0 if path.endswith('/') else size, 0o644, path.endswith('/')) for path in paths]
+
+
+def test_members_are_kept_in_archive_order(tmp_path: Path):
+    tarball_index: TarballIndex = TarballIndex(tmp_path / 'index.db')
+    listed: list[TarballMember] = members('./tex/latex/pkg/', './tex/latex/pkg/z.sty', './tex/latex/pkg/a.sty')
+    assert tarball_index.get_members('sha1') is None
+    tarball_index.add('sha1', 'pkg.tar.xz', 'pkg', PackageTypes.MAIN, listed)
+    assert tarball_index.get_members('sha1') == listed
+
+
+def test_diff_and_packages_of(tmp_path: Path):
+    tarball_index: TarballIndex = TarballIndex(tmp_path / 'index.db')
+    tarball_index.add('old', 'pkg.tar.xz', 'pkg', PackageTypes.MAIN, members('tex/pkg/', 'tex/pkg/a.sty', 'tex/pkg/b.sty'), latest=False)
+    tarball_index.add('new', 'pkg.tar.xz', 'pkg', PackageTypes.MAIN, members('tex/pkg/') + members('tex/pkg/a.sty', size=20) + members('tex/pkg/c.sty'))
+    assert tarball_index.diff('old', 'new') == (['tex/pkg/c.sty'], ['tex/pkg/b.sty'], ['tex/pkg/a.sty'])
+    assert tarball_index.diff('old', 'unknown') is None
+    assert tarball_index.packages_of('./tex/pkg/a.sty') == ['pkg']
+    # Only the latest tarball of a package counts
+    assert tarball_index.packages_of('tex/pkg/b.sty') == []
+
+
+def test_added_files_shipped_by_other_packages_are_conflicts(tmp_path: Path):
+    tarball_index: TarballIndex = TarballIndex(tmp_path / 'index.db')
+    tarball_index.add('other', 'other.tar.xz', 'other', PackageTypes.MAIN, members('./tex/shared/common.sty'))
+    tarball_index.add('old', 'pkg.tar.xz', 'pkg', PackageTypes.MAIN, members('./tex/pkg/a.sty'), latest=False)
+    tarball_index.add('new', 'pkg.tar.xz', 'pkg', PackageTypes.MAIN, members('./tex/pkg/a.sty', './tex/pkg/b.sty', './tex/shared/common.sty'))
+    saved: list[DownloadedFileSchema] = [DownloadedFileSchema(path=tmp_path / 'pkg.tar.xz', type=PackageTypes.MAIN, sha1='new')]
+
+    diffs: list[TarballDiffSchema] = asyncio.run(
+        diff_tarballs(tarball_index, 'pkg', {PackageTypes.MAIN: 'old'}, saved, TarballCache(tmp_path / 'cache'))
+    )
+    assert len(diffs) == 1 and diffs[0].known
+    assert diffs[0].added == ['./tex/pkg/b.sty', './tex/shared/common.sty']
+    assert diffs[0].conflicts == {'./tex/shared/common.sty': ['other']}
+    assert str(diffs[0]) == "pkg.tar.xz: +2 -0 ~0 !1"
+
+
+def write_tarball(path: Path, *names: str) -> None:
+    with tarfile.open(path, 'w:xz') as tarball:
+        for name in names:
+            info: tarfile.TarInfo = tarfile.TarInfo(name)
+            info.size = len(name)
+            tarball.addfile(info, io.BytesIO(name.encode()))
+
+
+def test_list_tarballs_reuses_known_members(tmp_path: Path):
+    write_tarball(tmp_path / 'pkg.tar.xz', 'tex/pkg/a.sty', 'tex/pkg/b.sty')
+    write_tarball(tmp_path / 'pkg.doc.tar.xz', 'doc/pkg/README')
+    known: list[TarballMember] = members('doc/pkg/README.md')
+    tarballs: dict[str, list[TarballMember]] = asyncio.run(list_tarballs(tmp_path, {'pkg.doc.tar.xz': known}))
+    assert [member.path for member in tarballs['pkg.tar.xz']] == ['tex/pkg/a.sty', 'tex/pkg/b.sty']
+    assert tarballs['pkg.doc.tar.xz'] == known
+
+
+def test_list_tarballs_raises_on_corrupted_tarball(tmp_path: Path):
+    write_tarball(tmp_path / 'pkg.tar.xz', 'tex/pkg/a.sty')
+    (tmp_path / 'pkg.source.tar.xz').write_bytes(b'not xz')
+    with pytest.raises(tarfile.TarError):
+        asyncio.run(list_tarballs(tmp_path))
@@ -0,0 +1,56 @@
+import io
+import logging
+import threading
+
+import pytest
+
+from src.utils import rpmvercmp, handle_bool_input, ConsoleHandler
+
+
+@pytest.mark.parametrize('a, b, expected', [
+    ('1.0', '1.0', 0),
+    ('1.0', '1.0.1', -1),
+    ('1.10', '1.9', 1),
+    ('1.010', '1.10', 0),
+    ('2.0', '2a', 1),
+    ('1.0a', '1.0b', -1),
+    ('1a', '1.a', 0),
+    ('1.0~rc1', '1.0', -1),
+    ('1.0~rc1', '1.0~rc2', -1),
+    ('1.0', '1.0^1', -1),
+    ('1.0^1', '1.0.1', -1),
+    ('20200101', '20191231', 1),
+    ('3.2b', '3.2', 1)
+])
+def test_rpmvercmp(a: str, b: str, expected: int):
+    assert rpmvercmp(a, b) == expected
+    assert rpmvercmp(b, a) == -expected
+
+
+def test_log_records_wait_for_pending_prompt(monkeypatch: pytest.MonkeyPatch):
+    output: io.StringIO = io.StringIO()
+    logger: logging.Logger = logging.getLogger('test_console_lock')
+    logger.addHandler(ConsoleHandler(output))
+    logger.propagate = False
+    asked: threading.Event = threading.Event()
+    answered: threading.Event = threading.Event()
+
+    def fake_input(text: str) -> str:
+        output.write(text)
+        asked.set()
+        answered.wait(5)
+        output.write('y\n')
+        return 'y'
+
+    monkeypatch.setattr('builtins.input', fake_input)
+    prompt: threading.Thread = threading.Thread(target=handle_bool_input, args=("Proceed y/n?",))
+    prompt.start()
+    asked.wait(5)
+    stage: threading.Thread = threading.Thread(target=logger.warning, args=("stage output",))
+    stage.start()
+    stage.join(0.1)
+    assert output.getvalue() == "Proceed y/n?"
+    answered.set()
+    prompt.join(5)
+    stage.join(5)
+    assert output.getvalue() == "Proceed y/n?y\nstage output\n"
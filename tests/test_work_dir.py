@@ -0,0 +1,62 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from src.services.documents import TextDocument
+from src.services.tarball_cache import link_or_copy
+from src.services.work_dir import FileLock, hold_lock
+
+
+def test_cancelled_wait_does_not_take_the_lock(tmp_path: Path):
+    holder: FileLock = FileLock(tmp_path / 'test.lock')
+    assert holder.acquire(blocking=False)
+
+    async def wait_and_cancel() -> None:
+        async def wait() -> None:
+            async with hold_lock(FileLock(tmp_path / 'test.lock')):
+                pass
+        task: asyncio.Task = asyncio.create_task(wait())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        holder.release()
+        await asyncio.sleep(0.2)
+
+    asyncio.run(wait_and_cancel())
+    other: FileLock = FileLock(tmp_path / 'test.lock')
+    assert other.acquire(blocking=False)
+    other.release()
+
+
+def test_hold_lock_waits_for_release(tmp_path: Path):
+    holder: FileLock = FileLock(tmp_path / 'test.lock')
+    assert holder.acquire(blocking=False)
+
+    async def wait() -> bool:
+        asyncio.get_running_loop().call_later(0.05, holder.release)
+        async with hold_lock(FileLock(tmp_path / 'test.lock')):
+            return FileLock(tmp_path / 'test.lock').acquire(blocking=False)
+
+    assert asyncio.run(wait()) is False
+
+
+def test_link_or_copy_from_concurrent_threads(tmp_path: Path):
+    source: Path = tmp_path / 'source.tar.xz'
+    source.write_bytes(b'content' * 1000)
+    destination: Path = tmp_path / 'data' / 'pkg.tar.xz'
+    destination.parent.mkdir()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: link_or_copy(source, destination), range(32)))
+    assert destination.read_bytes() == source.read_bytes()
+    assert [path.name for path in destination.parent.iterdir()] == ['pkg.tar.xz']
+
+
+def test_saved_document_keeps_permissions(tmp_path: Path):
+    path: Path = tmp_path / 'build.sh'
+    path.write_bytes(b'echo 1\r\n')
+    path.chmod(0o755)
+    TextDocument.load(path).save()
+    assert path.read_bytes() == b'echo 1\n'
+    assert path.stat().st_mode & 0o777 == 0o755
+    assert [item.name for item in tmp_path.iterdir()] == ['build.sh']